@@ -10,26 +10,365 @@ from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import json
 import os
+import threading
+import time
+import tracemalloc
+from functools import partial
+
+from analysis_events import (ConsoleEventSink, LoggingEventSink, CompositeEventSink,
+                             ErrorsOnlyEventSink, NestedEventSink,
+                             TkProgressSink)
+from local_stats import LocalStatistics
+from sharpness import SharpnessEngine
+from reference_metrics import ReferenceComparator
+from noise_model import estimate_noise, RunningStatistics, fit_conversion_gain
+from spectrum import default_spectrum_service, model_band_power, aperture_mtf
+from results_store import save_npz, results_format, ArtifactStore, LARGE_ARRAYS
+from results_db import ResultsDatabase, file_hash, array_hash
+from result_cache import ResultCache
+
+
+# Поддерживаемые разрядности АЦП для целочисленных данных
+SUPPORTED_BIT_DEPTHS = (8, 10, 12, 14, 16)
+
+# Политики точности вычислений: (вещественный тип, глубина OpenCV)
+PRECISION_POLICIES = {
+    'float32': (np.float32, cv2.CV_32F),
+    'float64': (np.float64, cv2.CV_64F)
+}
+
+# Допустимое относительное расхождение метрик float32 и float64
+PRECISION_TOLERANCE = 1e-3
+
+# Версия алгоритмов анализа: входит в ключ кэша результатов, меняется при изменении метрик
+ANALYZER_VERSION = '2.4'
+
+# Наименьшая сторона верхнего уровня пирамиды уменьшенных копий
+PYRAMID_MIN_SIDE = 32
+
+# Разделы результатов режимов областей, каналов и тест-таблицы (не анализа всего кадра)
+MODE_SECTIONS = ('rois', 'channels', 'chromatic_aberration', 'chart')
+
+# Индексы каналов в BGR-изображении OpenCV
+COLOR_CHANNELS = {'R': 2, 'G': 1, 'B': 0}
+
+# Плоскости мозаики Байера: имя -> (строка, столбец) в ячейке 2x2
+BAYER_PATTERNS = {
+    'RGGB': {'R': (0, 0), 'Gr': (0, 1), 'Gb': (1, 0), 'B': (1, 1)},
+    'BGGR': {'B': (0, 0), 'Gb': (0, 1), 'Gr': (1, 0), 'R': (1, 1)},
+    'GRBG': {'Gr': (0, 0), 'R': (0, 1), 'B': (1, 0), 'Gb': (1, 1)},
+    'GBRG': {'Gb': (0, 0), 'B': (0, 1), 'R': (1, 0), 'Gr': (1, 1)},
+}
+
+
+class AnalysisCancelled(Exception):
+    """Анализ отменен между этапами"""
 
 
 class ImageQualityAnalyzer:
-    def __init__(self):
+    def __init__(self, bit_depth=None, precision='float32', spectrum_service=None, events=None):
         self.image = None
         self.image_gray = None
+        # Путь к файлу изображения (None для изображений из памяти)
+        self.image_path = None
         self.results = {}
+        # Разрядность данных (None - определяется по изображению)
+        self.bit_depth = bit_depth
+        # Сервис спектров общий для всех этапов (и анализаторов), кэширует планы по размеру
+        self.spectrum_service = spectrum_service or default_spectrum_service
+        self._spectrum = None
+        self._local_stats = None
+        self._pyramids = {}
+        self._gradients = None
+        # Маска пикселей области (ROI) внутри image_gray, None - все пиксели
+        self.roi_mask = None
+        self._reference = None
+        # Обработчики завершения этапов: callback(имя_этапа, замеры)
+        self.stage_hooks = []
+        # Приемник событий хода анализа (по умолчанию - logging: ошибки метрик не теряются)
+        self.events = events or LoggingEventSink()
+        self.set_precision(precision)
+
+    def set_precision(self, precision):
+        """Выбор точности вычислений: 'float32' (по умолчанию) или 'float64'"""
+        if precision not in PRECISION_POLICIES:
+            raise ValueError(f"Неизвестная точность: {precision}")
+        self.precision = precision
+        self.float_dtype, self.cv_depth = PRECISION_POLICIES[precision]
+        # Метрики резкости и карты фокуса по общим градиентам (в рабочей точности)
+        self.sharpness_engine = SharpnessEngine(depth=self.cv_depth)
+        self._spectrum = None
+        self._local_stats = None
+        self._gradients = None
+
+    def get_spectrum(self):
+        """Полуспектр (rfft2) текущего изображения и его план, вычисляется один раз"""
+        if self._spectrum is None:
+            self._spectrum = self.spectrum_service.rfft2(self.image_gray, self.float_dtype)
+        return self._spectrum
+
+    def get_local_stats(self):
+        """Локальные статистики текущего изображения (общие интегральные таблицы)"""
+        if self._local_stats is None:
+            self._local_stats = LocalStatistics(self.image_gray, self.float_dtype)
+        return self._local_stats
+
+    def get_gradients(self):
+        """Производные Собеля по x, y и лапласиан в рабочей точности, вычисляются один раз"""
+        if self._gradients is None:
+            self._gradients = (cv2.Sobel(self.image_gray, self.cv_depth, 1, 0, ksize=3),
+                               cv2.Sobel(self.image_gray, self.cv_depth, 0, 1, ksize=3),
+                               cv2.Laplacian(self.image_gray, self.cv_depth))
+        return self._gradients
+
+    def _masked(self, values):
+        """Значения карты внутри маски ROI (без маски - карта целиком)"""
+        return values if self.roi_mask is None else values[self.roi_mask]
+
+    def get_pyramid(self, gray=False):
+        """Пирамида уменьшенных в 2, 4, ... раз копий (cv2.pyrDown), строится один раз.
+
+        Уровень 0 - исходное изображение; gray=True - пирамида полутонового изображения.
+        """
+        if gray not in self._pyramids:
+            levels = [self.image_gray if gray else self.image]
+            while min(levels[-1].shape[:2]) >= 2 * PYRAMID_MIN_SIDE:
+                levels.append(cv2.pyrDown(levels[-1]))
+            self._pyramids[gray] = levels
+        return self._pyramids[gray]
+
+    def preview(self, max_size=400):
+        """8-битная RGB (или полутоновая) миниатюра не больше max_size по большей стороне"""
+        levels = self.get_pyramid()
+        # Наименьший уровень, еще не меньший max_size: доуменьшение не более чем в 2 раза
+        image = next((level for level in reversed(levels) if max(level.shape[:2]) >= max_size), levels[0])
+        height, width = image.shape[:2]
+        scale = min(max_size / width, max_size / height, 1.0)
+        if scale < 1.0:
+            image = cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+        if image.dtype != np.uint8:
+            # 10-16-битные данные приводятся к 8 битам по разрядности
+            image = cv2.convertScaleAbs(image, alpha=255.0 / (2 ** self.get_bit_depth() - 1))
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB if image.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+        return image
+
+    def quick_look(self, max_side=512, noise_strips=8, strip_rows=64, max_cols=2048):
+        """Быстрая приближенная оценка резкости, контраста и шума.
+
+        Резкость и контраст считаются на уровне пирамиды с большей стороной не больше
+        max_side (значения резкости относятся к этому масштабу). Шум оценивается в
+        полном разрешении по noise_strips полосам из strip_rows строк.
+        """
+        start = time.perf_counter()
+        levels = self.get_pyramid(gray=True)
+        index = next((i for i, level in enumerate(levels) if max(level.shape) <= max_side), len(levels) - 1)
+        level = levels[index]
+
+        tenengrad = float(self.sharpness_engine.score(level, 'tenengrad'))
+        laplacian_variance = float(self.sharpness_engine.score(level, 'laplacian_variance'))
+
+        min_intensity, max_intensity = int(np.min(level)), int(np.max(level))
+        michelson = (max_intensity - min_intensity) / (max_intensity + min_intensity) \
+            if max_intensity + min_intensity > 0 else 0.0
+
+        # Полосы полного разрешения, кратные размеру блока (блоки не пересекают стыки)
+        height, width = self.image_gray.shape
+        strip_rows = max(strip_rows // 8 * 8, 8)
+        col0 = max((width - max_cols) // 2, 0)
+        if height <= noise_strips * strip_rows:
+            sample = self.image_gray[:, col0:col0 + max_cols]
+        else:
+            starts = np.linspace(0, height - strip_rows, noise_strips).astype(int)
+            sample = np.concatenate([self.image_gray[row:row + strip_rows, col0:col0 + max_cols]
+                                     for row in starts])
+        estimate = estimate_noise(sample, 2 ** self.get_bit_depth(), block_size=8, dtype=self.float_dtype)
+        noise_variance = estimate['noise_variance']
+        snr = 10 * np.log10(estimate['signal_power'] / noise_variance) if noise_variance > 0 else 999.0
+
+        return {
+            'level': index,
+            'scale': 2 ** index,
+            'level_shape': list(level.shape),
+            'tenengrad': tenengrad,
+            'laplacian_variance': laplacian_variance,
+            'michelson_contrast': float(michelson),
+            'rms_contrast': float(np.std(level, dtype=self.float_dtype)),
+            'noise_std': float(np.sqrt(noise_variance)),
+            'snr_db': float(snr),
+            'wall_s': time.perf_counter() - start
+        }
 
     def load_image(self, image_path):
         """Загрузка изображения"""
         try:
-            self.image = cv2.imread(image_path)
-            if self.image is None:
+            # Сохраняем исходную разрядность (16-битные TIFF/PNG с 10-16-битных сенсоров)
+            image = cv2.imread(image_path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+            if image is None:
                 raise ValueError("Не удалось загрузить изображение")
-            self.image_gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+            self._set_image(image)
+            self.image_path = image_path
             return True
         except Exception as e:
-            print(f"Ошибка загрузки изображения: {e}")
+            self.events.error("Ошибка загрузки изображения", e)
             return False
 
+    def load(self, source):
+        """Загрузка из пути, массива, байтов закодированного файла или memoryview"""
+        if isinstance(source, (str, os.PathLike)):
+            return self.load_image(os.fspath(source))
+        if isinstance(source, np.ndarray):
+            return self.load_array(source)
+        return self.load_bytes(source)
+
+    def load_bytes(self, data):
+        """Загрузка закодированного изображения (PNG, TIFF, JPEG...) из bytes/bytearray/memoryview"""
+        try:
+            # frombuffer не копирует данные буфера
+            buffer = np.frombuffer(data, dtype=np.uint8)
+            image = cv2.imdecode(buffer, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+            if image is None:
+                raise ValueError("Не удалось декодировать изображение")
+            self._set_image(image)
+            self.image_path = None
+            return True
+        except Exception as e:
+            self.events.error("Ошибка загрузки изображения", e)
+            return False
+
+    def load_buffer(self, buffer, shape, dtype=np.uint8):
+        """Загрузка несжатого кадра из буфера (memoryview, bytes, mmap) без копирования.
+
+        shape - (высота, ширина) или (высота, ширина, каналы), dtype - тип пикселей.
+        Буфер не должен изменяться до завершения анализа.
+        """
+        try:
+            image = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+        except Exception as e:
+            self.events.error("Ошибка загрузки изображения", e)
+            return False
+        return self.load_array(image)
+
+    def load_array(self, image):
+        """Загрузка уже декодированного изображения (массив BGR или полутоновый) без диска.
+
+        Массив не копируется (принимаются и объекты с протоколом буфера).
+        """
+        try:
+            image = np.asarray(image)
+            if image.ndim not in (2, 3) or image.size == 0:
+                raise ValueError(f"Неподдерживаемая форма массива: {image.shape}")
+            self._set_image(image)
+            self.image_path = None
+            return True
+        except Exception as e:
+            self.events.error("Ошибка загрузки изображения", e)
+            return False
+
+    def _set_image(self, image):
+        """Установка текущего изображения и сброс кэшей промежуточных результатов"""
+        self.image = image
+        if image.ndim == 2:
+            self.image_gray = image
+        else:
+            self.image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self._spectrum = None
+        self._local_stats = None
+        self._pyramids = {}
+        self._gradients = None
+        self.roi_mask = None
+
+    def get_bit_depth(self):
+        """Разрядность данных: заданная явно или оценка по типу и максимуму"""
+        if self.bit_depth is not None:
+            return int(self.bit_depth)
+        peak = np.max(self.image_gray) if np.issubdtype(self.image_gray.dtype, np.integer) else 0
+        return self._bit_depth_for(self.image_gray.dtype, peak)
+
+    @staticmethod
+    def _bit_depth_for(dtype, peak):
+        """Разрядность по типу данных и максимальному коду"""
+        if dtype == np.uint8:
+            return 8
+        if np.issubdtype(dtype, np.integer):
+            used_bits = int(peak).bit_length()
+            for depth in SUPPORTED_BIT_DEPTHS:
+                if used_bits <= depth:
+                    return depth
+            return SUPPORTED_BIT_DEPTHS[-1]
+        return 8
+
+    def _code_histogram(self, bit_depth):
+        """Гистограмма кодов АЦП (2**bit_depth уровней)"""
+        levels = 2 ** bit_depth
+        if np.issubdtype(self.image_gray.dtype, np.integer):
+            # bincount по целым кодам значительно быстрее np.histogram
+            codes = self.image_gray.ravel()
+            hist = np.bincount(codes, minlength=levels)
+            if len(hist) > levels:
+                # Коды выше разрядности относим к верхнему уровню (насыщение)
+                hist[levels - 1] += np.sum(hist[levels:])
+                hist = hist[:levels]
+        else:
+            hist, _ = np.histogram(self.image_gray, bins=levels, range=(0, levels - 1))
+        return hist
+
+    @staticmethod
+    def _quantization_statistics(hist):
+        """Статистика квантования по гистограмме кодов"""
+        levels = len(hist)
+        total = np.sum(hist)
+
+        # Оценка квантования через энтропию
+        hist_positive = hist[hist > 0] / total if total > 0 else np.array([])
+        if len(hist_positive) > 0:
+            entropy = -np.sum(hist_positive * np.log2(hist_positive))
+        else:
+            entropy = 0.0
+
+        # Поиск пустых уровней (признак грубого квантования)
+        empty_levels = int(np.sum(hist == 0))
+
+        # Пропущенные коды АЦП - пустые уровни внутри занятого диапазона
+        used = np.nonzero(hist)[0]
+        if len(used) > 0:
+            occupied = hist[used[0]:used[-1] + 1]
+            missing_codes = int(np.sum(occupied == 0))
+            occupied_range = len(occupied)
+            # Изолированные пропуски (оба соседа заполнены) - характерный признак DNL АЦП
+            if occupied_range > 2:
+                inner = occupied[1:-1]
+                isolated_missing = int(np.sum((inner == 0) & (occupied[:-2] > 0) & (occupied[2:] > 0)))
+            else:
+                isolated_missing = 0
+        else:
+            missing_codes = 0
+            occupied_range = 0
+            isolated_missing = 0
+
+        return {
+            'levels': int(levels),
+            'entropy': float(entropy),
+            'empty_levels': empty_levels,
+            'empty_level_ratio': float(empty_levels / levels),
+            'missing_codes': missing_codes,
+            'missing_code_ratio': float(missing_codes / occupied_range) if occupied_range > 0 else 0.0,
+            'isolated_missing_codes': isolated_missing
+        }
+
+    @staticmethod
+    def _stuck_bits(hist, bit_depth):
+        """Поиск залипших разрядов АЦП (всегда 0 или всегда 1 во всех кодах)"""
+        used = np.nonzero(hist)[0]
+        if len(used) < 2:
+            return [], []
+        bits_or = int(np.bitwise_or.reduce(used))
+        bits_and = int(np.bitwise_and.reduce(used))
+        stuck_low = [bit for bit in range(bit_depth) if not (bits_or >> bit) & 1 and (1 << bit) <= used[-1]]
+        stuck_high = [bit for bit in range(bit_depth) if (bits_and >> bit) & 1]
+        return stuck_low, stuck_high
+
     def calculate_image_scale(self, physical_size_mm, sensor_size_mm):
         """Расчет масштаба изображения"""
         height, width = self.image_gray.shape
@@ -64,20 +403,15 @@ class ImageQualityAnalyzer:
                 edge_profile = self.image_gray[edge_line, :]
 
                 # Дифференцирование для получения функции рассеяния линии (LSF)
-                lsf = np.diff(edge_profile.astype(float))
+                lsf = np.diff(edge_profile.astype(self.float_dtype))
 
                 if len(lsf) > 0:
-                    # Преобразование Фурье для получения MTF (используем 1D FFT)
-                    mtf = np.abs(np.fft.fft(lsf))
-                    mtf = mtf / np.max(mtf) if np.max(mtf) > 0 else mtf  # Нормализация
-
-                    # Частоты
-                    frequencies = np.fft.fftfreq(len(mtf))
-
-                    # Берем только положительные частоты
-                    positive_freq_idx = frequencies >= 0
-                    freq_positive = frequencies[positive_freq_idx]
-                    mtf_positive = mtf[positive_freq_idx]
+                    # Преобразование Фурье для получения MTF (вещественный 1D FFT
+                    # сразу дает только положительные частоты)
+                    spectrum, freq_positive = self.spectrum_service.rfft(lsf, self.float_dtype)
+                    mtf_positive = np.abs(spectrum)
+                    if np.max(mtf_positive) > 0:
+                        mtf_positive = mtf_positive / np.max(mtf_positive)  # Нормализация
 
                     self.results['mtf'] = {
                         'frequencies': freq_positive,
@@ -102,7 +436,7 @@ class ImageQualityAnalyzer:
                     'mtf_10': None
                 }
         except Exception as e:
-            print(f"Ошибка в расчете MTF: {e}")
+            self.events.error("Ошибка в расчете MTF", e)
             # Создаем базовую MTF в случае ошибки
             self.results['mtf'] = {
                 'frequencies': np.array([0]),
@@ -124,25 +458,16 @@ class ImageQualityAnalyzer:
             return None
 
     def calculate_sharpness(self):
-        """Расчет резкости изображения"""
-        # Метод 1: Градиентная резкость (Tenengrad)
-        grad_x = cv2.Sobel(self.image_gray, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(self.image_gray, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(grad_x ** 2 + grad_y ** 2)
-        tenengrad = np.mean(gradient_magnitude ** 2)
-
-        # Метод 2: Лапласиан вариация
-        laplacian = cv2.Laplacian(self.image_gray, cv2.CV_64F)
-        laplacian_variance = np.var(laplacian)
-
-        # Метод 3: Нормализованная вариация
-        normalized_variance = np.var(self.image_gray) / np.mean(self.image_gray)
+        """Расчет резкости изображения.
 
-        self.results['sharpness'] = {
-            'tenengrad': tenengrad,
-            'laplacian_variance': laplacian_variance,
-            'normalized_variance': normalized_variance
-        }
+        Tenengrad, Бреннер, энергия и вариация лапласиана, нормализованная вариация,
+        метрики гистограммы градиентов и карты фокуса по плиткам - из общих
+        градиентов (get_gradients), см. SharpnessEngine.measure. Гистограмма и
+        карты фокуса входят в LARGE_ARRAYS (только в ArtifactStore).
+        """
+        max_value = 2 ** self.get_bit_depth() - 1 if np.issubdtype(self.image_gray.dtype, np.integer) else None
+        self.results['sharpness'] = self.sharpness_engine.measure(
+            self.image_gray, self.get_gradients(), mask=self.roi_mask, max_value=max_value)
 
         return self.results['sharpness']
 
@@ -156,20 +481,8 @@ class ImageQualityAnalyzer:
             nyquist_freq_y = height / 2
 
             # Эффективная разрешающая способность через анализ текстуры
-            # Используем локальную стандартную девиацию как меру детализации
-            try:
-                # Попробуем использовать rank.variance если доступен
-                from skimage.filters import rank
-                disk_element = np.ones((5, 5), dtype=np.uint8)
-                texture_map = rank.variance(self.image_gray, disk_element)
-                effective_resolution = np.mean(texture_map)
-            except (ImportError, AttributeError):
-                # Альтернативный метод через локальное стандартное отклонение
-                from scipy import ndimage
-                kernel = np.ones((5, 5)) / 25
-                local_mean = ndimage.convolve(self.image_gray.astype(float), kernel)
-                local_variance = ndimage.convolve((self.image_gray.astype(float) - local_mean) ** 2, kernel)
-                effective_resolution = np.mean(np.sqrt(local_variance))
+            # Используем локальную стандартную девиацию (окно 5x5) как меру детализации
+            effective_resolution = np.mean(self._masked(self.get_local_stats().std(5)))
 
             # Разрешение в пикселях на миллиметр (если доступен масштаб)
             resolution_info = {
@@ -188,7 +501,7 @@ class ImageQualityAnalyzer:
             self.results['resolution'] = resolution_info
 
         except Exception as e:
-            print(f"Ошибка в расчете разрешения: {e}")
+            self.events.error("Ошибка в расчете разрешения", e)
             # Создаем базовую информацию о разрешении
             height, width = self.image_gray.shape
             self.results['resolution'] = {
@@ -204,80 +517,149 @@ class ImageQualityAnalyzer:
     def analyze_discretization_artifacts(self):
         """Анализ искажений от дискретизации"""
         try:
-            # Алиасинг - поиск артефактов в частотной области
-            fft_image = np.fft.fft2(self.image_gray)
-            fft_shifted = np.fft.fftshift(fft_image)
-            magnitude_spectrum = np.log(np.abs(fft_shifted) + 1)
-
-            # Оценка алиасинга через анализ высокочастотных компонент
-            height, width = magnitude_spectrum.shape
-            center_y, center_x = height // 2, width // 2
-
-            # Анализ углов спектра (где обычно проявляется алиасинг)
-            quarter_h, quarter_w = height // 4, width // 4
-
-            if quarter_h > 0 and quarter_w > 0:
-                corner_regions = [
-                    magnitude_spectrum[:quarter_h, :quarter_w],  # Верхний левый
-                    magnitude_spectrum[:quarter_h, -quarter_w:],  # Верхний правый
-                    magnitude_spectrum[-quarter_h:, :quarter_w],  # Нижний левый
-                    magnitude_spectrum[-quarter_h:, -quarter_w:]  # Нижний правый
-                ]
-
-                aliasing_measure = np.mean([np.mean(region) for region in corner_regions if region.size > 0])
-            else:
-                aliasing_measure = 0.0
-
-            # Квантование - анализ гистограммы
-            hist, bins = np.histogram(self.image_gray, bins=256, range=(0, 255))
-
-            # Оценка квантования через энтропию
-            hist_normalized = hist / np.sum(hist)
-            hist_positive = hist_normalized[hist_normalized > 0]
-
-            if len(hist_positive) > 0:
-                entropy = -np.sum(hist_positive * np.log2(hist_positive))
-            else:
-                entropy = 0.0
-
-            # Поиск пустых уровней (признак грубого квантования)
-            empty_levels = np.sum(hist == 0)
-            quantization_quality = 1 - (empty_levels / 256)
+            # Алиасинг - поиск артефактов в частотной области.
+            # Вещественный БПФ: полуспектр, углы сдвинутого спектра берутся из него напрямую
+            spectrum, plan = self.get_spectrum()
+            aliasing_measure = self.spectrum_service.corner_aliasing(spectrum, plan)
+            magnitude_spectrum = self.spectrum_service.display_spectrum(spectrum)
+
+            # Квантование - анализ гистограммы кодов с учетом разрядности
+            bit_depth = self.get_bit_depth()
+            hist = self._code_histogram(bit_depth)
+            quantization = self._quantization_statistics(hist)
+            quantization_quality = 1 - quantization['empty_level_ratio']
+            stuck_low, stuck_high = self._stuck_bits(hist, bit_depth)
+
+            # Те же показатели при меньших разрядностях (объединение соседних кодов)
+            by_bit_depth = {}
+            for depth in SUPPORTED_BIT_DEPTHS:
+                if depth > bit_depth:
+                    break
+                reduced = hist.reshape(2 ** depth, -1).sum(axis=1)
+                by_bit_depth[str(depth)] = self._quantization_statistics(reduced)
 
             self.results['discretization_artifacts'] = {
                 'aliasing_measure': float(aliasing_measure),
-                'entropy': float(entropy),
-                'empty_levels': int(empty_levels),
+                'bit_depth': int(bit_depth),
+                'levels': quantization['levels'],
+                'entropy': quantization['entropy'],
+                'empty_levels': quantization['empty_levels'],
+                'empty_level_ratio': quantization['empty_level_ratio'],
                 'quantization_quality': float(quantization_quality),
+                'missing_codes': quantization['missing_codes'],
+                'missing_code_ratio': quantization['missing_code_ratio'],
+                'isolated_missing_codes': quantization['isolated_missing_codes'],
+                'stuck_bits_low': stuck_low,
+                'stuck_bits_high': stuck_high,
+                'by_bit_depth': by_bit_depth,
                 'magnitude_spectrum': magnitude_spectrum
             }
 
         except Exception as e:
-            print(f"Ошибка в анализе артефактов дискретизации: {e}")
+            self.events.error("Ошибка в анализе артефактов дискретизации", e)
             # Создаем базовые значения в случае ошибки
             self.results['discretization_artifacts'] = {
                 'aliasing_measure': 0.0,
+                'bit_depth': 8,
+                'levels': 256,
                 'entropy': 0.0,
                 'empty_levels': 0,
+                'empty_level_ratio': 0.0,
                 'quantization_quality': 1.0,
+                'missing_codes': 0,
+                'missing_code_ratio': 0.0,
+                'isolated_missing_codes': 0,
+                'stuck_bits_low': [],
+                'stuck_bits_high': [],
+                'by_bit_depth': {},
                 'magnitude_spectrum': np.zeros((10, 10))
             }
 
         return self.results['discretization_artifacts']
 
-    def calculate_noise_parameters(self):
-        """Расчет параметров шума"""
+    def calculate_power_spectrum(self, l_ap=None, l_sh=None, num_radial_bins=32, num_angular_bins=8):
+        """Радиально усредненный спектр мощности и индекс алиасинга относительно Найквиста"""
         try:
-            # Оценка шума через медианную фильтрацию
-            median_filtered = cv2.medianBlur(self.image_gray, 5)
-            noise = self.image_gray.astype(float) - median_filtered.astype(float)
+            spectrum, plan = self.get_spectrum()
+            ps = self.spectrum_service.radial_power_spectrum(spectrum, plan, num_radial_bins, num_angular_bins)
+
+            nu = ps['radial_frequency']
+            radial_power = ps['radial_power']
+            in_band_sum = np.sum(ps['radial_power_sum'])
+
+            # Индекс алиасинга: доля мощности в верхней половине полосы (0.5..1 Найквиста)
+            upper_band = nu >= 0.5
+            aliasing_index = np.sum(ps['radial_power_sum'][upper_band]) / in_band_sum if in_band_sum > 0 else 0.0
+
+            # Отношение плотности мощности у Найквиста (0.75..1) к низким частотам (0..0.25)
+            near_nyquist = nu >= 0.75
+            low_band = nu <= 0.25
+            low_power = np.mean(radial_power[low_band])
+            nyquist_power_ratio = np.mean(radial_power[near_nyquist]) / low_power if low_power > 0 else 0.0
+
+            # Анизотропия: разброс мощности по направлениям в верхней половине полосы
+            directional = np.mean(ps['angular_power'][upper_band], axis=0)
+            anisotropy = np.std(directional) / np.mean(directional) if np.mean(directional) > 0 else 0.0
+
+            power_spectrum = {
+                'radial_frequency': nu,
+                'radial_power': radial_power,
+                'angular_power': ps['angular_power'],
+                'angles': ps['angles'],
+                'aliasing_index': float(aliasing_index),
+                'nyquist_power_ratio': float(nyquist_power_ratio),
+                'corner_power_fraction': float(ps['corner_power_sum'] / (in_band_sum + ps['corner_power_sum']))
+                if in_band_sum > 0 else 0.0,
+                'anisotropy': float(anisotropy)
+            }
+
+            # Сравнение с моделью апертуры фотодиода (l_ap, l_sh как в моделях освещенности)
+            if l_ap is not None and l_sh is not None:
+                model_power = model_band_power(nu, l_ap, l_sh)
+                model_ratio = np.mean(model_power[near_nyquist]) / np.mean(model_power[low_band])
+                power_spectrum['model'] = {
+                    'l_ap': float(l_ap),
+                    'l_sh': float(l_sh),
+                    'fill_factor': float(l_ap / l_sh),
+                    'mtf_at_nyquist': float(aperture_mtf(1.0, l_ap, l_sh)),
+                    'nyquist_power_ratio': float(model_ratio),
+                    'relative_aliasing': float(nyquist_power_ratio / model_ratio) if model_ratio > 0 else 0.0
+                }
+
+            self.results['power_spectrum'] = power_spectrum
+
+        except Exception as e:
+            self.events.error("Ошибка в расчете спектра мощности", e)
+            self.results['power_spectrum'] = {
+                'radial_frequency': np.array([0]),
+                'radial_power': np.array([0.0]),
+                'aliasing_index': 0.0,
+                'nyquist_power_ratio': 0.0,
+                'corner_power_fraction': 0.0,
+                'anisotropy': 0.0
+            }
 
-            noise_std = np.std(noise)
-            noise_mean = np.mean(noise)
+        return self.results['power_spectrum']
+
+    def calculate_noise_parameters(self, block_size=8, num_bins=16):
+        """Расчет параметров шума по плоским участкам изображения"""
+        try:
+            levels = 2 ** self.get_bit_depth()
+
+            # Шум оценивается только по плоским блокам (края и текстура не считаются шумом),
+            # изображение обрабатывается полосами - память ограничена размером полосы
+            estimate = estimate_noise(self.image_gray, levels, block_size=block_size,
+                                      num_bins=num_bins, dtype=self.float_dtype, mask=self.roi_mask)
+            noise_std = np.sqrt(estimate['noise_variance'])
+
+            # Карта шума для отображения - одно вещественное выделение памяти
+            median_filtered = cv2.medianBlur(self.image_gray, 5)
+            noise_image = cv2.subtract(self.image_gray, median_filtered, dtype=self.cv_depth)
+            noise_mean = np.mean(self._masked(noise_image))
 
             # Signal-to-Noise Ratio
-            signal_power = np.mean(self.image_gray.astype(float) ** 2)
-            noise_power = np.mean(noise ** 2)
+            signal_power = estimate['signal_power']
+            noise_power = estimate['noise_variance']
 
             if noise_power > 0:
                 snr = 10 * np.log10(signal_power / noise_power)
@@ -288,16 +670,20 @@ class ImageQualityAnalyzer:
                 'noise_std': float(noise_std),
                 'noise_mean': float(noise_mean),
                 'snr_db': float(snr) if not np.isinf(snr) else 999.0,
-                'noise_image': noise
+                'flat_fraction': estimate['flat_fraction'],
+                'noise_curve': estimate['curve'],
+                'noise_image': noise_image
             }
 
         except Exception as e:
-            print(f"Ошибка в расчете шума: {e}")
+            self.events.error("Ошибка в расчете шума", e)
             # Создаем базовые значения шума
             self.results['noise'] = {
                 'noise_std': 0.0,
                 'noise_mean': 0.0,
                 'snr_db': 999.0,
+                'flat_fraction': 0.0,
+                'noise_curve': {'intensity': np.array([]), 'noise_std': np.array([]), 'block_count': np.array([])},
                 'noise_image': np.zeros_like(self.image_gray)
             }
 
@@ -306,33 +692,22 @@ class ImageQualityAnalyzer:
     def calculate_contrast_parameters(self):
         """Расчет параметров контраста"""
         try:
-            # Michelson контраст
-            max_intensity = np.max(self.image_gray)
-            min_intensity = np.min(self.image_gray)
+            # Michelson контраст (в Python int, чтобы сумма не переполняла uint8)
+            gray = self._masked(self.image_gray)
+            max_intensity = int(np.max(gray))
+            min_intensity = int(np.min(gray))
             if (max_intensity + min_intensity) > 0:
                 michelson_contrast = (max_intensity - min_intensity) / (max_intensity + min_intensity)
             else:
                 michelson_contrast = 0.0
 
             # RMS контраст
-            mean_intensity = np.mean(self.image_gray)
-            rms_contrast = np.sqrt(np.mean((self.image_gray - mean_intensity) ** 2))
+            mean_intensity = np.mean(gray)
+            rms_contrast = np.std(gray, dtype=self.float_dtype)
 
-            # Локальный контраст - альтернативный метод
-            try:
-                # Попробуем использовать rank.enhance_contrast если доступен
-                from skimage.filters import rank
-                disk_element = np.ones((9, 9), dtype=np.uint8)
-                local_contrast = rank.enhance_contrast(self.image_gray, disk_element)
-                local_contrast_mean = np.mean(local_contrast)
-            except (ImportError, AttributeError):
-                # Альтернативный метод расчета локального контраста
-                from scipy import ndimage
-                # Локальный контраст через локальное стандартное отклонение
-                kernel = np.ones((9, 9)) / 81
-                local_mean = ndimage.convolve(self.image_gray.astype(float), kernel)
-                local_std = np.sqrt(ndimage.convolve((self.image_gray.astype(float) - local_mean) ** 2, kernel))
-                local_contrast_mean = np.mean(local_std)
+            # Локальный контраст - замена пикселя ближайшим экстремумом окна 9x9
+            local_contrast = self.get_local_stats().enhance_contrast(9)
+            local_contrast_mean = np.mean(self._masked(local_contrast))
 
             self.results['contrast'] = {
                 'michelson_contrast': float(michelson_contrast),
@@ -343,15 +718,16 @@ class ImageQualityAnalyzer:
             }
 
         except Exception as e:
-            print(f"Ошибка в расчете контраста: {e}")
+            self.events.error("Ошибка в расчете контраста", e)
             # Создаем базовые значения контраста
-            max_intensity = np.max(self.image_gray)
-            min_intensity = np.min(self.image_gray)
-            mean_intensity = np.mean(self.image_gray)
+            gray = self._masked(self.image_gray)
+            max_intensity = np.max(gray)
+            min_intensity = np.min(gray)
+            mean_intensity = np.mean(gray)
 
             self.results['contrast'] = {
                 'michelson_contrast': 0.0,
-                'rms_contrast': float(np.std(self.image_gray)),
+                'rms_contrast': float(np.std(gray)),
                 'local_contrast_mean': 0.0,
                 'intensity_range': (int(min_intensity), int(max_intensity)),
                 'mean_intensity': float(mean_intensity)
@@ -359,42 +735,429 @@ class ImageQualityAnalyzer:
 
         return self.results['contrast']
 
-    def perform_full_analysis(self, physical_size_mm=None, sensor_size_mm=None):
-        """Выполнение полного анализа изображения"""
+    def get_reference_comparator(self, reference):
+        """Сравниватель с эталоном (путь или массив), кэшируется для пакетной оценки.
+
+        Ключ кэша - содержимое эталона (хэш массива; для файла - путь, размер и
+        время изменения) и диапазон данных, поэтому измененный на месте буфер или
+        новый массив не получают старый сравниватель.
+        """
+        data_range = 2 ** self.get_bit_depth() - 1
+        if isinstance(reference, (str, os.PathLike)):
+            reference = os.fspath(reference)
+            stat = os.stat(reference)
+            key = (os.path.abspath(reference), stat.st_size, stat.st_mtime_ns, data_range)
+        else:
+            key = (array_hash(reference), data_range)
+        if self._reference is None or self._reference[0] != key:
+            if isinstance(reference, str):
+                reference_image = cv2.imread(reference, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_GRAYSCALE)
+                if reference_image is None:
+                    raise ValueError(f"Не удалось загрузить эталон: {reference}")
+            else:
+                reference_image = reference
+            self._reference = (key, ReferenceComparator(reference_image, data_range=data_range))
+        return self._reference[1]
+
+    def compare_with_reference(self, reference):
+        """Сравнение с эталоном (например, синтетическим идеальным кадром): PSNR, SSIM, MS-SSIM"""
         if self.image is None:
             raise ValueError("Изображение не загружено")
-
-        print("Выполняется анализ качества изображения...")
-
         try:
-            # Масштаб (если предоставлены размеры)
-            if physical_size_mm and sensor_size_mm:
-                print("- Расчет масштаба...")
-                self.calculate_image_scale(physical_size_mm, sensor_size_mm)
+            comparator = self.get_reference_comparator(reference)
+            scores = comparator.score(self.image_gray)
+            if np.isinf(scores['psnr_db']):
+                scores['psnr_db'] = 999.0
+            self.results['reference'] = scores
+        except Exception as e:
+            self.events.error("Ошибка сравнения с эталоном", e)
+            raise
+        return self.results['reference']
+
+    def add_stage_hook(self, callback):
+        """Подписка на завершение этапов анализа: callback(stage, timing)"""
+        self.stage_hooks.append(callback)
+
+    def remove_stage_hook(self, callback):
+        """Отписка обработчика этапов"""
+        if callback in self.stage_hooks:
+            self.stage_hooks.remove(callback)
+
+    def _analysis_stages(self, physical_size_mm, sensor_size_mm, l_ap, l_sh):
+        """Этапы полного анализа: (имя, описание, функция)"""
+        stages = []
+        # Масштаб (если предоставлены размеры)
+        if physical_size_mm and sensor_size_mm:
+            stages.append(('scale', "Расчет масштаба",
+                           lambda: self.calculate_image_scale(physical_size_mm, sensor_size_mm)))
+        # Основные параметры
+        stages += [
+            ('mtf', "Расчет MTF", self.calculate_spatial_frequency_response),
+            ('sharpness', "Расчет резкости", self.calculate_sharpness),
+            ('resolution', "Расчет разрешения", self.calculate_resolution),
+            ('discretization_artifacts', "Анализ артефактов дискретизации",
+             self.analyze_discretization_artifacts),
+            ('power_spectrum', "Расчет спектра мощности",
+             lambda: self.calculate_power_spectrum(l_ap=l_ap, l_sh=l_sh)),
+            ('noise', "Расчет параметров шума", self.calculate_noise_parameters),
+            ('contrast', "Расчет параметров контраста", self.calculate_contrast_parameters),
+        ]
+        return stages
+
+    def _run_stage(self, name, func, profile_memory, index=0, total=1, owns_tracer=True):
+        """Выполнение этапа с замером времени и (опционально) пика выделений памяти.
+
+        Пик сбрасывается, только если трассировку запустил сам анализ (owns_tracer);
+        иначе пик внешнего профилировщика сохраняется, а пик этапа точен, только
+        если этап превысил прежний пик (peak_exact=False - оценка снизу).
+        """
+        if profile_memory:
+            if owns_tracer:
+                tracemalloc.reset_peak()
+            start_memory, start_peak = tracemalloc.get_traced_memory()
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        func()
+        timing = {
+            'wall_s': time.perf_counter() - start_wall,
+            'cpu_s': time.process_time() - start_cpu,
+            'input_shape': list(self.image_gray.shape),
+            'input_dtype': str(self.image_gray.dtype)
+        }
 
-            # Основные параметры
-            print("- Расчет MTF...")
-            self.calculate_spatial_frequency_response()
+        if profile_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            exact = owns_tracer or peak > start_peak
+            timing['peak_bytes'] = int(max((peak if exact else current) - start_memory, 0))
+            if not owns_tracer:
+                timing['peak_exact'] = bool(exact)
+
+        self.results.setdefault('timings', {})[name] = timing
+        for hook in list(self.stage_hooks):
+            hook(name, timing)
+        self.events.stage_finished(name, index, total, timing)
+        return timing
+
+    @staticmethod
+    def _normalize_rois(rois, shape):
+        """Области {имя: (y0, y1, x0, x1, маска в пределах прямоугольника или None)}.
+
+        Область - прямоугольник (x, y, ширина, высота) или булева маска размера
+        изображения. Список областей получает имена roi_0, roi_1, ...
+        """
+        if not isinstance(rois, dict):
+            rois = {f"roi_{index}": roi for index, roi in enumerate(rois)}
+        height, width = shape
+        regions = {}
+        for name, roi in rois.items():
+            if isinstance(roi, np.ndarray) and roi.dtype == bool:
+                if roi.shape != shape:
+                    raise ValueError(f"Маска {name} размера {roi.shape} не совпадает с изображением {shape}")
+                rows = np.flatnonzero(roi.any(axis=1))
+                cols = np.flatnonzero(roi.any(axis=0))
+                if len(rows) == 0:
+                    raise ValueError(f"Маска {name} пуста")
+                y0, y1, x0, x1 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+                regions[name] = (y0, y1, x0, x1, roi[y0:y1, x0:x1])
+            else:
+                x, y, w, h = (int(value) for value in roi)
+                x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+                if x1 <= x0 or y1 <= y0:
+                    raise ValueError(f"Область {name} вне изображения")
+                regions[name] = (y0, y1, x0, x1, None)
+        return regions
+
+    def _sub_analyzer(self, image, image_gray):
+        """Анализатор части данных (области, канала) с общими настройками, без копирования"""
+        analyzer = ImageQualityAnalyzer(bit_depth=self.get_bit_depth(), precision=self.precision,
+                                        spectrum_service=self.spectrum_service)
+        analyzer.image = image
+        analyzer.image_gray = image_gray
+        analyzer.image_path = self.image_path
+        return analyzer
+
+    def _region_analyzer(self, y0, y1, x0, x1):
+        """Анализатор прямоугольной области: изображения - представления без копирования"""
+        return self._sub_analyzer(self.image[y0:y1, x0:x1], self.image_gray[y0:y1, x0:x1])
+
+    @staticmethod
+    def _drop_maps(results):
+        """Удаление карт (LARGE_ARRAYS) из результатов части изображения"""
+        for section in results.values():
+            if isinstance(section, dict):
+                for name in LARGE_ARRAYS:
+                    section.pop(name, None)
+        return results
+
+    def analyze_rois(self, rois, l_ap=None, l_sh=None, margin=8, max_union_ratio=4.0, cancel_event=None):
+        """Все метрики по областям интереса; результаты в results['rois'][имя].
+
+        Локальные статистики и градиенты вычисляются один раз в охватывающем
+        прямоугольнике всех областей (с запасом margin на окна фильтров), области
+        получают их срезы. Если области разнесены и охватывающий прямоугольник
+        больше их суммарной площади в max_union_ratio раз, промежуточные карты
+        считаются для каждой области с ее запасом. Метрики по маске считаются
+        только по пикселям маски; спектральные (MTF, спектр, алиасинг) - по ее
+        охватывающему прямоугольнику.
+        """
+        if self.image is None:
+            raise ValueError("Изображение не загружено")
+        regions = self._normalize_rois(rois, self.image_gray.shape)
+        height, width = self.image_gray.shape
 
-            print("- Расчет резкости...")
-            self.calculate_sharpness()
+        def padded(y0, y1, x0, x1):
+            return max(y0 - margin, 0), min(y1 + margin, height), max(x0 - margin, 0), min(x1 + margin, width)
+
+        boxes = {name: padded(*region[:4]) for name, region in regions.items()}
+        union_box = (min(box[0] for box in boxes.values()), max(box[1] for box in boxes.values()),
+                     min(box[2] for box in boxes.values()), max(box[3] for box in boxes.values()))
+        area = lambda box: (box[1] - box[0]) * (box[3] - box[2])
+        if area(union_box) <= max_union_ratio * sum(area(box) for box in boxes.values()):
+            boxes = {name: union_box for name in regions}
+
+        # Промежуточные карты по прямоугольникам (общий - один раз для всех областей)
+        shared = {}
+        for box in set(boxes.values()):
+            source = self._region_analyzer(*box)
+            shared[box] = (source.get_local_stats(), source.get_gradients())
+
+        self.events.analysis_started(len(regions))
+        self.results['rois'] = {}
+        for index, (name, (y0, y1, x0, x1, mask)) in enumerate(regions.items()):
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled(f"Анализ отменен перед областью «{name}»")
+            self.events.stage_started(f"roi:{name}", f"Анализ области {name}", index, len(regions))
+            start_wall = time.perf_counter()
+
+            by0, _, bx0, _ = boxes[name]
+            local_stats, gradients = shared[boxes[name]]
+            rows, cols = slice(y0 - by0, y1 - by0), slice(x0 - bx0, x1 - bx0)
+            region = self._region_analyzer(y0, y1, x0, x1)
+            region.roi_mask = mask
+            region._local_stats = local_stats.crop(rows, cols)
+            region._gradients = tuple(gradient[rows, cols] for gradient in gradients)
+            region.events = ErrorsOnlyEventSink(self.events, name)
+            region.perform_full_analysis(l_ap=l_ap, l_sh=l_sh)
+
+            # Попиксельные карты областей не сохраняются
+            self._drop_maps(region.results)
+            region.results['roi'] = {
+                'x': x0, 'y': y0, 'width': x1 - x0, 'height': y1 - y0,
+                'masked': mask is not None,
+                'pixels': int(np.count_nonzero(mask)) if mask is not None else (x1 - x0) * (y1 - y0)
+            }
+            self.results['rois'][name] = region.results
+            self.events.stage_finished(f"roi:{name}", index, len(regions),
+                                       {'wall_s': time.perf_counter() - start_wall})
 
-            print("- Расчет разрешения...")
-            self.calculate_resolution()
+        self.events.analysis_finished(self.results)
+        return self.results['rois']
 
-            print("- Анализ артефактов дискретизации...")
-            self.analyze_discretization_artifacts()
+    def channel_planes(self, mode='rgb', bayer_pattern='RGGB'):
+        """Плоскости каналов - представления исходного массива с шагом, без копирования.
 
-            print("- Расчет параметров шума...")
-            self.calculate_noise_parameters()
+        mode='rgb' - каналы R, G, B цветного изображения; mode='bayer' - четыре
+        плоскости мозаики Байера (R, Gr, Gb, B) одноканального RAW-кадра.
+        """
+        if self.image is None:
+            raise ValueError("Изображение не загружено")
+        if mode == 'rgb':
+            if self.image.ndim != 3 or self.image.shape[2] < 3:
+                raise ValueError("Поканальный анализ RGB требует цветного изображения")
+            return {name: self.image[:, :, index] for name, index in COLOR_CHANNELS.items()}
+        if mode == 'bayer':
+            if self.image.ndim != 2:
+                raise ValueError("Анализ плоскостей Байера требует одноканального RAW-кадра")
+            if bayer_pattern not in BAYER_PATTERNS:
+                raise ValueError(f"Неизвестная мозаика Байера: {bayer_pattern}")
+            return {name: self.image[row::2, col::2]
+                    for name, (row, col) in sorted(BAYER_PATTERNS[bayer_pattern].items(),
+                                                   key=lambda item: 'RGrGbB'.index(item[0]))}
+        raise ValueError(f"Неизвестный режим каналов: {mode}")
+
+    def _chromatic_aberration(self, planes, reference, scale=1.0, phases=None, tiles=4):
+        """Поперечная хроматическая аберрация каналов относительно опорного.
+
+        Сдвиги каналов в tiles x tiles фрагментах находятся фазовой корреляцией и
+        аппроксимируются моделью d = t + k * (p - центр): t - общий сдвиг
+        (рассовмещение), k - относительное увеличение канала. lateral_ca_px -
+        радиальное смещение в углу кадра; величины в пикселях исходного кадра (scale).
+        phases - положение плоскостей в ячейке мозаики (строка, столбец), их
+        взаимное смещение вычитается из общего сдвига.
+        """
+        ref = planes[reference]
+        height, width = ref.shape
+        tile_h, tile_w = height // tiles, width // tiles
+        if min(tile_h, tile_w) < 32:
+            return {}
+        window = cv2.createHanningWindow((tile_w, tile_h), cv2.CV_32F)
+        center = np.array([(width - 1) / 2, (height - 1) / 2])
+        corner_radius = float(np.hypot(*center))
+
+        tile_slices = [(slice(ty * tile_h, (ty + 1) * tile_h), slice(tx * tile_w, (tx + 1) * tile_w))
+                       for ty in range(tiles) for tx in range(tiles)]
+        ref_tiles = [np.asarray(ref[rows, cols], dtype=np.float32) for rows, cols in tile_slices]
+
+        aberration = {}
+        for name, plane in planes.items():
+            if name.startswith('G'):
+                continue
+            positions, shifts = [], []
+            for (rows, cols), ref_tile in zip(tile_slices, ref_tiles):
+                (dx, dy), response = cv2.phaseCorrelate(ref_tile, np.asarray(plane[rows, cols], dtype=np.float32),
+                                                        window)
+                # Плоские фрагменты без деталей не дают надежного сдвига
+                if response < 0.1:
+                    continue
+                positions.append((cols.start + tile_w / 2 - center[0], rows.start + tile_h / 2 - center[1]))
+                shifts.append((dx, dy))
+            if len(shifts) < 3:
+                aberration[name] = {'tiles': len(shifts)}
+                continue
+            positions, shifts = np.array(positions), np.array(shifts)
+            # Система для (tx, ty, k): dx = tx + k * px, dy = ty + k * py
+            design = np.zeros((2 * len(shifts), 3))
+            design[0::2, 0] = 1
+            design[1::2, 1] = 1
+            design[0::2, 2] = positions[:, 0]
+            design[1::2, 2] = positions[:, 1]
+            (shift_x, shift_y, magnification), *_ = np.linalg.lstsq(design, shifts.ravel(), rcond=None)
+            shift_x, shift_y = shift_x * scale, shift_y * scale
+            if phases is not None:
+                shift_x -= phases[reference][1] - phases[name][1]
+                shift_y -= phases[reference][0] - phases[name][0]
+            aberration[name] = {
+                'shift_x': float(shift_x),
+                'shift_y': float(shift_y),
+                'magnification': float(magnification),
+                'lateral_ca_px': float(magnification * corner_radius * scale),
+                'tiles': len(shifts)
+            }
+        aberration['reference'] = reference
+        return aberration
+
+    def analyze_channels(self, mode='rgb', bayer_pattern='RGGB', l_ap=None, l_sh=None, cancel_event=None):
+        """Все метрики по каналам; результаты в results['channels'][канал].
+
+        Каналы анализируются как отдельные полутоновые изображения (представления
+        с шагом без копирования). Дополнительно оценивается поперечная
+        хроматическая аберрация R и B относительно G (results['chromatic_aberration']).
+        """
+        planes = self.channel_planes(mode, bayer_pattern)
+        self.events.analysis_started(len(planes) + 1)
+        self.results['channels'] = {}
+        for index, (name, plane) in enumerate(planes.items()):
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled(f"Анализ отменен перед каналом {name}")
+            self.events.stage_started(f"channel:{name}", f"Анализ канала {name}", index, len(planes) + 1)
+            start_wall = time.perf_counter()
+            channel = self._sub_analyzer(plane, plane)
+            channel.events = ErrorsOnlyEventSink(self.events, name)
+            channel.perform_full_analysis(l_ap=l_ap, l_sh=l_sh)
+            self.results['channels'][name] = self._drop_maps(channel.results)
+            self.events.stage_finished(f"channel:{name}", index, len(planes) + 1,
+                                       {'wall_s': time.perf_counter() - start_wall})
+
+        self.events.stage_started('chromatic_aberration', "Хроматическая аберрация", len(planes), len(planes) + 1)
+        start_wall = time.perf_counter()
+        try:
+            if mode == 'rgb':
+                aberration = self._chromatic_aberration(planes, 'G')
+            else:
+                aberration = self._chromatic_aberration(planes, 'Gr', scale=2.0,
+                                                        phases=BAYER_PATTERNS[bayer_pattern])
+            self.results['chromatic_aberration'] = aberration
+        except Exception as e:
+            self.events.error("Ошибка оценки хроматической аберрации", e)
+            self.results['chromatic_aberration'] = {}
+        self.events.stage_finished('chromatic_aberration', len(planes), len(planes) + 1,
+                                   {'wall_s': time.perf_counter() - start_wall})
+        self.events.analysis_finished(self.results)
+        return self.results['channels']
+
+    def perform_full_analysis(self, physical_size_mm=None, sensor_size_mm=None, l_ap=None, l_sh=None,
+                              profile_memory=False, cancel_event=None, rois=None, full_frame=None,
+                              channels=None, bayer_pattern='RGGB'):
+        """Выполнение полного анализа изображения.
+
+        Время каждого этапа сохраняется в results['timings']; при profile_memory=True
+        дополнительно замеряется пик выделений памяти через tracemalloc. Если задан
+        cancel_event (threading.Event), он проверяется перед каждым этапом и при
+        установке анализ прерывается исключением AnalysisCancelled.
+
+        rois - области интереса (см. analyze_rois), channels - поканальный режим
+        'rgb' или 'bayer' (см. analyze_channels); с ними весь кадр анализируется
+        только при full_frame=True, а результаты прошлого анализа сбрасываются.
+        """
+        if self.image is None:
+            raise ValueError("Изображение не загружено")
 
-            print("- Расчет параметров контраста...")
-            self.calculate_contrast_parameters()
+        if channels is not None or rois is not None:
+            if channels is not None and rois is not None:
+                raise ValueError("Области интереса и поканальный режим не совмещаются")
+            # Разделы всего кадра от прошлого анализа не должны остаться рядом с разделами режима
+            self.results = {}
+            if channels is not None:
+                mode_stages = len(self.channel_planes(channels, bayer_pattern)) + 1
+                run_mode = partial(self.analyze_channels, channels, bayer_pattern, l_ap=l_ap, l_sh=l_sh,
+                                   cancel_event=cancel_event)
+            else:
+                mode_stages = len(self._normalize_rois(rois, self.image_gray.shape))
+                run_mode = partial(self.analyze_rois, rois, l_ap=l_ap, l_sh=l_sh, cancel_event=cancel_event)
+            if not full_frame:
+                run_mode()
+                return self.results
+
+            # Весь кадр и режим - один анализ: одна пара начала/конца на общее число этапов
+            frame_stages = len(self._analysis_stages(physical_size_mm, sensor_size_mm, l_ap, l_sh))
+            total = frame_stages + mode_stages
+            events = self.events
+            events.analysis_started(total)
+            try:
+                self.events = NestedEventSink(events, 0, total)
+                self.perform_full_analysis(physical_size_mm, sensor_size_mm, l_ap, l_sh,
+                                           profile_memory, cancel_event)
+                self.events = NestedEventSink(events, frame_stages, total)
+                run_mode()
+            finally:
+                self.events = events
+            events.analysis_finished(self.results)
+            return self.results
+
+        # Разделы режимов областей, каналов и тест-таблицы от прошлого анализа
+        for section in MODE_SECTIONS:
+            self.results.pop(section, None)
+
+        stages = self._analysis_stages(physical_size_mm, sensor_size_mm, l_ap, l_sh)
+        self.events.analysis_started(len(stages))
+
+        self.results['timings'] = {}
+        started_tracing = profile_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+        try:
+            for index, (name, description, func) in enumerate(stages):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise AnalysisCancelled(f"Анализ отменен перед этапом «{description}»")
+                self.events.stage_started(name, description, index, len(stages))
+                self._run_stage(name, func, profile_memory, index, len(stages), owns_tracer=started_tracing)
+
+            self.results['timings']['total'] = {
+                'wall_s': time.perf_counter() - start_wall,
+                'cpu_s': time.process_time() - start_cpu,
+                'input_shape': list(self.image_gray.shape),
+                'input_dtype': str(self.image_gray.dtype)
+            }
 
-            print("Анализ завершен!")
+            self.events.analysis_finished(self.results)
 
+        except AnalysisCancelled as e:
+            self.events.warning(str(e))
+            raise
         except Exception as e:
-            print(f"Ошибка во время анализа: {e}")
+            self.events.error("Ошибка во время анализа", e)
             # Добавляем хотя бы базовую информацию об изображении
             if 'resolution' not in self.results:
                 height, width = self.image_gray.shape
@@ -404,11 +1167,195 @@ class ImageQualityAnalyzer:
                     'total_pixels': width * height
                 }
             raise
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        return self.results
+
+    def analysis_config(self, physical_size_mm=None, sensor_size_mm=None, l_ap=None, l_sh=None,
+                        rois=None, full_frame=None, channels=None, bayer_pattern='RGGB'):
+        """Конфигурация анализа, от которой зависят результаты (для ключа кэша)"""
+        config = {
+            'version': ANALYZER_VERSION,
+            'bit_depth': self.bit_depth,
+            'precision': self.precision,
+            'physical_size_mm': physical_size_mm,
+            'sensor_size_mm': sensor_size_mm,
+            'l_ap': l_ap,
+            'l_sh': l_sh
+        }
+        if rois is not None:
+            # Маски описываются хэшем, прямоугольники - координатами
+            items = rois.items() if isinstance(rois, dict) else enumerate(rois)
+            config['rois'] = {str(name): array_hash(roi) if isinstance(roi, np.ndarray) else [int(v) for v in roi]
+                              for name, roi in items}
+            config['full_frame'] = bool(full_frame)
+        if channels is not None:
+            config['channels'] = channels
+            config['bayer_pattern'] = bayer_pattern if channels == 'bayer' else None
+            config['full_frame'] = bool(full_frame)
+        return config
+
+    def _cached_results(self, cache, content_hash, params):
+        """Результаты из кэша по хэшу содержимого и конфигурации или None"""
+        key = cache.make_key(content_hash, self.analysis_config(**params))
+        try:
+            results = cache.get(key)
+        except Exception as e:
+            self.events.error("Ошибка чтения кэша", e)
+            return key, None
+        return key, results
+
+    def _store_cached(self, cache, key):
+        try:
+            cache.put(key, self.results)
+        except Exception as e:
+            self.events.error("Ошибка записи в кэш", e)
+
+    def analyze_file(self, image_path, cache=None, **params):
+        """Анализ файла с кэшем результатов: при попадании изображение не декодируется.
+
+        params - параметры perform_full_analysis. Возвращает результаты или None,
+        если изображение не удалось загрузить.
+        """
+        key = None
+        if cache is not None:
+            key, results = self._cached_results(cache, cache.file_hash(image_path), params)
+            if results is not None:
+                self.image = self.image_gray = None
+                self.image_path = image_path
+                self.results = results
+                self.events.analysis_finished(results)
+                return results
+
+        if not self.load_image(image_path):
+            return None
+        self.results = {}
+        self.perform_full_analysis(**params)
+        if cache is not None:
+            self._store_cached(cache, key)
+        return self.results
 
+    def perform_cached_analysis(self, cache, cancel_event=None, **params):
+        """Полный анализ уже загруженного изображения с кэшем результатов"""
+        if self.image is None:
+            raise ValueError("Изображение не загружено")
+        if self.image_path is not None and os.path.isfile(self.image_path):
+            content_hash = cache.file_hash(self.image_path)
+        else:
+            content_hash = array_hash(self.image)
+        key, results = self._cached_results(cache, content_hash, params)
+        if results is not None:
+            self.results = results
+            self.events.analysis_finished(results)
+            return results
+
+        self.results = {}
+        self.perform_full_analysis(cancel_event=cancel_event, **params)
+        self._store_cached(cache, key)
         return self.results
 
-    def save_results(self, filename):
-        """Сохранение результатов в JSON файл"""
+    @staticmethod
+    def _scalar_metrics(results):
+        """Плоский словарь скалярных метрик вида 'раздел.параметр'"""
+        metrics = {}
+        for section, values in results.items():
+            if not isinstance(values, dict):
+                continue
+            for key, value in values.items():
+                if isinstance(value, (bool, np.bool_)) or value is None:
+                    continue
+                if isinstance(value, (int, float, np.integer, np.floating)):
+                    metrics[f"{section}.{key}"] = float(value)
+        return metrics
+
+    def validate_precision(self, tolerance=PRECISION_TOLERANCE, **analysis_kwargs):
+        """Сравнение метрик в float32 и float64 на загруженном изображении"""
+        if self.image is None:
+            raise ValueError("Изображение не загружено")
+
+        saved_results, saved_precision = self.results, self.precision
+        runs = {}
+        try:
+            for precision in ('float64', 'float32'):
+                self.results = {}
+                self.set_precision(precision)
+                results = self.perform_full_analysis(**analysis_kwargs)
+                runs[precision] = (self._scalar_metrics(results), results)
+        finally:
+            self.results = saved_results
+            self.set_precision(saved_precision)
+
+        reference, reference_results = runs['float64']
+        candidate, _ = runs['float32']
+
+        # Для MTF50/MTF10 допускаем сдвиг на один частотный отсчет
+        frequencies = reference_results.get('mtf', {}).get('frequencies', np.array([0]))
+        frequency_step = float(frequencies[1]) if len(frequencies) > 1 else 0.0
+
+        report = {}
+        for name, ref_value in reference.items():
+            if name not in candidate:
+                continue
+            value = candidate[name]
+            abs_delta = abs(value - ref_value)
+            rel_delta = abs_delta / abs(ref_value) if ref_value != 0 else abs_delta
+            if name in ('mtf.mtf_50', 'mtf.mtf_10'):
+                passed = abs_delta <= frequency_step + 1e-12
+            else:
+                passed = rel_delta <= tolerance or abs_delta <= 1e-6
+            report[name] = {
+                'float64': ref_value,
+                'float32': value,
+                'abs_delta': float(abs_delta),
+                'rel_delta': float(rel_delta),
+                'passed': bool(passed)
+            }
+
+        return {
+            'tolerance': tolerance,
+            'passed': all(item['passed'] for item in report.values()),
+            'metrics': report
+        }
+
+    @staticmethod
+    def _serializable(value):
+        """Рекурсивное преобразование вложенных словарей с numpy-значениями для JSON"""
+        if isinstance(value, dict):
+            return {k: ImageQualityAnalyzer._serializable(v) for k, v in value.items()}
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, (np.integer, np.floating)):
+            return float(value)
+        return value
+
+    def save_results(self, filename, format=None, artifact_store=None, image_id=None):
+        """Сохранение результатов: .npz (бинарный формат) или .json (экспорт).
+
+        Формат определяется расширением файла, если не задан явно. Спектр, карта
+        шума, гистограмма градиентов и карты фокуса (LARGE_ARRAYS) в файл не
+        входят; при заданном artifact_store они сохраняются в нем под image_id
+        (по умолчанию - имя файла результатов без расширения).
+        Неизвестное расширение или формат - ValueError.
+        """
+        format = results_format(filename, format)
+        if artifact_store is not None:
+            try:
+                if image_id is None:
+                    image_id = os.path.splitext(os.path.basename(filename))[0]
+                artifact_store.save(image_id, self.results)
+            except Exception as e:
+                self.events.error("Ошибка сохранения карт", e)
+
+        if format == 'npz':
+            try:
+                save_npz(self.results, filename)
+            except Exception as e:
+                self.events.error("Ошибка сохранения", e)
+                raise
+            return
+
         # Подготавливаем данные для сериализации
         results_serializable = {}
         for key, value in self.results.items():
@@ -416,11 +1363,14 @@ class ImageQualityAnalyzer:
                 results_serializable[key] = {}
                 for k, v in value.items():
                     # Преобразуем numpy массивы и типы в сериализуемые форматы
+                    if k in LARGE_ARRAYS:  # Исключаем большие массивы и карты
+                        continue
                     if isinstance(v, np.ndarray):
-                        if k != 'magnitude_spectrum' and k != 'noise_image':  # Исключаем большие массивы
-                            results_serializable[key][k] = v.tolist()
+                        results_serializable[key][k] = v.tolist()
                     elif isinstance(v, (np.integer, np.floating)):
                         results_serializable[key][k] = float(v)
+                    elif isinstance(v, dict):
+                        results_serializable[key][k] = self._serializable(v)
                     elif v is not None and not isinstance(v, np.ndarray):
                         results_serializable[key][k] = v
             else:
@@ -433,7 +1383,23 @@ class ImageQualityAnalyzer:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(results_serializable, f, indent=2, ensure_ascii=False, default=str)
         except Exception as e:
-            print(f"Ошибка сохранения: {e}")
+            self.events.error("Ошибка сохранения", e)
+            raise
+
+    def content_hash(self):
+        """Хэш содержимого: файла изображения или массива, загруженного из памяти"""
+        if self.image_path is not None and os.path.isfile(self.image_path):
+            return file_hash(self.image_path)
+        return array_hash(self.image)
+
+    def save_to_database(self, database, path=None, content_hash=None):
+        """Запись результатов в базу результатов (ResultsDatabase)"""
+        try:
+            path = path or self.image_path or '<memory>'
+            database.insert(self.results, os.path.abspath(path) if os.path.exists(path) else path,
+                            content_hash or self.content_hash())
+        except Exception as e:
+            self.events.error("Ошибка записи в базу результатов", e)
             raise
 
     def generate_report(self):
@@ -460,7 +1426,16 @@ class ImageQualityAnalyzer:
             report += f"РЕЗКОСТЬ:\n"
             report += f"  Tenengrad: {sharp['tenengrad']:.2f}\n"
             report += f"  Лапласиан вариация: {sharp['laplacian_variance']:.2f}\n"
-            report += f"  Нормализованная вариация: {sharp['normalized_variance']:.4f}\n\n"
+            report += f"  Нормализованная вариация: {sharp['normalized_variance']:.4f}\n"
+            if 'brenner' in sharp:
+                report += f"  Бреннер: {sharp['brenner']:.2f}\n"
+                report += f"  Энергия лапласиана: {sharp['laplacian_energy']:.2f}\n"
+                report += f"  Модуль градиента (50/90/99%): {sharp['gradient_p50']:.2f} / " \
+                          f"{sharp['gradient_p90']:.2f} / {sharp['gradient_p99']:.2f}\n"
+                report += f"  Доля перепадов: {sharp['edge_fraction']:.2%}\n"
+                report += f"  Равномерность фокуса (мин/макс Tenengrad по плиткам): " \
+                          f"{sharp['focus_uniformity']:.3f}\n"
+            report += "\n"
 
         # Контраст
         if 'contrast' in self.results:
@@ -477,7 +1452,15 @@ class ImageQualityAnalyzer:
             report += f"ШУМ:\n"
             report += f"  Стандартное отклонение шума: {noise['noise_std']:.2f}\n"
             report += f"  Среднее значение шума: {noise['noise_mean']:.2f}\n"
-            report += f"  SNR: {noise['snr_db']:.2f} дБ\n\n"
+            report += f"  SNR: {noise['snr_db']:.2f} дБ\n"
+            if 'flat_fraction' in noise:
+                report += f"  Доля плоских участков: {noise['flat_fraction']:.2%}\n"
+            curve = noise.get('noise_curve')
+            if curve is not None and len(curve['intensity']) > 0:
+                report += "  Шум по уровням яркости:\n"
+                for level, std in zip(curve['intensity'], curve['noise_std']):
+                    report += f"    {level:8.1f}: {std:.2f}\n"
+            report += "\n"
 
         # Артефакты дискретизации
         if 'discretization_artifacts' in self.results:
@@ -485,12 +1468,229 @@ class ImageQualityAnalyzer:
             report += f"АРТЕФАКТЫ ДИСКРЕТИЗАЦИИ:\n"
             report += f"  Мера алиасинга: {artifacts['aliasing_measure']:.2f}\n"
             report += f"  Энтропия: {artifacts['entropy']:.2f} бит\n"
+            report += f"  Разрядность: {artifacts['bit_depth']} бит\n"
             report += f"  Качество квантования: {artifacts['quantization_quality']:.4f}\n"
-            report += f"  Пустые уровни: {artifacts['empty_levels']}/256\n\n"
+            report += f"  Пустые уровни: {artifacts['empty_levels']}/{artifacts['levels']}\n"
+            report += f"  Пропущенные коды АЦП: {artifacts['missing_codes']} " \
+                      f"(изолированных: {artifacts['isolated_missing_codes']})\n"
+            stuck_low = [int(bit) for bit in artifacts['stuck_bits_low']]
+            stuck_high = [int(bit) for bit in artifacts['stuck_bits_high']]
+            if stuck_low or stuck_high:
+                report += f"  Залипшие разряды (0/1): {stuck_low} / {stuck_high}\n"
+            report += "\n"
+
+        # Спектр мощности
+        if 'power_spectrum' in self.results:
+            ps = self.results['power_spectrum']
+            report += f"СПЕКТР МОЩНОСТИ:\n"
+            report += f"  Индекс алиасинга (0.5-1 Найквиста): {ps['aliasing_index']:.4f}\n"
+            report += f"  Мощность у Найквиста / низкие частоты: {ps['nyquist_power_ratio']:.4f}\n"
+            report += f"  Анизотропия: {ps['anisotropy']:.3f}\n"
+            if 'model' in ps:
+                model = ps['model']
+                report += f"  Модель апертуры (l_ap={model['l_ap']:g}, l_sh={model['l_sh']:g}): " \
+                          f"MTF(Найквист) = {model['mtf_at_nyquist']:.3f}\n"
+                report += f"  Алиасинг относительно модели: {model['relative_aliasing']:.3f}\n"
+            report += "\n"
+
+        # Сравнение с эталоном
+        if 'reference' in self.results:
+            ref = self.results['reference']
+            report += f"СРАВНЕНИЕ С ЭТАЛОНОМ:\n"
+            report += f"  PSNR: {ref['psnr_db']:.2f} дБ\n"
+            report += f"  SSIM: {ref['ssim']:.4f}\n"
+            report += f"  MS-SSIM: {ref['ms_ssim']:.4f} ({ref['scales']} масштабов)\n\n"
+
+        # Области интереса
+        if self.results.get('rois'):
+            report += f"ОБЛАСТИ ИНТЕРЕСА:\n"
+            for name, region in self.results['rois'].items():
+                roi = region['roi']
+                mtf_50 = region.get('mtf', {}).get('mtf_50')
+                report += f"  {name} ({roi['width']} x {roi['height']} @ {roi['x']}, {roi['y']}" \
+                          f"{', маска' if roi['masked'] else ''}):\n"
+                report += f"    Tenengrad: {region['sharpness']['tenengrad']:.2f}, " \
+                          f"MTF50: {'-' if mtf_50 is None else f'{mtf_50:.4f}'}\n"
+                report += f"    Шум: {region['noise']['noise_std']:.2f}, SNR: {region['noise']['snr_db']:.2f} дБ, " \
+                          f"RMS контраст: {region['contrast']['rms_contrast']:.2f}\n"
+            report += "\n"
+
+        # Каналы
+        if self.results.get('channels'):
+            report += f"КАНАЛЫ:\n"
+            for name, channel in self.results['channels'].items():
+                mtf_50 = channel.get('mtf', {}).get('mtf_50')
+                report += f"  {name}: Tenengrad: {channel['sharpness']['tenengrad']:.2f}, " \
+                          f"MTF50: {'-' if mtf_50 is None else f'{mtf_50:.4f}'}, " \
+                          f"шум: {channel['noise']['noise_std']:.2f}, SNR: {channel['noise']['snr_db']:.2f} дБ, " \
+                          f"RMS контраст: {channel['contrast']['rms_contrast']:.2f}\n"
+            aberration = self.results.get('chromatic_aberration', {})
+            for name, value in aberration.items():
+                if isinstance(value, dict) and 'lateral_ca_px' in value:
+                    report += f"  Хроматическая аберрация {name}/{aberration['reference']}: " \
+                              f"{value['lateral_ca_px']:+.2f} пикс. в углу, " \
+                              f"сдвиг ({value['shift_x']:+.2f}, {value['shift_y']:+.2f}) пикс.\n"
+            report += "\n"
+
+        # Время выполнения этапов
+        if 'timings' in self.results and self.results['timings']:
+            report += f"ВРЕМЯ ВЫПОЛНЕНИЯ:\n"
+            for stage, timing in self.results['timings'].items():
+                line = f"  {stage}: {timing['wall_s'] * 1000:.1f} мс (CPU {timing['cpu_s'] * 1000:.1f} мс)"
+                if 'peak_bytes' in timing:
+                    line += f", пик памяти {timing['peak_bytes'] / 2 ** 20:.1f} МБ"
+                report += line + "\n"
+            report += "\n"
 
         return report
 
 
+class FrameStackAnalyzer:
+    """Анализ стека кадров плоского поля: КФП, DSNU, PRNU и карты временного шума"""
+
+    def __init__(self, bit_depth=None):
+        # Загрузчик общий с покадровым анализом
+        self.loader = ImageQualityAnalyzer(bit_depth=bit_depth)
+        self.bit_depth = bit_depth
+        self.results = {}
+        self.maps = {}
+        # Тип и максимальный код всех кадров с последнего сброса (для разрядности)
+        self._dtype = None
+        self._peak = 0
+
+    def _iter_frames(self, frames):
+        """Кадры по одному: пути к файлам или массивы"""
+        for frame in frames:
+            if isinstance(frame, (str, os.PathLike)):
+                if not self.loader.load_image(os.fspath(frame)):
+                    raise ValueError(f"Не удалось загрузить кадр: {frame}")
+                yield self.loader.image_gray
+            else:
+                frame = np.asarray(frame)
+                if frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                self.loader.image_gray = frame
+                yield frame
+
+    def accumulate(self, frames):
+        """Попиксельные среднее и дисперсия по потоку кадров"""
+        stats = RunningStatistics()
+        for frame in self._iter_frames(frames):
+            stats.update(frame)
+            self._dtype = frame.dtype
+            if np.issubdtype(frame.dtype, np.integer):
+                self._peak = max(self._peak, int(np.max(frame)))
+        if stats.count == 0:
+            raise ValueError("Пустой стек кадров")
+        return stats
+
+    def get_bit_depth(self):
+        """Разрядность: заданная явно или оценка по максимуму всех кадров стека"""
+        if self.bit_depth is not None:
+            return int(self.bit_depth)
+        return ImageQualityAnalyzer._bit_depth_for(self._dtype, self._peak)
+
+    def _reset_peak(self):
+        """Новый стек: разрядность оценивается заново"""
+        self._dtype = None
+        self._peak = 0
+
+    def analyze(self, flat_frames, dark_frames=None, exposure_stacks=None):
+        """DSNU, PRNU и карта временного шума стека плоского поля.
+
+        Один стек - один уровень экспозиции, поэтому КФП и коэффициент
+        преобразования считаются только по exposure_stacks - стекам с разной
+        экспозицией (не меньше двух, см. photon_transfer_curve).
+        """
+        if exposure_stacks is not None:
+            exposure_stacks = list(exposure_stacks)
+            if len(exposure_stacks) < 2:
+                raise ValueError(f"Для КФП нужно не меньше двух уровней экспозиции, "
+                                 f"получено {len(exposure_stacks)}")
+        self._reset_peak()
+        flat = self.accumulate(flat_frames)
+        temporal_variance = flat.variance
+        signal_map = flat.mean
+        # Остаток временного шума в карте среднего: var / N
+        residual_variance = float(np.mean(temporal_variance)) / flat.count
+
+        results = {'frame_count': flat.count}
+
+        dark = None
+        if dark_frames is not None:
+            dark = self.accumulate(dark_frames)
+            dark_temporal = float(np.mean(dark.variance))
+            # DSNU - пространственная неоднородность темнового сигнала без временного шума
+            dsnu_variance = float(np.var(dark.mean)) - dark_temporal / dark.count
+            results['dark_level'] = float(np.mean(dark.mean))
+            results['dark_temporal_noise'] = float(np.sqrt(dark_temporal))
+            results['dsnu'] = float(np.sqrt(max(dsnu_variance, 0.0)))
+            signal_map = flat.mean - dark.mean
+            residual_variance += dark_temporal / dark.count
+            self.maps['dark_mean'] = dark.mean
+
+        # PRNU - пространственная неоднородность чувствительности относительно сигнала
+        signal_mean = float(np.mean(signal_map))
+        prnu_variance = float(np.var(signal_map)) - residual_variance
+        results['signal_mean'] = signal_mean
+        results['temporal_noise'] = float(np.sqrt(np.mean(temporal_variance)))
+        results['prnu'] = float(np.sqrt(max(prnu_variance, 0.0)) / signal_mean) if signal_mean > 0 else 0.0
+
+        self.maps['mean'] = flat.mean
+        self.maps['temporal_noise'] = np.sqrt(temporal_variance)
+        self.results = results
+        if exposure_stacks is not None:
+            self._photon_transfer_curve(exposure_stacks, dark.mean if dark is not None else None)
+        results['bit_depth'] = self.get_bit_depth()
+        return results
+
+    def photon_transfer_curve(self, stacks, dark_frames=None):
+        """КФП по серии стеков с разной экспозицией: точка на каждый стек.
+
+        Меньше двух уровней экспозиции - ValueError (по одной точке прямая не строится).
+        """
+        self._reset_peak()
+        dark_mean = self.accumulate(dark_frames).mean if dark_frames is not None else None
+        return self._photon_transfer_curve(stacks, dark_mean)
+
+    def _photon_transfer_curve(self, stacks, dark_mean):
+        """Точки КФП по стекам (темновой кадр уже накоплен) и подгонка прямой"""
+        stacks = list(stacks)
+        if len(stacks) < 2:
+            raise ValueError(f"Для КФП нужно не меньше двух уровней экспозиции, получено {len(stacks)}")
+
+        signal = []
+        variance = []
+        for frames in stacks:
+            stats = self.accumulate(frames)
+            mean_map = stats.mean if dark_mean is None else stats.mean - dark_mean
+            signal.append(float(np.mean(mean_map)))
+            variance.append(float(np.mean(stats.variance)))
+
+        levels = 2 ** self.get_bit_depth()
+        gain, read_variance = fit_conversion_gain(signal, variance, levels - 1)
+        self.results['ptc'] = {
+            'signal': np.array(signal),
+            'variance': np.array(variance),
+            'conversion_gain': gain,
+            'read_noise': float(np.sqrt(read_variance)) if read_variance is not None else None
+        }
+        return self.results['ptc']
+
+    def save_results(self, filename, format=None):
+        """Сохранение результатов (без попиксельных карт) в .npz или .json"""
+        try:
+            if results_format(filename, format) == 'npz':
+                save_npz(self.results, filename)
+                return
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(ImageQualityAnalyzer._serializable(self.results), f, indent=2,
+                          ensure_ascii=False, default=str)
+        except Exception as e:
+            self.loader.events.error("Ошибка сохранения", e)
+            raise
+
+
 class ImageQualityGUI:
     def __init__(self, root):
         self.root = root
@@ -498,7 +1698,19 @@ class ImageQualityGUI:
         self.root.geometry("800x600")
 
         self.analyzer = ImageQualityAnalyzer()
+        # Фоновый поток анализа и флаг его отмены
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.quick_look_text = ""
+        # Окно закрыто: фоновый поток больше не обращается к Tk
+        self.closed = False
+        try:
+            self.cache = ResultCache()
+        except Exception:
+            # Каталог кэша недоступен - анализ без кэша
+            self.cache = None
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_gui(self):
         # Главное меню
@@ -510,7 +1722,7 @@ class ImageQualityGUI:
         file_menu.add_command(label="Загрузить изображение", command=self.load_image)
         file_menu.add_command(label="Сохранить результаты", command=self.save_results)
         file_menu.add_separator()
-        file_menu.add_command(label="Выход", command=self.root.quit)
+        file_menu.add_command(label="Выход", command=self.on_close)
 
         # Основная рамка
         main_frame = ttk.Frame(self.root)
@@ -522,11 +1734,29 @@ class ImageQualityGUI:
 
         ttk.Button(control_frame, text="Загрузить изображение",
                    command=self.load_image).pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Button(control_frame, text="Анализировать",
-                   command=self.analyze_image).pack(side=tk.LEFT, padx=(0, 10))
+        self.analyze_button = ttk.Button(control_frame, text="Анализировать", command=self.analyze_image)
+        self.analyze_button.pack(side=tk.LEFT, padx=(0, 10))
+        self.cancel_button = ttk.Button(control_frame, text="Отменить", command=self.cancel_analysis,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(control_frame, text="Показать отчет",
                    command=self.show_report).pack(side=tk.LEFT)
 
+        # Ход анализа
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=(0, 10))
+
+        self.status_var = tk.StringVar(value="")
+        self.progressbar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=100)
+        self.progressbar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        ttk.Label(progress_frame, textvariable=self.status_var, width=35).pack(side=tk.LEFT)
+
+        # События анализатора: прогресс в окне и журнал
+        self.progress_sink = TkProgressSink(self.root, self.progressbar, self.status_var)
+        self.analyzer.events = CompositeEventSink(self.progress_sink, LoggingEventSink())
+        # Результаты каждого этапа выводятся по мере готовности
+        self.analyzer.add_stage_hook(self._on_stage_finished)
+
         # Область для результатов
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
@@ -550,7 +1780,14 @@ class ImageQualityGUI:
         self.results_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+    def is_analyzing(self):
+        return self.worker is not None and self.worker.is_alive()
+
     def load_image(self):
+        if self.is_analyzing():
+            messagebox.showwarning("Предупреждение", "Дождитесь завершения или отмените анализ")
+            return
+
         filename = filedialog.askopenfilename(
             title="Выберите изображение",
             filetypes=[
@@ -561,16 +1798,14 @@ class ImageQualityGUI:
 
         if filename:
             if self.analyzer.load_image(filename):
-                self.display_image(filename)
+                self.display_image()
                 messagebox.showinfo("Успех", "Изображение загружено успешно!")
             else:
                 messagebox.showerror("Ошибка", "Не удалось загрузить изображение")
 
-    def display_image(self, filename):
-        # Загружаем и масштабируем изображение для отображения
-        image = Image.open(filename)
-        image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(image)
+    def display_image(self):
+        # Миниатюра из пирамиды уже декодированного изображения (без повторного чтения файла)
+        photo = ImageTk.PhotoImage(Image.fromarray(self.analyzer.preview(400)))
 
         self.image_label.configure(image=photo, text="")
         self.image_label.image = photo  # Сохраняем ссылку
@@ -579,20 +1814,104 @@ class ImageQualityGUI:
         if self.analyzer.image is None:
             messagebox.showwarning("Предупреждение", "Сначала загрузите изображение")
             return
+        if self.is_analyzing():
+            return
 
+        self.cancel_event.clear()
+        # Ошибки прошлого анализа не переносятся (при попадании в кэш analysis_started не приходит)
+        self.progress_sink.reset()
+        self.analyze_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.notebook.select(self.results_frame)
+
+        # Быстрая оценка по уменьшенной копии - до завершения полного анализа
         try:
-            # Выполняем анализ
-            self.analyzer.perform_full_analysis()
+            self.quick_look_text = self._format_quick_look(self.analyzer.quick_look())
+        except Exception as e:
+            self.quick_look_text = ""
+            self.analyzer.events.error("Ошибка быстрой оценки", e)
+        self._show_report_text(self.quick_look_text)
 
-            # Отображаем результаты
-            report = self.analyzer.generate_report()
-            self.results_text.delete(1.0, tk.END)
-            self.results_text.insert(1.0, report)
+        # Анализ в фоновом потоке: окно остается отзывчивым
+        self.worker = threading.Thread(target=self._analysis_worker, name="analysis", daemon=True)
+        self.worker.start()
 
+    def _analysis_worker(self):
+        error = None
+        try:
+            # Неизмененное изображение берется из кэша
+            if self.cache is not None:
+                self.analyzer.perform_cached_analysis(self.cache, cancel_event=self.cancel_event)
+            else:
+                self.analyzer.results = {}
+                self.analyzer.perform_full_analysis(cancel_event=self.cancel_event)
+        except Exception as e:
+            error = e
+        # Отчет формируется в фоновом потоке, виджеты обновляются в главном
+        report = self.analyzer.generate_report()
+        self._after(self._analysis_finished, report, error)
+
+    def _after(self, func, *args):
+        """Вызов в главном потоке из фонового; после закрытия окна - пропуск"""
+        if self.closed:
+            return
+        try:
+            self.root.after(0, func, *args)
+        except (tk.TclError, RuntimeError):
+            # Окно закрыто между проверкой и вызовом
+            pass
+
+    def _on_stage_finished(self, stage, timing):
+        """Обработчик этапа (фоновый поток): промежуточный отчет во вкладку результатов"""
+        if self.closed:
+            return
+        report = self.analyzer.generate_report()
+        self._after(self._show_report_text, report + "\n" + self.quick_look_text)
+
+    @staticmethod
+    def _format_quick_look(quick):
+        text = f"БЫСТРАЯ ОЦЕНКА (уровень пирамиды {quick['level']}, " \
+               f"{quick['level_shape'][1]} x {quick['level_shape'][0]}, {quick['wall_s'] * 1000:.0f} мс):\n"
+        text += f"  Tenengrad (на уровне): {quick['tenengrad']:.2f}\n"
+        text += f"  Лапласиан вариация (на уровне): {quick['laplacian_variance']:.2f}\n"
+        text += f"  Контраст Майкельсона: {quick['michelson_contrast']:.4f}\n"
+        text += f"  RMS контраст: {quick['rms_contrast']:.2f}\n"
+        text += f"  СКО шума: {quick['noise_std']:.2f}\n"
+        text += f"  SNR: {quick['snr_db']:.2f} дБ\n"
+        return text
+
+    def _show_report_text(self, report):
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(1.0, report)
+
+    def _analysis_finished(self, report, error):
+        self.analyze_button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+        self._show_report_text(report)
+
+        if isinstance(error, AnalysisCancelled):
+            self.status_var.set("Анализ отменен")
+        elif error is not None:
+            messagebox.showerror("Ошибка", f"Ошибка при анализе: {str(error)}")
+        elif self.progress_sink.errors:
+            messagebox.showwarning("Предупреждение",
+                                   "Анализ завершен с ошибками:\n" + "\n".join(self.progress_sink.errors))
+        else:
             messagebox.showinfo("Успех", "Анализ завершен!")
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при анализе: {str(e)}")
+    def on_close(self):
+        # Фоновый анализ останавливается на границе этапа, поток-демон не держит процесс
+        self.cancel_event.set()
+        self.closed = True
+        self.progress_sink.close()
+        self.root.destroy()
+
+    def cancel_analysis(self):
+        """Отмена: анализ остановится перед следующим этапом"""
+        if self.is_analyzing():
+            self.cancel_event.set()
+            self.cancel_button.configure(state=tk.DISABLED)
+            self.status_var.set("Отмена после текущего этапа...")
 
     def show_report(self):
         if not self.analyzer.results:
@@ -603,14 +1922,17 @@ class ImageQualityGUI:
         self.notebook.select(self.results_frame)
 
     def save_results(self):
+        if self.is_analyzing():
+            messagebox.showwarning("Предупреждение", "Дождитесь завершения или отмените анализ")
+            return
         if not self.analyzer.results:
             messagebox.showwarning("Предупреждение", "Нет результатов для сохранения")
             return
 
         filename = filedialog.asksaveasfilename(
             title="Сохранить результаты",
-            defaultextension=".json",
-            filetypes=[("JSON файлы", "*.json"), ("Все файлы", "*.*")]
+            defaultextension=".npz",
+            filetypes=[("Результаты NumPy", "*.npz"), ("JSON файлы", "*.json"), ("Все файлы", "*.*")]
         )
 
         if filename:
@@ -630,21 +1952,55 @@ def main():
 
 if __name__ == "__main__":
     # Можно использовать как с GUI, так и напрямую
+    import argparse
     import sys
 
     if len(sys.argv) > 1:
         # Консольный режим
-        image_path = sys.argv[1]
-
-        analyzer = ImageQualityAnalyzer()
-        if analyzer.load_image(image_path):
-            results = analyzer.perform_full_analysis()
+        parser = argparse.ArgumentParser(description="Анализ качества изображения")
+        parser.add_argument('image_path', help="файл изображения")
+        parser.add_argument('--json', action='store_true', help="сохранить результаты в JSON вместо .npz")
+        parser.add_argument('--artifacts', help="каталог для спектра и карты шума")
+        parser.add_argument('--db', help="база результатов SQLite для записи")
+        parser.add_argument('--cache', help="каталог кэша результатов (повторный анализ неизмененных файлов пропускается)")
+        parser.add_argument('--cache-size-mb', type=float, default=512, help="предельный размер кэша, МБ")
+        parser.add_argument('--chart', action='store_true', help="найти тест-таблицу и анализировать ее участки")
+        parser.add_argument('--channels', choices=('rgb', 'bayer'), help="поканальный анализ: RGB или плоскости Байера")
+        parser.add_argument('--bayer-pattern', choices=tuple(BAYER_PATTERNS), default='RGGB', help="мозаика Байера")
+        args = parser.parse_args()
+        image_path = args.image_path
+
+        analyzer = ImageQualityAnalyzer(events=ConsoleEventSink())
+        cache = ResultCache(args.cache, args.cache_size_mb * 2 ** 20) if args.cache else None
+        # Участки тест-таблицы анализируются без кэша
+        from_cache = False
+        if args.chart:
+            from chart_detection import ChartDetector
+            results = None
+            if analyzer.load_image(image_path):
+                try:
+                    results = ChartDetector().analyze(analyzer)
+                except ValueError as e:
+                    print(f"Ошибка: {e}")
+        else:
+            params = {'channels': args.channels, 'bayer_pattern': args.bayer_pattern} if args.channels else {}
+            results = analyzer.analyze_file(image_path, cache, **params)
+            from_cache = cache is not None and cache.hits > 0
+        if results is not None:
+            if from_cache:
+                print("Результаты взяты из кэша")
             print(analyzer.generate_report())
 
             # Сохраняем результаты
-            output_file = image_path.rsplit('.', 1)[0] + '_analysis.json'
-            analyzer.save_results(output_file)
+            extension = '.json' if args.json else '.npz'
+            output_file = image_path.rsplit('.', 1)[0] + '_analysis' + extension
+            artifact_store = ArtifactStore(args.artifacts) if args.artifacts else None
+            analyzer.save_results(output_file, artifact_store=artifact_store)
             print(f"\nРезультаты сохранены в {output_file}")
+            if args.db:
+                with ResultsDatabase(args.db) as database:
+                    analyzer.save_to_database(database)
+                print(f"Результаты записаны в базу {args.db}")
         else:
             print("Ошибка загрузки изображения")
     else:
@@ -0,0 +1,206 @@
+import logging
+import threading
+
+
+class EventSink:
+    """Приемник событий анализа. Базовая реализация ничего не делает (no-op).
+
+    События: начало/конец анализа, начало/конец этапа, предупреждения и
+    ошибки. Наследники переопределяют нужные методы.
+    """
+
+    def analysis_started(self, total_stages):
+        pass
+
+    def analysis_finished(self, results):
+        pass
+
+    def stage_started(self, stage, description, index, total):
+        pass
+
+    def stage_finished(self, stage, index, total, timing):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message, exception=None):
+        pass
+
+
+# Приемник без вывода (явное подавление событий)
+NullEventSink = EventSink
+
+
+class ConsoleEventSink(EventSink):
+    """Вывод хода анализа в консоль (консольный режим VKR2.py)"""
+
+    def analysis_started(self, total_stages):
+        print("Выполняется анализ качества изображения...")
+
+    def analysis_finished(self, results):
+        print("Анализ завершен!")
+
+    def stage_started(self, stage, description, index, total):
+        print(f"- {description}...")
+
+    def warning(self, message):
+        print(f"Предупреждение: {message}")
+
+    def error(self, message, exception=None):
+        print(f"{message}: {exception}" if exception is not None else message)
+
+
+class LoggingEventSink(EventSink):
+    """Передача событий в модуль logging; приемник по умолчанию анализатора и наблюдателя.
+
+    Ход анализа пишется на уровнях INFO/DEBUG (без настройки logging не выводится),
+    предупреждения и ошибки метрик - WARNING/ERROR.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger('image_quality')
+
+    def analysis_started(self, total_stages):
+        self.logger.info("Анализ начат (%d этапов)", total_stages)
+
+    def analysis_finished(self, results):
+        self.logger.info("Анализ завершен")
+
+    def stage_started(self, stage, description, index, total):
+        self.logger.debug("Этап %d/%d: %s", index + 1, total, description)
+
+    def stage_finished(self, stage, index, total, timing):
+        self.logger.debug("Этап %s завершен за %.1f мс", stage, timing['wall_s'] * 1000)
+
+    def warning(self, message):
+        self.logger.warning(message)
+
+    def error(self, message, exception=None):
+        if exception is not None:
+            self.logger.error("%s: %s", message, exception)
+        else:
+            self.logger.error(message)
+
+
+class CompositeEventSink(EventSink):
+    """Рассылка событий нескольким приемникам"""
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def analysis_started(self, total_stages):
+        for sink in self.sinks:
+            sink.analysis_started(total_stages)
+
+    def analysis_finished(self, results):
+        for sink in self.sinks:
+            sink.analysis_finished(results)
+
+    def stage_started(self, stage, description, index, total):
+        for sink in self.sinks:
+            sink.stage_started(stage, description, index, total)
+
+    def stage_finished(self, stage, index, total, timing):
+        for sink in self.sinks:
+            sink.stage_finished(stage, index, total, timing)
+
+    def warning(self, message):
+        for sink in self.sinks:
+            sink.warning(message)
+
+    def error(self, message, exception=None):
+        for sink in self.sinks:
+            sink.error(message, exception)
+
+
+class TkProgressSink(EventSink):
+    """Отображение хода анализа в Tk: ttk.Progressbar (0-100) и строка состояния.
+
+    Вызовы из фонового потока передаются в главный поток через root.after,
+    из главного - применяются сразу с перерисовкой виджетов. После close()
+    (окно закрыто) виджеты не обновляются. Предупреждения и ошибки копятся до
+    reset() - его вызывают перед каждым анализом, в том числе взятым из кэша.
+    """
+
+    def __init__(self, root, progressbar, status_var=None):
+        self.root = root
+        self.progressbar = progressbar
+        self.status_var = status_var
+        self.warnings = []
+        self.errors = []
+        self.closed = False
+
+    def reset(self):
+        self.warnings, self.errors = [], []
+
+    def close(self):
+        self.closed = True
+
+    def _call(self, func, *args):
+        if self.closed:
+            return
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+            self.root.update_idletasks()
+        else:
+            self.root.after(0, func, *args)
+
+    def _set_progress(self, fraction, message):
+        self.progressbar['value'] = max(0.0, min(fraction, 1.0)) * 100
+        if self.status_var is not None and message is not None:
+            self.status_var.set(message)
+
+    def analysis_started(self, total_stages):
+        self._call(self._set_progress, 0.0, "Выполняется анализ...")
+
+    def analysis_finished(self, results):
+        self._call(self._set_progress, 1.0, "Анализ завершен")
+
+    def stage_started(self, stage, description, index, total):
+        self._call(self._set_progress, index / total, description)
+
+    def stage_finished(self, stage, index, total, timing):
+        self._call(self._set_progress, (index + 1) / total, None)
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+    def error(self, message, exception=None):
+        self.errors.append(f"{message}: {exception}" if exception is not None else message)
+
+
+class ErrorsOnlyEventSink(EventSink):
+    """Передача только предупреждений и ошибок с префиксом (например, имени области)"""
+
+    def __init__(self, sink, prefix):
+        self.sink = sink
+        self.prefix = prefix
+
+    def warning(self, message):
+        self.sink.warning(f"{self.prefix}: {message}")
+
+    def error(self, message, exception=None):
+        self.sink.error(f"{self.prefix}: {message}", exception)
+
+
+class NestedEventSink(EventSink):
+    """События части составного анализа: этапы сдвигаются на offset из общего total,
+    начало и конец части не передаются (их сообщает составной анализ один раз)"""
+
+    def __init__(self, sink, offset, total):
+        self.sink = sink
+        self.offset = offset
+        self.total = total
+
+    def stage_started(self, stage, description, index, total):
+        self.sink.stage_started(stage, description, self.offset + index, self.total)
+
+    def stage_finished(self, stage, index, total, timing):
+        self.sink.stage_finished(stage, self.offset + index, self.total, timing)
+
+    def warning(self, message):
+        self.sink.warning(message)
+
+    def error(self, message, exception=None):
+        self.sink.error(message, exception)
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from VKR2 import ImageQualityAnalyzer
+from results_store import LARGE_ARRAYS, dumps_npz
+
+
+MAX_BODY_BYTES = 512 * 2 ** 20
+ANALYSIS_PARAMS = ('physical_size_mm', 'sensor_size_mm', 'l_ap', 'l_sh')
+
+# Анализатор процесса-исполнителя, создается один раз при запуске процесса
+_worker_analyzer = None
+
+
+def _init_worker(bit_depth, precision):
+    """Инициализация процесса пула: анализатор и прогрев на небольшом кадре"""
+    global _worker_analyzer
+    _worker_analyzer = ImageQualityAnalyzer(bit_depth=bit_depth, precision=precision)
+    warmup = np.zeros((64, 64), dtype=np.uint8)
+    warmup[:, 32:] = 200
+    _worker_analyzer.load_array(warmup)
+    _worker_analyzer.perform_full_analysis()
+
+
+def _strip_large(results):
+    """Результаты без попиксельных карт (не передаются между процессами)"""
+    return {section: {key: item for key, item in value.items() if key not in LARGE_ARRAYS}
+            if isinstance(value, dict) else value
+            for section, value in results.items()}
+
+
+def _analyze_batch(items):
+    """Анализ пакета в процессе пула: элементы (вид, значение, параметры).
+
+    Вид 'path' - путь к файлу, 'bytes' - закодированное изображение (PNG, TIFF, ...).
+    Возвращает список пар (успех, результаты или текст ошибки).
+    """
+    analyzer = _worker_analyzer
+    output = []
+    for kind, value, params in items:
+        try:
+            loaded = analyzer.load_image(value) if kind == 'path' else analyzer.load_bytes(value)
+            if not loaded:
+                raise ValueError("Не удалось загрузить изображение")
+            analyzer.results = {}
+            output.append((True, _strip_large(analyzer.perform_full_analysis(**params))))
+        except Exception as e:
+            output.append((False, str(e)))
+    return output
+
+
+class ServiceOverloaded(Exception):
+    """Очередь сервиса заполнена"""
+
+
+class AnalysisService:
+    """Долгоживущий сервис анализа: HTTP по TCP или Unix-сокету, пул процессов.
+
+    Процессы пула создаются при запуске и держат прогретые анализаторы. Запросы
+    объединяются в пакеты до batch_size штук в окне batch_window секунд (меньше
+    накладных расходов на передачу между процессами); одновременно выполняется не
+    более max_concurrent пакетов, очередь ограничена max_pending запросами -
+    сверх нее сервис отвечает 503.
+    """
+
+    def __init__(self, workers=None, batch_size=8, batch_window=0.005, max_concurrent=None,
+                 max_pending=256, bit_depth=None, precision='float32'):
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_pending = max_pending
+        self.bit_depth = bit_depth
+        self.precision = precision
+        self.pool = None
+        self.servers = []
+        self._queue = None
+        self._semaphore = None
+        self._batcher = None
+        self.stats = {'requests': 0, 'batches': 0, 'errors': 0, 'rejected': 0}
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        """Запуск пула процессов и серверов"""
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(self.bit_depth, self.precision))
+        # Процессы запускаются и прогреваются до приема запросов
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, _analyze_batch, [])
+                               for _ in range(self.workers)])
+
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        if port is not None:
+            self.servers.append(await asyncio.start_server(self._handle_connection, host, port))
+        if unix_path is not None:
+            self.servers.append(await asyncio.start_unix_server(self._handle_connection, unix_path))
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def analyze(self, kind, value, params=None):
+        """Постановка изображения в очередь и ожидание результатов"""
+        if self._queue.qsize() >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise ServiceOverloaded("Очередь анализа заполнена")
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        await self._queue.put(((kind, value, params or {}), future))
+        return await future
+
+    async def _batch_loop(self):
+        """Сбор запросов в пакеты и отправка в пул с ограничением числа пакетов"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._semaphore.acquire()
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            self.stats['batches'] += 1
+            output = await loop.run_in_executor(self.pool, _analyze_batch, [item for item, _ in batch])
+            for (_, future), (ok, value) in zip(batch, output):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    self.stats['errors'] += 1
+                    future.set_exception(ValueError(value))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def _params(query):
+        """Параметры анализа из строки запроса"""
+        params = {}
+        for name in ANALYSIS_PARAMS:
+            if name in query:
+                params[name] = float(query[name][0])
+        return params
+
+    @staticmethod
+    def _json_bytes(value):
+        return json.dumps(ImageQualityAnalyzer._serializable(value), ensure_ascii=False, default=str).encode('utf-8')
+
+    async def _handle_request(self, method, target, headers, body):
+        """Обработка HTTP-запроса: (код, тип содержимого, тело)"""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if method == 'GET' and url.path == '/health':
+            return 200, 'application/json; charset=utf-8', self._json_bytes({
+                'status': 'ok', 'workers': self.workers, 'pending': self._queue.qsize(), **self.stats})
+
+        if method == 'POST' and url.path == '/analyze':
+            params = self._params(query)
+            if 'path' in query:
+                item = ('path', query['path'][0])
+            elif headers.get('content-type', '').startswith('application/json'):
+                item = ('path', json.loads(body)['path'])
+            elif body:
+                item = ('bytes', body)
+            else:
+                return 400, 'application/json; charset=utf-8', self._json_bytes({'error': "Нет изображения или пути"})
+
+            results = await self.analyze(item[0], item[1], params)
+            if query.get('format', ['json'])[0] == 'npz':
+                return 200, 'application/octet-stream', dumps_npz(results)
+            return 200, 'application/json; charset=utf-8', self._json_bytes(results)
+
+        if method == 'POST' and url.path == '/batch':
+            params = self._params(query)
+            paths = json.loads(body)['paths']
+            output = await asyncio.gather(*[self.analyze('path', path, params) for path in paths],
+                                          return_exceptions=True)
+            return 200, 'application/json; charset=utf-8', self._json_bytes([
+                {'path': path, 'error': str(value)} if isinstance(value, Exception) else {'path': path, 'results': value}
+                for path, value in zip(paths, output)])
+
+        return 404, 'application/json; charset=utf-8', self._json_bytes({'error': "Неизвестный запрос"})
+
+    @staticmethod
+    async def _read_head(reader):
+        """Строка запроса и заголовки: (метод, цель, заголовки, длина тела) или None
+        при закрытом соединении. Некорректный запрос - ValueError."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise ValueError("Некорректная строка запроса")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ValueError("Некорректный заголовок Content-Length") from None
+        if length < 0:
+            raise ValueError("Некорректный заголовок Content-Length")
+        return parts[0], parts[1], headers, length
+
+    async def _respond(self, reader, method, target, headers, length):
+        """Чтение тела и обработка запроса: (код, тип содержимого, тело, keep-alive)"""
+        if length > MAX_BODY_BYTES:
+            return 413, 'application/json; charset=utf-8', self._json_bytes({'error': "Слишком большой запрос"}), False
+        body = await reader.readexactly(length) if length else b''
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        try:
+            status, content_type, payload = await self._handle_request(method, target, headers, body)
+        except ServiceOverloaded as e:
+            status, content_type, payload = 503, 'application/json; charset=utf-8', self._json_bytes({'error': str(e)})
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            status, content_type, payload = 400, 'application/json; charset=utf-8', self._json_bytes({'error': str(e)})
+        except Exception as e:
+            # Ошибка сервиса (OpenCV, отмена анализа и т.п.): клиент получает ответ, соединение не рвется
+            self.stats['errors'] += 1
+            status, content_type, payload = 500, 'application/json; charset=utf-8', self._json_bytes(
+                {'error': f"{type(e).__name__}: {e}"})
+        return status, content_type, payload, keep_alive
+
+    async def _handle_connection(self, reader, writer):
+        """HTTP/1.1 с поддержкой keep-alive"""
+        try:
+            while True:
+                try:
+                    head = await self._read_head(reader)
+                except ValueError as e:
+                    # Границы тела некорректного запроса неизвестны: ответ 400 и закрытие соединения
+                    status, content_type, payload = 400, 'application/json; charset=utf-8', self._json_bytes(
+                        {'error': str(e)})
+                    keep_alive = False
+                else:
+                    if head is None:
+                        break
+                    status, content_type, payload, keep_alive = await self._respond(reader, *head)
+
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    service = AnalysisService(workers=args.workers, batch_size=args.batch_size,
+                              batch_window=args.batch_window / 1000, max_concurrent=args.max_concurrent,
+                              max_pending=args.max_pending, bit_depth=args.bit_depth)
+    await service.start(args.host, None if args.unix else args.port, args.unix)
+    print(f"Сервис анализа запущен: {args.unix or f'http://{args.host}:{args.port}'} "
+          f"({service.workers} процессов)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервис анализа качества изображений")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес (только локальный по умолчанию)")
+    parser.add_argument('--port', type=int, default=8765, help="порт HTTP")
+    parser.add_argument('--unix', help="Unix-сокет вместо TCP")
+    parser.add_argument('--workers', type=int, help="процессов анализа")
+    parser.add_argument('--batch-size', type=int, default=8, help="наибольший размер пакета")
+    parser.add_argument('--batch-window', type=float, default=5.0, help="окно сбора пакета, мс")
+    parser.add_argument('--max-concurrent', type=int, help="одновременно выполняемых пакетов")
+    parser.add_argument('--max-pending', type=int, default=256, help="предельная длина очереди")
+    parser.add_argument('--bit-depth', type=int, help="разрядность данных")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import ctypes
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+
+import illumination_models
+from VKR2 import ImageQualityAnalyzer
+from sharpness import FOCUS_METRICS
+from synthetic_targets import SyntheticTargetRenderer
+
+
+# Размеры изображений (Мп) и матриц моделей освещенности
+SIZES_MP = (1, 4, 12, 24, 50)
+QUICK_SIZES_MP = (1, 4)
+KERNEL_SIZES = (20, 256, 1024, 4096, 16384)
+QUICK_KERNEL_SIZES = (20, 256, 1024)
+
+# Замедление относительно базовой линии, считающееся регрессией
+REGRESSION_THRESHOLD = 1.2
+
+ANALYZER_STAGES = (
+    'calculate_spatial_frequency_response',
+    'calculate_sharpness',
+    'calculate_resolution',
+    'analyze_discretization_artifacts',
+    'calculate_power_spectrum',
+    'calculate_noise_parameters',
+    'calculate_contrast_parameters',
+)
+
+
+def make_test_image(megapixels, seed=0):
+    """Тестовый кадр заданного размера: синтетический наклонный край с шумом"""
+    width = int(round(np.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = int(round(megapixels * 1e6 / width))
+    renderer = SyntheticTargetRenderer(seed=seed)
+    base = renderer.slanted_edge((480, 640), angle_deg=5.0, blur=3.0, noise=False)
+    image = cv2.resize(base, (width, height), interpolation=cv2.INTER_LINEAR)
+    noise = np.zeros(image.shape, dtype=np.int16)
+    cv2.randn(noise, 0, 4)
+    return cv2.add(image.astype(np.int16), noise, dtype=cv2.CV_8U)
+
+
+def _memory_status(field):
+    """Поле /proc/self/status в байтах (Linux) или None"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _release_free_memory():
+    """Возврат системе свободной памяти аллокатора (glibc), иначе она скрывает прирост RSS"""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _reset_rss_peak():
+    """Сброс пика RSS процесса (VmHWM, Linux); False, если недоступно"""
+    _release_free_memory()
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return _memory_status('VmHWM') is not None
+
+
+def measure(func, setup=None, repeat=3):
+    """Время (минимум по повторам), процессорное время и пики памяти.
+
+    Пики снимаются отдельными прогонами, чтобы замеры не искажали время:
+    peak_mb - пик выделений Python/numpy по tracemalloc (буферы cv::Mat внутри
+    OpenCV он не видит и занижает пик для большинства этапов), rss_peak_mb -
+    прирост пика RSS процесса, учитывающий и OpenCV (только Linux, иначе None).
+    """
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        func()
+        wall_times.append(time.perf_counter() - start_wall)
+        cpu_times.append(time.process_time() - start_cpu)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    rss_peak = None
+    if setup is not None:
+        setup()
+    if _reset_rss_peak():
+        start_rss = _memory_status('VmRSS')
+        func()
+        rss_peak = max(_memory_status('VmHWM') - start_rss, 0)
+
+    return {
+        'wall_s': min(wall_times),
+        'cpu_s': min(cpu_times),
+        'peak_mb': peak / 2 ** 20,
+        'rss_peak_mb': rss_peak / 2 ** 20 if rss_peak is not None else None
+    }
+
+
+def benchmark_analyzer(sizes_mp, repeat=3):
+    """Этапы ImageQualityAnalyzer, полный анализ и сохранение результатов"""
+    results = {}
+    analyzer = ImageQualityAnalyzer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for megapixels in sizes_mp:
+            image = make_test_image(megapixels)
+            pixels = image.size
+
+            def reload():
+                analyzer.results = {}
+                analyzer.load_array(image)
+
+            cases = [(stage, getattr(analyzer, stage)) for stage in ANALYZER_STAGES]
+            cases.append(('perform_full_analysis', analyzer.perform_full_analysis))
+            for name, func in cases:
+                record = measure(func, reload, repeat)
+                record['throughput'] = pixels / record['wall_s'] / 1e6 if record['wall_s'] > 0 else None
+                record['unit'] = 'Мп/с'
+                results[f"{name}@{megapixels}MP"] = record
+
+            # Функции оценки автофокуса (одна метрика по кадру)
+            for metric in FOCUS_METRICS:
+                record = measure(lambda: analyzer.sharpness_engine.score(image, metric), None, repeat)
+                record['throughput'] = pixels / record['wall_s'] / 1e6 if record['wall_s'] > 0 else None
+                record['unit'] = 'Мп/с'
+                results[f"focus_{metric}@{megapixels}MP"] = record
+
+            analyzer.perform_full_analysis()
+            for extension in ('npz', 'json'):
+                output_file = os.path.join(tmp_dir, f'results.{extension}')
+                record = measure(lambda: analyzer.save_results(output_file), None, repeat)
+                record['throughput'] = 1.0 / record['wall_s'] if record['wall_s'] > 0 else None
+                record['unit'] = 'файл/с'
+                results[f"save_results_{extension}@{megapixels}MP"] = record
+    return results
+
+
+def benchmark_kernels(sizes, repeat=3):
+    """Ядра задач 1-3 моделей освещенности"""
+    l_ap, l_sh, E1, E2 = 5.0, 7.0, 20, 80
+    results = {}
+    for num_pixels in sizes:
+        a = num_pixels * l_sh / 2
+        kernels = {
+            'calculate_task1': lambda: illumination_models.static_edge_matrix(l_ap, l_sh, a, E1, E2, num_pixels),
+            'calculate_task2': lambda: illumination_models.blurred_edge_matrix(l_ap, l_sh, a, a + 40.0, E1, E2, num_pixels),
+            'calculate_task3': lambda: illumination_models.moving_edge_matrix(l_ap, l_sh, a, 100, 1.0, E1, E2, num_pixels),
+        }
+        for name, func in kernels.items():
+            record = measure(func, None, repeat)
+            cells = num_pixels * num_pixels
+            record['throughput'] = cells / record['wall_s'] / 1e6 if record['wall_s'] > 0 else None
+            record['unit'] = 'Мэлем/с'
+            results[f"{name}@{num_pixels}"] = record
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Регрессии: случаи, замедлившиеся относительно базовой линии больше порога"""
+    regressions = {}
+    for name, record in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None or reference['wall_s'] <= 0:
+            continue
+        ratio = record['wall_s'] / reference['wall_s']
+        record['baseline_ratio'] = ratio
+        if ratio > threshold:
+            regressions[name] = ratio
+    return regressions
+
+
+def environment_info():
+    """Описание окружения для сопоставимости базовых линий"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности анализатора и моделей освещенности")
+    parser.add_argument('--full', action='store_true', help="полный набор размеров (до 50 Мп и 16k пикселей)")
+    parser.add_argument('--repeat', type=int, default=3, help="число повторов каждого замера")
+    parser.add_argument('--skip-analyzer', action='store_true', help="не замерять ImageQualityAnalyzer")
+    parser.add_argument('--skip-kernels', action='store_true', help="не замерять ядра задач 1-3")
+    parser.add_argument('--output', default='benchmark_results.json', help="файл результатов")
+    parser.add_argument('--baseline', help="базовая линия для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое отношение времени к базовой линии")
+    args = parser.parse_args()
+
+    sizes_mp = SIZES_MP if args.full else QUICK_SIZES_MP
+    kernel_sizes = KERNEL_SIZES if args.full else QUICK_KERNEL_SIZES
+
+    results = {}
+    if not args.skip_analyzer:
+        results.update(benchmark_analyzer(sizes_mp, args.repeat))
+    if not args.skip_kernels:
+        results.update(benchmark_kernels(kernel_sizes, args.repeat))
+
+    regressions = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+
+    print(f"{'замер':50s} {'время':>13s} {'numpy, МБ':>12s} {'RSS, МБ':>10s} {'пропускная способность':>22s}")
+    for name, record in results.items():
+        throughput = f"{record['throughput']:.2f} {record['unit']}" if record['throughput'] else "-"
+        rss = f"{record['rss_peak_mb']:10.1f}" if record['rss_peak_mb'] is not None else f"{'-':>10s}"
+        flag = "  РЕГРЕССИЯ" if name in regressions else ""
+        print(f"{name:50s} {record['wall_s'] * 1000:10.2f} мс {record['peak_mb']:12.1f} {rss} {throughput:>22s}{flag}")
+    print("\nnumpy - пик по tracemalloc (без выделений OpenCV, занижен для этапов на cv2); "
+          "RSS - прирост пика памяти процесса (Linux)")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment_info(),
+            'threshold': args.threshold,
+            'results': results,
+            'regressions': regressions
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if regressions:
+        print(f"Регрессии производительности: {len(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
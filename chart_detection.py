@@ -0,0 +1,332 @@
+import itertools
+
+import numpy as np
+import cv2
+
+
+class ChartLayout:
+    """Раскладка тест-таблицы в собственных координатах (мм).
+
+    Реперные метки - темные квадраты со светлым квадратным окном; в окне
+    метки ориентации (первой в fiducials) есть темная точка. Участки (patches) -
+    прямоугольники (x, y, ширина, высота) с видом: 'edge', 'gray', 'flat'.
+    """
+
+    def __init__(self, width, height, fiducials, fiducial_size, patches, shapes=None):
+        self.width = float(width)
+        self.height = float(height)
+        # Имя метки -> центр; первая метка - метка ориентации
+        self.fiducials = dict(fiducials)
+        self.fiducial_size = float(fiducial_size)
+        self.patches = dict(patches)
+        # Элементы изображения таблицы для render: (вид, параметры)
+        self.shapes = list(shapes or [])
+
+    def fiducial_points(self):
+        return np.array(list(self.fiducials.values()), dtype=np.float64)
+
+    def render(self, pixels_per_mm=4.0, supersample=4, dtype=np.uint8):
+        """Изображение таблицы (полутоновое) для печати и проверки детектора"""
+        scale = pixels_per_mm * supersample
+        size = (int(round(self.width * scale)), int(round(self.height * scale)))
+        canvas = np.full((size[1], size[0]), 0.6, dtype=np.float32)
+
+        def px(points):
+            return np.round(np.asarray(points, dtype=np.float64) * scale).astype(np.int32)
+
+        for kind, params in self.shapes:
+            if kind == 'rect':
+                (x, y, w, h), value = params
+                cv2.fillConvexPoly(canvas, px([(x, y), (x + w, y), (x + w, y + h), (x, y + h)]), value)
+            elif kind == 'rotated_square':
+                (cx, cy), side, angle, value = params
+                corners = cv2.boxPoints(((cx, cy), (side, side), angle))
+                cv2.fillConvexPoly(canvas, px(corners), value)
+
+        half = self.fiducial_size / 2
+        for index, (cx, cy) in enumerate(self.fiducials.values()):
+            for size_ratio, value in ((1.0, 0.05), (0.5, 0.95)) + (((0.2, 0.05),) if index == 0 else ()):
+                h = half * size_ratio
+                cv2.fillConvexPoly(canvas, px([(cx - h, cy - h), (cx + h, cy - h), (cx + h, cy + h), (cx - h, cy + h)]),
+                                   value)
+
+        image = cv2.resize(canvas, (size[0] // supersample, size[1] // supersample), interpolation=cv2.INTER_AREA)
+        if np.dtype(dtype) == np.float32:
+            return image
+        return np.clip(np.rint(image * np.iinfo(dtype).max), 0, np.iinfo(dtype).max).astype(dtype)
+
+
+def _standard_layout():
+    """Стандартная таблица 280 x 200 мм: наклонные края, ступени серого, поля"""
+    patches = {
+        'edge_vertical': {'kind': 'edge', 'rect': (106.0, 82.0, 28.0, 36.0)},
+        'edge_horizontal': {'kind': 'edge', 'rect': (72.0, 116.0, 36.0, 28.0)},
+        'flat_light': {'kind': 'flat', 'rect': (150.0, 110.0, 55.0, 60.0)},
+        'flat_dark': {'kind': 'flat', 'rect': (212.0, 110.0, 55.0, 60.0)},
+    }
+    shapes = [
+        ('rotated_square', ((90.0, 100.0), 60.0, 5.0, 0.1)),
+        ('rect', ((150.0, 110.0, 55.0, 60.0), 0.9)),
+        ('rect', ((212.0, 110.0, 55.0, 60.0), 0.2)),
+    ]
+    for step in range(6):
+        rect = (150.0 + step * 19.5, 40.0, 19.5, 45.0)
+        patches[f'gray_{step}'] = {'kind': 'gray', 'rect': rect}
+        shapes.append(('rect', (rect, 0.1 + 0.16 * step)))
+
+    fiducials = {
+        'top_left': (15.0, 15.0),
+        'top_right': (265.0, 15.0),
+        'bottom_right': (265.0, 185.0),
+        'bottom_left': (15.0, 185.0),
+    }
+    return ChartLayout(280.0, 200.0, fiducials, 16.0, patches, shapes)
+
+
+STANDARD_LAYOUT = _standard_layout()
+
+
+class ChartDetector:
+    """Поиск тест-таблицы в кадре и перенос участков таблицы на изображение.
+
+    Реперные метки ищутся на уровне пирамиды с большей стороной не больше
+    detect_side, их центры уточняются в полном разрешении, по ним строится
+    гомография таблица -> кадр. Для неподвижного стенда найденная раскладка
+    запоминается: в следующем кадре проверяются только окрестности прежних
+    меток, полный поиск выполняется, если метки сместились больше max_shift пикселей.
+    """
+
+    def __init__(self, layout=STANDARD_LAYOUT, detect_side=800, max_shift=3.0, inset=0.15):
+        self.layout = layout
+        self.detect_side = detect_side
+        self.max_shift = max_shift
+        # Доля отступа внутрь участка с каждой стороны (края участка не анализируются)
+        self.inset = inset
+        self.homography = None
+        self.fiducial_size_px = None
+        # False - центры меток не уточнились в полном разрешении, гомография
+        # построена по грубым точкам уровня пирамиды (точность - около пикселя уровня)
+        self.refined = None
+        self.stats = {'detections': 0, 'cache_hits': 0}
+
+    @staticmethod
+    def _to_uint8(image):
+        if image.dtype == np.uint8:
+            return image
+        return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+    def _find_fiducials(self, level):
+        """Кандидаты меток на уровне пирамиды: (центр, сторона, есть ли точка ориентации)"""
+        image = self._to_uint8(level)
+        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            return []
+        hierarchy = hierarchy[0]
+
+        # Глубина вложенности: четная - внешняя граница темной области, нечетная - отверстие
+        depth = np.zeros(len(contours), dtype=np.int32)
+        for index in range(len(contours)):
+            parent = hierarchy[index][3]
+            while parent >= 0:
+                depth[index] += 1
+                parent = hierarchy[parent][3]
+
+        candidates = []
+        for index, contour in enumerate(contours):
+            # Темный квадрат с отверстием: у внешнего контура есть дочерний (окно)
+            hole = hierarchy[index][2]
+            if hole < 0 or depth[index] % 2:
+                continue
+            area = cv2.contourArea(contour)
+            if area < 36:
+                continue
+            approx = cv2.approxPolyDP(contour, 0.08 * cv2.arcLength(contour, True), True)
+            if len(approx) != 4 or not cv2.isContourConvex(approx):
+                continue
+            hole_area = cv2.contourArea(contours[hole])
+            # Окно метки - четверть площади квадрата (сторона вдвое меньше)
+            if not 0.12 < hole_area / area < 0.45:
+                continue
+            moments = cv2.moments(contour)
+            center = (moments['m10'] / moments['m00'], moments['m01'] / moments['m00'])
+            oriented = hierarchy[hole][2] >= 0
+            candidates.append((center, np.sqrt(area), oriented))
+        return candidates
+
+    def _match_layout(self, candidates):
+        """Выбор четырех меток: метка ориентации и три обычные, упорядоченные как в раскладке"""
+        oriented = [c for c in candidates if c[2]]
+        plain = [c for c in candidates if not c[2]]
+        if not oriented or len(plain) < 3:
+            return None
+
+        target = self.layout.fiducial_points()
+        best = None
+        for origin in oriented:
+            for triple in itertools.combinations(plain, 3):
+                sides = np.array([origin[1]] + [c[1] for c in triple])
+                if sides.max() > 1.5 * sides.min():
+                    continue
+                rest = np.array([c[0] for c in triple])
+                # Обход по часовой стрелке от метки ориентации, как в раскладке
+                points = np.vstack([origin[0], rest])
+                centroid = points.mean(axis=0)
+                angles = np.arctan2(points[:, 1] - centroid[1], points[:, 0] - centroid[0])
+                order = np.argsort((angles - angles[0]) % (2 * np.pi))
+                ordered = points[order]
+                homography, _ = cv2.findHomography(target, ordered)
+                if homography is None:
+                    continue
+                projected = cv2.perspectiveTransform(target[np.newaxis], homography)[0]
+                error = float(np.max(np.linalg.norm(projected - ordered, axis=1)))
+                # Проверка: соотношение сторон четырехугольника меток как в раскладке
+                width = np.linalg.norm(ordered[1] - ordered[0]) + np.linalg.norm(ordered[2] - ordered[3])
+                height = np.linalg.norm(ordered[3] - ordered[0]) + np.linalg.norm(ordered[2] - ordered[1])
+                expected = np.ptp(target[:, 0]) / np.ptp(target[:, 1])
+                ratio_error = abs(np.log((width / height) / expected))
+                score = ratio_error + error / max(sides.mean(), 1.0)
+                if best is None or score < best[0]:
+                    best = (score, ordered, float(sides.mean()))
+        if best is None or best[0] > 0.5:
+            return None
+        return best[1], best[2]
+
+    def _refine(self, gray, center, size):
+        """Уточнение центра метки в полном разрешении: центр масс темных пикселей окна"""
+        height, width = gray.shape
+        half = int(np.ceil(size * 0.9))
+        x, y = int(round(center[0])), int(round(center[1]))
+        x0, y0, x1, y1 = max(x - half, 0), max(y - half, 0), min(x + half + 1, width), min(y + half + 1, height)
+        if x1 - x0 < 4 or y1 - y0 < 4:
+            return None
+        window = self._to_uint8(gray[y0:y1, x0:x1])
+        _, dark = cv2.threshold(window, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(dark)
+        if count < 2:
+            return None
+        # Компонента метки - ближайшая к центру окна среди достаточно крупных
+        local = np.array([x - x0, y - y0], dtype=np.float64)
+        best = None
+        for label in range(1, count):
+            if stats[label, cv2.CC_STAT_AREA] < 0.2 * size * size:
+                continue
+            distance = np.linalg.norm(centroids[label] - local)
+            if best is None or distance < best[0]:
+                best = (distance, label)
+        if best is None:
+            return None
+        # Квадрат с окном и точкой симметричен - центр масс совпадает с центром метки
+        return centroids[best[1]] + np.array([x0, y0], dtype=np.float64)
+
+    def _refine_all(self, gray, points, size):
+        refined = [self._refine(gray, point, size) for point in points]
+        if any(point is None for point in refined):
+            return None
+        return np.array(refined)
+
+    @staticmethod
+    def _has_dot(gray, center, size):
+        """Есть ли в окне метки темная точка ориентации"""
+        x, y = int(round(center[0])), int(round(center[1]))
+        dot = max(int(size * 0.05), 1)
+        offset = max(int(round(size * 0.17)), dot + 1)
+        if not (offset + dot <= x < gray.shape[1] - offset - dot and offset + dot <= y < gray.shape[0] - offset - dot):
+            return False
+        center_mean = gray[y - dot:y + dot + 1, x - dot:x + dot + 1].mean()
+        window_mean = np.mean([gray[y + dy - dot:y + dy + dot + 1, x + dx - dot:x + dx + dot + 1].mean()
+                               for dx, dy in ((offset, 0), (-offset, 0), (0, offset), (0, -offset))])
+        return center_mean < 0.6 * window_mean
+
+    def _set_homography(self, points, size):
+        homography, _ = cv2.findHomography(self.layout.fiducial_points(), points)
+        self.homography = homography
+        self.fiducial_size_px = size
+        return homography
+
+    def detect(self, image_gray, pyramid=None):
+        """Гомография таблица -> кадр; None, если таблица не найдена.
+
+        pyramid - готовая пирамида полутонового изображения (ImageQualityAnalyzer.get_pyramid).
+        Если уточнение меток не удалось, используются грубые точки и self.refined = False.
+        """
+        # Проверка прежней раскладки: метки на старых местах
+        if self.homography is not None:
+            expected = cv2.perspectiveTransform(self.layout.fiducial_points()[np.newaxis], self.homography)[0]
+            refined = self._refine_all(image_gray, expected, self.fiducial_size_px)
+            if (refined is not None and np.max(np.linalg.norm(refined - expected, axis=1)) <= self.max_shift
+                    and self._has_dot(image_gray, refined[0], self.fiducial_size_px)
+                    and not self._has_dot(image_gray, refined[1], self.fiducial_size_px)):
+                self.stats['cache_hits'] += 1
+                self.refined = True
+                return self._set_homography(refined, self.fiducial_size_px)
+
+        if pyramid is None:
+            pyramid = [image_gray]
+            while max(pyramid[-1].shape) > self.detect_side:
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+        index = next((i for i, level in enumerate(pyramid) if max(level.shape) <= self.detect_side),
+                     len(pyramid) - 1)
+        level = pyramid[index]
+        scale_y = image_gray.shape[0] / level.shape[0]
+        scale_x = image_gray.shape[1] / level.shape[1]
+
+        self.stats['detections'] += 1
+        match = self._match_layout(self._find_fiducials(level))
+        if match is None:
+            self.homography = None
+            self.refined = None
+            return None
+        points, size = match
+        # Координаты уровня -> полное разрешение (центры пикселей)
+        points = (points + 0.5) * np.array([scale_x, scale_y]) - 0.5
+        size *= (scale_x + scale_y) / 2
+        refined = self._refine_all(image_gray, points, size)
+        self.refined = refined is not None
+        return self._set_homography(refined if refined is not None else points, size)
+
+    def patch_rois(self, homography=None, shape=None):
+        """Участки таблицы в кадре: {имя: (x, y, ширина, высота)} с отступом inset внутрь"""
+        homography = self.homography if homography is None else homography
+        if homography is None:
+            raise ValueError("Таблица не найдена")
+        rois = {}
+        for name, patch in self.layout.patches.items():
+            x, y, w, h = patch['rect']
+            dx, dy = w * self.inset, h * self.inset
+            corners = np.array([[(x + dx, y + dy), (x + w - dx, y + dy), (x + w - dx, y + h - dy),
+                                 (x + dx, y + h - dy)]], dtype=np.float64)
+            projected = cv2.perspectiveTransform(corners, homography)[0]
+            # Прямоугольник внутри спроецированного четырехугольника (по внутренним сторонам)
+            xs = np.sort(projected[:, 0])
+            ys = np.sort(projected[:, 1])
+            x0, x1 = int(np.ceil(xs[1])), int(np.floor(xs[2]))
+            y0, y1 = int(np.ceil(ys[1])), int(np.floor(ys[2]))
+            if shape is not None:
+                x0, y0 = max(x0, 0), max(y0, 0)
+                x1, y1 = min(x1, shape[1]), min(y1, shape[0])
+            if x1 - x0 >= 8 and y1 - y0 >= 8:
+                rois[name] = (x0, y0, x1 - x0, y1 - y0)
+        return rois
+
+    def analyze(self, analyzer, **params):
+        """Поиск таблицы в изображении анализатора и анализ ее участков.
+
+        Результаты участков - в results['rois'], описание найденной таблицы - в results['chart'].
+        """
+        homography = self.detect(analyzer.image_gray, analyzer.get_pyramid(gray=True))
+        if homography is None:
+            raise ValueError("Тест-таблица не найдена")
+        if not self.refined:
+            analyzer.events.warning("Метки таблицы не уточнены в полном разрешении, "
+                                    "участки найдены по уменьшенному изображению")
+        rois = self.patch_rois(homography, analyzer.image_gray.shape)
+        analyzer.perform_full_analysis(rois=rois, **params)
+        analyzer.results['chart'] = {
+            'homography': homography,
+            'refined': self.refined,
+            'cache_hits': self.stats['cache_hits'],
+            'detections': self.stats['detections'],
+            'patch_kinds': {name: self.layout.patches[name]['kind'] for name in rois}
+        }
+        return analyzer.results
@@ -0,0 +1,272 @@
+import argparse
+import os
+import queue
+import threading
+import time
+
+from VKR2 import ImageQualityAnalyzer
+from chart_detection import ChartDetector
+from analysis_events import LoggingEventSink, ConsoleEventSink
+from result_cache import ResultCache
+from results_db import ResultsDatabase
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# Завершение работы потоков
+_STOP = object()
+
+
+class DirectoryWatcher:
+    """Наблюдение за каталогом и анализ новых и измененных кадров по мере поступления.
+
+    Каталог периодически опрашивается (переносимая замена inotify). Файл ставится
+    в очередь, когда его размер и время изменения не менялись settle_time секунд,
+    то есть запись кадра завершена. Очередь ограничена queue_size: если анализ
+    не успевает за съемкой, опрос приостанавливается, а непоставленные файлы
+    будут найдены при следующем опросе. Кадры анализируют workers потоков (у
+    каждого свой ImageQualityAnalyzer), результаты записываются пакетами одним
+    потоком в базу результатов и/или архив ResultsStore. При chart=True в кадрах
+    ищется тест-таблица и анализируются ее участки (без кэша результатов);
+    раскладка таблицы запоминается детектором потока, поэтому для неподвижного
+    стенда полный поиск меток выполняется только при смещении таблицы.
+    """
+
+    def __init__(self, directory, database=None, store=None, cache=None, workers=2, queue_size=64,
+                 poll_interval=1.0, settle_time=0.5, recursive=False, extensions=IMAGE_EXTENSIONS,
+                 analysis_params=None, events=None, on_result=None, chart=False):
+        self.directory = directory
+        self.database = database
+        self.store = store
+        self.cache = cache
+        self.num_workers = max(int(workers), 1)
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.recursive = recursive
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.analysis_params = analysis_params or {}
+        self.events = events or LoggingEventSink()
+        self.on_result = on_result
+        self.chart = chart
+
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.completed = queue.Queue()
+        # Путь -> (размер, время изменения): обработанные и поставленные в очередь версии
+        self._seen = {}
+        # Путь -> (размер, время изменения, момент первого наблюдения) для файлов в процессе записи
+        self._candidates = {}
+        self._stop = threading.Event()
+        self._threads = []
+        self.stats = {'queued': 0, 'analyzed': 0, 'failed': 0, 'written': 0, 'backpressure': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _iter_files(self):
+        """Файлы изображений каталога (с подкаталогами при recursive=True)"""
+        stack = [self.directory]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        stack.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(self.extensions):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, (stat.st_size, stat.st_mtime_ns)
+
+    def scan_once(self):
+        """Один опрос каталога: постановка завершенных новых и измененных файлов в очередь.
+
+        Возвращает число поставленных файлов.
+        """
+        now = time.monotonic()
+        queued = 0
+        present = set()
+        complete = True
+        for path, signature in sorted(self._iter_files()):
+            present.add(path)
+            if self._seen.get(path) == signature:
+                continue
+
+            candidate = self._candidates.get(path)
+            if candidate is None or candidate[:2] != signature:
+                # Файл новый или еще записывается - ждем стабилизации
+                self._candidates[path] = signature + (now,)
+                if self.settle_time > 0:
+                    continue
+            elif now - candidate[2] < self.settle_time:
+                continue
+
+            try:
+                self.tasks.put(path, timeout=self.poll_interval)
+            except queue.Full:
+                # Анализ не успевает: опрос прерывается, файл будет поставлен позже
+                self._count('backpressure')
+                self.events.warning(f"Очередь анализа заполнена ({self.tasks.maxsize}), опрос приостановлен")
+                complete = False
+                break
+            self._seen[path] = signature
+            self._candidates.pop(path, None)
+            queued += 1
+
+        # Удаленные и переименованные файлы забываются; после прерванного опроса
+        # список файлов неполон, поэтому обработанные версии не трогаются
+        for path in list(self._candidates):
+            if path not in present:
+                del self._candidates[path]
+        if complete:
+            for path in list(self._seen):
+                if path not in present:
+                    del self._seen[path]
+        self._count('queued', queued)
+        return queued
+
+    def _worker(self):
+        analyzer = ImageQualityAnalyzer()
+        detector = ChartDetector() if self.chart else None
+        while True:
+            path = self.tasks.get()
+            try:
+                if path is _STOP:
+                    return
+                if detector is not None:
+                    if not analyzer.load_image(path):
+                        raise ValueError("Не удалось загрузить изображение")
+                    analyzer.results = {}
+                    results = detector.analyze(analyzer, **self.analysis_params)
+                else:
+                    results = analyzer.analyze_file(path, self.cache, **self.analysis_params)
+                if results is None:
+                    raise ValueError("Не удалось загрузить изображение")
+                # Режим таблицы работает без кэша: хэш считает анализатор, индекс кэша не трогается
+                if self.cache is not None and detector is None:
+                    content_hash = self.cache.file_hash(path)
+                else:
+                    content_hash = analyzer.content_hash()
+                self.completed.put((dict(results), os.path.abspath(path), content_hash))
+                self._count('analyzed')
+            except Exception as e:
+                self._count('failed')
+                self.events.error(f"Ошибка анализа {path}", e)
+            finally:
+                self.tasks.task_done()
+
+    def _writer(self, batch_size=64, flush_interval=1.0):
+        """Запись результатов пакетами: одна транзакция на пакет"""
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < batch_size:
+                try:
+                    item = self.completed.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            if self.database is not None:
+                self.database.insert_many(batch)
+            if self.store is not None:
+                for results, path, _ in batch:
+                    self.store.append(results, path)
+            self._count('written', len(batch))
+        except Exception as e:
+            self.events.error("Ошибка записи результатов", e)
+        if self.on_result is not None:
+            for results, path, _ in batch:
+                try:
+                    self.on_result(path, results)
+                except Exception as e:
+                    self.events.error("Ошибка обработчика результата", e)
+
+    def start(self):
+        """Запуск потоков анализа и записи"""
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._worker, name=f"analyzer-{index}", daemon=True)
+                         for index in range(self.num_workers)]
+        self._writer_thread = threading.Thread(target=self._writer, name="results-writer", daemon=True)
+        for thread in self._threads:
+            thread.start()
+        self._writer_thread.start()
+
+    def stop(self, wait=True):
+        """Остановка: поставленные кадры дорабатываются, результаты дописываются"""
+        self._stop.set()
+        for _ in self._threads:
+            self.tasks.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self.completed.put(_STOP)
+        if wait:
+            self._writer_thread.join()
+            if self.store is not None:
+                self.store.flush()
+
+    def run(self, duration=None, once=False):
+        """Цикл опроса до stop(), истечения duration секунд или одного прохода (once)"""
+        self.start()
+        started = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                self.scan_once()
+                if once and not self._candidates:
+                    break
+                if duration is not None and time.monotonic() - started >= duration:
+                    break
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Анализ кадров по мере поступления в каталог")
+    parser.add_argument('directory', help="наблюдаемый каталог")
+    parser.add_argument('--db', default='results.db', help="база результатов SQLite")
+    parser.add_argument('--cache', help="каталог кэша результатов")
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) // 2, 1), help="потоков анализа")
+    parser.add_argument('--queue-size', type=int, default=64, help="предельная длина очереди")
+    parser.add_argument('--interval', type=float, default=1.0, help="период опроса, с")
+    parser.add_argument('--settle', type=float, default=0.5, help="время стабилизации файла, с")
+    parser.add_argument('--recursive', action='store_true', help="включая подкаталоги")
+    parser.add_argument('--once', action='store_true', help="один проход по каталогу")
+    parser.add_argument('--chart', action='store_true', help="анализ участков тест-таблицы")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache) if args.cache else None
+    with ResultsDatabase(args.db) as database:
+        def report(path, results):
+            mtf_50 = results.get('mtf', {}).get('mtf_50')
+            snr_db = results.get('noise', {}).get('snr_db')
+            print(f"{path}: MTF50 = {mtf_50 if mtf_50 is None else round(mtf_50, 4)}, "
+                  f"SNR = {snr_db if snr_db is None else round(snr_db, 2)} дБ")
+
+        watcher = DirectoryWatcher(args.directory, database=database, cache=cache, workers=args.workers,
+                                   queue_size=args.queue_size, poll_interval=args.interval,
+                                   settle_time=args.settle, recursive=args.recursive,
+                                   events=ConsoleEventSink(), on_result=report, chart=args.chart)
+        stats = watcher.run(once=args.once)
+    print(f"Проанализировано: {stats['analyzed']}, ошибок: {stats['failed']}, записано: {stats['written']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+# Модели освещенности фотодиодов матрицы для задач 1-3 (без GUI).
+# l_ap - размер апертуры фотодиода, l_sh - шаг дискретизации (мкм),
+# E1, E2 - уровни освещенности (0-100%), num_pixels - размер матрицы.
+
+
+def _edge_row_values(l_ap, l_sh, a, E1, E2, num_pixels):
+    """Освещенность строк матрицы для резкого края (одинакова вдоль строки)"""
+    n = np.arange(num_pixels)
+    n_a = int((a + l_sh / 2) // l_sh)
+    delta = l_sh * n_a - a
+
+    if delta >= l_ap / 2:
+        edge_value = E2
+    elif delta <= -l_ap / 2:
+        edge_value = E1
+    else:
+        edge_value = ((l_ap / 2 - delta) * E1 + (l_ap / 2 + delta) * E2) / l_ap
+
+    return np.where(n < n_a - 1, E1, np.where(n > n_a - 1, E2, edge_value)).astype(float)
+
+
+def _rows_to_matrix(rows):
+    """Матрица num_pixels x num_pixels из значений по строкам"""
+    return np.repeat(rows[:, np.newaxis], len(rows), axis=1)
+
+
+def static_edge_matrix(l_ap, l_sh, a, E1, E2, num_pixels):
+    """Задача 1: статический резкий край в точке a"""
+    return _rows_to_matrix(_edge_row_values(l_ap, l_sh, a, E1, E2, num_pixels))
+
+
+def blurred_edge_matrix(l_ap, l_sh, a, b, E1, E2, num_pixels):
+    """Задача 2: размытый край с линейным переходом освещенности от a до b"""
+    if b - a > 9:
+        # Значение освещенности у правого края апертуры каждого фотодиода
+        x_right = (np.arange(num_pixels) + 0.5) * l_sh + l_ap / 2
+        rows = np.where(x_right <= a, E1,
+                        np.where(x_right >= b, E2, E1 + (E2 - E1) * (x_right - a) / (b - a)))
+        return _rows_to_matrix(rows.astype(float))
+    return static_edge_matrix(l_ap, l_sh, a, E1, E2, num_pixels)
+
+
+def moving_edge_matrix(l_ap, l_sh, a, shutter_speed, V, E1, E2, num_pixels):
+    """Задача 3: край, движущийся со скоростью V (мм/с) за время экспонирования"""
+    # Время экспонирования
+    t_exp = 1.0 / shutter_speed  # в секундах
+
+    # Расстояние, на которое сместится край за время экспонирования
+    # V в мм/с, нужно перевести в мкм/с
+    V_mkm = V * 1000  # мкм/с
+
+    # Конечное положение границы
+    b = a + V_mkm * t_exp
+
+    # Используем алгоритм из задачи 2 (размытый край)
+    return blurred_edge_matrix(l_ap, l_sh, a, b, E1, E2, num_pixels)
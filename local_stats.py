@@ -0,0 +1,139 @@
+import numpy as np
+import cv2
+
+
+class LocalStatistics:
+    """Локальные статистики в скользящем окне через интегральные изображения.
+
+    Среднее и дисперсия для любого окна k x k считаются за O(1) на пиксель по таблицам
+    сумм (cv2.integral2), края - отражение (BORDER_REFLECT, как cv2.blur по умолчанию
+    и режим 'reflect' scipy.ndimage). Минимум и максимум не разлагаются в суммы, поэтому
+    считаются прямоугольной морфологией OpenCV (сепарабельные erode/dilate, края -
+    повтор). Таблицы строятся один раз и общие для всех размеров окна.
+    """
+
+    def __init__(self, image, dtype=np.float32):
+        self.image = image
+        self.dtype = dtype
+        self._radius = -1
+        self._sum = None
+        self._sqsum = None
+        # Запомненные карты для областей (crop): (статистика, окно) -> карта
+        self._shared_maps = {}
+
+    def _integrals(self, radius):
+        """Таблицы сумм и сумм квадратов с отражением краев на radius пикселей"""
+        if radius > self._radius:
+            # BORDER_REFLECT совпадает с режимом 'reflect' scipy.ndimage
+            padded = cv2.copyMakeBorder(self.image, radius, radius, radius, radius, cv2.BORDER_REFLECT)
+            # float64 обязателен: сумма по 50-Мп кадру превышает точность float32
+            self._sum, self._sqsum = cv2.integral2(padded, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+            self._radius = radius
+        return self._sum, self._sqsum
+
+    def _window_sum(self, table, window):
+        """Сумма по окну window x window с центром в каждом пикселе"""
+        radius = window // 2
+        offset = self._radius - radius
+        height, width = self.image.shape[:2]
+        top, left = offset, offset
+        bottom, right = offset + window, offset + window
+        return (table[bottom:bottom + height, right:right + width]
+                - table[top:top + height, right:right + width]
+                - table[bottom:bottom + height, left:left + width]
+                + table[top:top + height, left:left + width])
+
+    @staticmethod
+    def _check_window(window):
+        if window < 1 or window % 2 == 0:
+            raise ValueError(f"Размер окна должен быть нечетным положительным: {window}")
+
+    def mean(self, window):
+        """Локальное среднее"""
+        self._check_window(window)
+        table, _ = self._integrals(window // 2)
+        return (self._window_sum(table, window) / (window * window)).astype(self.dtype)
+
+    def variance(self, window):
+        """Локальная дисперсия E[x^2] - E[x]^2"""
+        self._check_window(window)
+        table, sqtable = self._integrals(window // 2)
+        area = float(window * window)
+        mean = self._window_sum(table, window) / area
+        variance = self._window_sum(sqtable, window) / area - mean ** 2
+        np.maximum(variance, 0, out=variance)
+        return variance.astype(self.dtype)
+
+    def std(self, window):
+        """Локальное стандартное отклонение"""
+        return np.sqrt(self.variance(window))
+
+    def minimum(self, window):
+        """Локальный минимум (края - повтор, как у ранговых фильтров)"""
+        self._check_window(window)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (window, window))
+        return cv2.erode(self.image, kernel, borderType=cv2.BORDER_REPLICATE)
+
+    def maximum(self, window):
+        """Локальный максимум"""
+        self._check_window(window)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (window, window))
+        return cv2.dilate(self.image, kernel, borderType=cv2.BORDER_REPLICATE)
+
+    def crop(self, rows, cols):
+        """Статистики прямоугольной области (срезы rows, cols) без пересчета.
+
+        Карты всего изображения вычисляются один раз и запоминаются; область
+        получает их срезы (представления). Используется для нескольких ROI внутри
+        общего охватывающего прямоугольника.
+        """
+        return CroppedStatistics(self, rows, cols)
+
+    def shared_map(self, name, window):
+        """Карта статистики name с окном window, вычисляемая один раз"""
+        key = (name, window)
+        if key not in self._shared_maps:
+            self._shared_maps[key] = getattr(self, name)(window)
+        return self._shared_maps[key]
+
+    def enhance_contrast(self, window):
+        """Замена пикселя ближайшим из локальных минимума и максимума
+        (аналог skimage.filters.rank.enhance_contrast)"""
+        local_min = self.minimum(window)
+        local_max = self.maximum(window)
+        # Разности в знаковом типе, чтобы не было переполнения беззнаковых целых
+        image = self.image.astype(np.int32) if np.issubdtype(self.image.dtype, np.integer) else self.image
+        closer_to_max = (local_max - image) < (image - local_min)
+        return np.where(closer_to_max, local_max, local_min)
+
+
+class CroppedStatistics:
+    """Срез локальных статистик общего изображения для одной области"""
+
+    def __init__(self, parent, rows, cols):
+        self.parent = parent
+        self.rows = rows
+        self.cols = cols
+        self.image = parent.image[rows, cols]
+        self.dtype = parent.dtype
+
+    def _map(self, name, window):
+        return self.parent.shared_map(name, window)[self.rows, self.cols]
+
+    def mean(self, window):
+        return self._map('mean', window)
+
+    def variance(self, window):
+        return self._map('variance', window)
+
+    def std(self, window):
+        return self._map('std', window)
+
+    def minimum(self, window):
+        return self._map('minimum', window)
+
+    def maximum(self, window):
+        return self._map('maximum', window)
+
+    def enhance_contrast(self, window):
+        return self._map('enhance_contrast', window)
@@ -0,0 +1,196 @@
+import numpy as np
+
+
+def block_statistics(image, block_size=8, strip_blocks=64, dtype=np.float32):
+    """Статистики неперекрывающихся блоков с потоковой обработкой полосами.
+
+    В память одновременно приводится к вещественному типу только полоса из strip_blocks
+    рядов блоков. Возвращает карты блоков (ряды x столбцы): среднее, дисперсию,
+    оценку шума по разностям соседних пикселей и средний квадрат сигнала.
+    """
+    height, width = image.shape[:2]
+    rows, cols = height // block_size, width // block_size
+    if rows == 0 or cols == 0:
+        raise ValueError("Изображение меньше размера блока")
+
+    block_mean = np.empty((rows, cols), dtype=np.float64)
+    block_var = np.empty((rows, cols), dtype=np.float64)
+    block_diff_var = np.empty((rows, cols), dtype=np.float64)
+    block_power = np.empty((rows, cols), dtype=np.float64)
+
+    crop_w = cols * block_size
+    for row0 in range(0, rows, strip_blocks):
+        row1 = min(row0 + strip_blocks, rows)
+        strip = image[row0 * block_size:row1 * block_size, :crop_w].astype(dtype)
+        blocks = strip.reshape(row1 - row0, block_size, cols, block_size)
+
+        mean = blocks.mean(axis=(1, 3), dtype=np.float64)
+        power = np.square(blocks).mean(axis=(1, 3), dtype=np.float64)
+        block_mean[row0:row1] = mean
+        block_power[row0:row1] = power
+        block_var[row0:row1] = np.maximum(power - mean ** 2, 0)
+
+        # Оценка шума по разностям соседних пикселей внутри блока: для плоского
+        # участка var(x[i] - x[i+1]) = 2 * sigma^2, плавный перепад почти не влияет
+        diff_h = np.diff(blocks, axis=3)
+        diff_v = np.diff(blocks, axis=1)
+        diff_power = (np.square(diff_h).mean(axis=(1, 3), dtype=np.float64)
+                      + np.square(diff_v).mean(axis=(1, 3), dtype=np.float64)) / 2
+        block_diff_var[row0:row1] = diff_power / 2
+
+    return {
+        'block_size': block_size,
+        'mean': block_mean,
+        'variance': block_var,
+        'diff_variance': block_diff_var,
+        'power': block_power
+    }
+
+
+def select_flat_blocks(stats, levels, num_bins=16, max_structure_ratio=1.5):
+    """Маска плоских блоков и номера интервалов яркости блоков.
+
+    Блок плоский, если его дисперсия близка к оценке шума по разностям соседних
+    пикселей: края, текстура и перепады увеличивают дисперсию блока намного сильнее.
+    """
+    mean, variance, diff_variance = stats['mean'], stats['variance'], stats['diff_variance']
+
+    bin_index = np.clip((mean / levels * num_bins).astype(np.int64), 0, num_bins - 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        structure_ratio = np.where(diff_variance > 0, variance / diff_variance, np.inf)
+    flat = structure_ratio <= max_structure_ratio
+
+    return flat, bin_index
+
+
+def noise_curve(stats, flat, bin_index, num_bins=16, min_blocks=3):
+    """Сигнал-зависимый шум: СКО шума по интервалам яркости (по плоским блокам)"""
+    flat_bins = bin_index[flat]
+    counts = np.bincount(flat_bins, minlength=num_bins)
+    mean_sums = np.bincount(flat_bins, weights=stats['mean'][flat], minlength=num_bins)
+    valid = counts >= min_blocks
+
+    intensity = []
+    noise_std = []
+    for b in np.nonzero(valid)[0]:
+        in_bin = flat & (bin_index == b)
+        intensity.append(mean_sums[b] / counts[b])
+        # Медиана устойчива к единичным блокам с остаточной структурой
+        noise_std.append(np.sqrt(np.median(stats['diff_variance'][in_bin])))
+
+    return {
+        'intensity': np.array(intensity, dtype=np.float64),
+        'noise_std': np.array(noise_std, dtype=np.float64),
+        'block_count': counts[valid].astype(np.int64)
+    }
+
+
+def block_mask(mask, block_size):
+    """Блоки, целиком лежащие внутри маски пикселей"""
+    rows, cols = mask.shape[0] // block_size, mask.shape[1] // block_size
+    blocks = mask[:rows * block_size, :cols * block_size].reshape(rows, block_size, cols, block_size)
+    return blocks.all(axis=(1, 3))
+
+
+def estimate_noise(image, levels, block_size=8, num_bins=16, max_structure_ratio=1.5,
+                   strip_blocks=64, dtype=np.float32, mask=None):
+    """Оценка шума только по плоским участкам изображения.
+
+    mask - маска пикселей области: учитываются только блоки, целиком лежащие в ней.
+    """
+    stats = block_statistics(image, block_size, strip_blocks, dtype)
+    inside = block_mask(mask, block_size) if mask is not None else np.ones(stats['mean'].shape, dtype=bool)
+    if not np.any(inside):
+        raise ValueError("В области нет ни одного целого блока")
+    flat, bin_index = select_flat_blocks(stats, levels, num_bins, max_structure_ratio)
+    flat &= inside
+    curve = noise_curve(stats, flat, bin_index, num_bins)
+
+    if np.any(flat):
+        noise_variance = float(np.median(stats['diff_variance'][flat]))
+    else:
+        # Плоских участков нет - нижний квартиль оценок по разностям
+        noise_variance = float(np.percentile(stats['diff_variance'][inside], 25))
+
+    return {
+        'noise_variance': noise_variance,
+        'signal_power': float(np.mean(stats['power'][inside])),
+        'flat_fraction': float(np.sum(flat) / np.sum(inside)),
+        'flat_blocks': int(np.sum(flat)),
+        'curve': curve
+    }
+
+
+class RunningStatistics:
+    """Попиксельные среднее и дисперсия по потоку кадров (алгоритм Уэлфорда, float32).
+
+    Кадры не накапливаются: в памяти только карты среднего, суммы квадратов
+    отклонений и один рабочий буфер.
+    """
+
+    def __init__(self, dtype=np.float32):
+        self.dtype = dtype
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+        self._delta = None
+        self._residual = None
+
+    def update(self, frame):
+        """Добавление кадра"""
+        if self.mean is None:
+            self.mean = np.zeros(frame.shape, dtype=self.dtype)
+            self._m2 = np.zeros(frame.shape, dtype=self.dtype)
+            self._delta = np.empty(frame.shape, dtype=self.dtype)
+            self._residual = np.empty(frame.shape, dtype=self.dtype)
+        elif frame.shape != self.mean.shape:
+            raise ValueError(f"Размер кадра {frame.shape} не совпадает со стеком {self.mean.shape}")
+
+        self.count += 1
+        # delta = x - mean; mean += delta / n; m2 += delta * (x - mean_new)
+        np.subtract(frame, self.mean, out=self._delta, casting='unsafe')
+        np.divide(self._delta, self.dtype(self.count), out=self._residual)
+        self.mean += self._residual
+        np.subtract(frame, self.mean, out=self._residual, casting='unsafe')
+        self._delta *= self._residual
+        self._m2 += self._delta
+
+    @property
+    def variance(self):
+        """Несмещенная временная дисперсия каждого пикселя"""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self._m2 / self.dtype(self.count - 1)
+
+
+def photon_transfer_points(mean_map, variance_map, levels, num_bins=32, min_pixels=16):
+    """Точки кривой фотонного переноса: временная дисперсия по уровням сигнала пикселей"""
+    bin_index = np.clip((mean_map / levels * num_bins).astype(np.int64), 0, num_bins - 1).ravel()
+    counts = np.bincount(bin_index, minlength=num_bins)
+    signal_sums = np.bincount(bin_index, weights=mean_map.ravel(), minlength=num_bins)
+    variance_sums = np.bincount(bin_index, weights=variance_map.ravel(), minlength=num_bins)
+    valid = counts >= min_pixels
+    return {
+        'signal': signal_sums[valid] / counts[valid],
+        'variance': variance_sums[valid] / counts[valid],
+        'pixel_count': counts[valid].astype(np.int64)
+    }
+
+
+def fit_conversion_gain(signal, variance, saturation_level=None):
+    """Линейный участок КФП: variance = signal / K + read_variance.
+
+    Возвращает коэффициент преобразования K (e-/DN) и дисперсию шума считывания (DN^2).
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    variance = np.asarray(variance, dtype=np.float64)
+    linear = np.ones(len(signal), dtype=bool)
+    if saturation_level is not None:
+        # Отбрасываем точки у насыщения, где дисперсия падает
+        linear = signal < 0.9 * saturation_level
+    if np.sum(linear) < 2:
+        return None, None
+    slope, intercept = np.polyfit(signal[linear], variance[linear], 1)
+    gain = float(1.0 / slope) if slope > 0 else None
+    return gain, float(max(intercept, 0.0))
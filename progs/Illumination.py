@@ -1,3 +1,5 @@
+import os
+import sys
 import tkinter as tk
 from tkinter import ttk, messagebox
 import numpy as np
@@ -6,6 +8,10 @@ from matplotlib.ticker import PercentFormatter
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.figure
 
+# Модели освещенности - в модуле illumination_models в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from illumination_models import static_edge_matrix, blurred_edge_matrix, moving_edge_matrix
+
 
 class IlluminationCalculatorApp:
 
@@ -308,10 +314,17 @@ class IlluminationCalculatorApp:
         # Создание полей ввода
         row = 0
         for param, default_val in default_values.items():
-            label_text = f"{param} ({'мкм' if param not in ['E1', 'E2', 'num_pixels', 'V', 'shutter_speed'] 
-            else '%' if param in ['E1', 'E2'] 
-            else 'мм\с' if param in ['V']
-            else 'c^-1' if param in ['shutter_speed'] else ''}):"
+            if param in ['E1', 'E2']:
+                unit = '%'
+            elif param == 'V':
+                unit = 'мм/с'
+            elif param == 'shutter_speed':
+                unit = 'c^-1'
+            elif param == 'num_pixels':
+                unit = ''
+            else:
+                unit = 'мкм'
+            label_text = f"{param} ({unit}):"
 
             label = tk.Label(
                 params_frame,
@@ -500,24 +513,7 @@ num_pixels - размер матрицы
         l_ap, l_sh, a, E1, E2, num_pixels = params['l_ap'], params['l_sh'], params['a'], params['E1'], params['E2'], \
             params['num_pixels']
 
-        n_a = int((a + l_sh / 2) // l_sh)
-        matrix = np.zeros((num_pixels, num_pixels))
-
-        for n in range(num_pixels):
-            for m in range(num_pixels):
-                if n < n_a - 1:
-                    matrix[n, m] = E1
-                elif n > n_a - 1:
-                    matrix[n, m] = E2
-                else:
-                    delta = l_sh * n_a - a
-
-                    if delta >= l_ap / 2:
-                        matrix[n, m] = E2
-                    elif delta <= -l_ap / 2:
-                        matrix[n, m] = E1
-                    else:
-                        matrix[n, m] = ((l_ap / 2 - delta) * E1 + (l_ap / 2 + delta) * E2) / l_ap
+        matrix = static_edge_matrix(l_ap, l_sh, a, E1, E2, num_pixels)
 
         self.task1_results = (matrix, params)
 
@@ -541,38 +537,7 @@ num_pixels - размер матрицы
         l_ap, l_sh, a, b, E1, E2, num_pixels = params['l_ap'], params['l_sh'], params['a'], params['b'], params['E1'], \
             params['E2'], params['num_pixels']
 
-        def E(x):
-            if x <= a:
-                return E1
-            elif x >= b:
-                return E2
-            else:
-                return E1 + (E2 - E1) * (x - a) / (b - a)
-
-        matrix = np.zeros((num_pixels, num_pixels))
-        n_a = int((a + l_sh / 2) // l_sh)
-        if b - a > 9:
-            for n in range(num_pixels):
-                for m in range(num_pixels):
-                    x_right = (n + 0.5) * l_sh + l_ap / 2
-                    # x_right = E1 + (E2 - E1) * (n * l_sh - a) / (b - a)
-                    matrix[n, m] = E(x_right)
-        else:
-            for n in range(num_pixels):
-                for m in range(num_pixels):
-                    if n < n_a - 1:
-                        matrix[n, m] = E1
-                    elif n > n_a - 1:
-                        matrix[n, m] = E2
-                    else:
-                        delta = l_sh * n_a - a
-
-                        if delta >= l_ap / 2:
-                            matrix[n, m] = E2
-                        elif delta <= -l_ap / 2:
-                            matrix[n, m] = E1
-                        else:
-                            matrix[n, m] = ((l_ap / 2 - delta) * E1 + (l_ap / 2 + delta) * E2) / l_ap
+        matrix = blurred_edge_matrix(l_ap, l_sh, a, b, E1, E2, num_pixels)
 
         self.task2_results = (matrix, params)
 
@@ -598,49 +563,7 @@ num_pixels - размер матрицы
             params['V'], params['E1'], params['E2'], params['num_pixels']
         )
 
-        # Время экспонирования
-        t_exp = 1.0 / shutter_speed  # в секундах
-
-        # Расстояние, на которое сместится край за время экспонирования
-        # V в мм/с, нужно перевести в мкм/с
-        V_mkm = V * 1000  # мкм/с
-
-        # Конечное положение границы
-        b = a + V_mkm * t_exp
-
-        # Используем алгоритм из задачи 2 (размытый край)
-        def E(x):
-            if x <= a:
-                return E1
-            elif x >= b:
-                return E2
-            else:
-                return E1 + (E2 - E1) * (x - a) / (b - a)
-
-        matrix = np.zeros((num_pixels, num_pixels))
-
-        if b - a > 9:
-            for n in range(num_pixels):
-                for m in range(num_pixels):
-                    x_right = (n + 0.5) * l_sh + l_ap / 2
-                    matrix[n, m] = E(x_right)
-        else:
-            n_a = int((a + l_sh / 2) // l_sh)
-            for n in range(num_pixels):
-                for m in range(num_pixels):
-                    if n < n_a - 1:
-                        matrix[n, m] = E1
-                    elif n > n_a - 1:
-                        matrix[n, m] = E2
-                    else:
-                        delta = l_sh * n_a - a
-
-                        if delta >= l_ap / 2:
-                            matrix[n, m] = E2
-                        elif delta <= -l_ap / 2:
-                            matrix[n, m] = E1
-                        else:
-                            matrix[n, m] = ((l_ap / 2 - delta) * E1 + (l_ap / 2 + delta) * E2) / l_ap
+        matrix = moving_edge_matrix(l_ap, l_sh, a, shutter_speed, V, E1, E2, num_pixels)
 
         self.task3_results = (matrix, params)
 
@@ -0,0 +1,148 @@
+import numpy as np
+import cv2
+
+
+# Параметры SSIM по Wang et al. (2004): гауссово окно sigma = 1.5, 11 x 11
+SSIM_SIGMA = 1.5
+SSIM_WINDOW = 11
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+# Веса масштабов MS-SSIM (Wang, Simoncelli, Bovik, 2003)
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+
+
+def _gaussian(image):
+    """Сепарабельное гауссово сглаживание окна SSIM в float32"""
+    return cv2.GaussianBlur(image, (SSIM_WINDOW, SSIM_WINDOW), SSIM_SIGMA, borderType=cv2.BORDER_REFLECT)
+
+
+def _downsample(image):
+    """Уменьшение в 2 раза усреднением 2 x 2"""
+    height, width = image.shape
+    return cv2.resize(image, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+
+
+class _ReferenceScale:
+    """Эталон на одном масштабе: изображение и его локальные статистики"""
+
+    def __init__(self, reference):
+        self.image = reference
+        self.mu = _gaussian(reference)
+        self.sigma_sq = _gaussian(reference * reference) - self.mu * self.mu
+
+
+class ReferenceComparator:
+    """Сравнение кадров с эталоном: PSNR, SSIM и MS-SSIM.
+
+    Статистики эталона вычисляются один раз и переиспользуются для пакета кадров.
+    Кадр обрабатывается полосами по tile_rows строк с перекрытием на радиус окна,
+    поэтому временные массивы кадра ограничены размером полосы.
+    """
+
+    def __init__(self, reference, data_range=255.0, tile_rows=1024, scales=len(MS_SSIM_WEIGHTS)):
+        reference = np.asarray(reference)
+        if reference.ndim == 3:
+            reference = cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY)
+        self.shape = reference.shape
+        self.data_range = float(data_range)
+        self.tile_rows = int(tile_rows)
+        self.c1 = (SSIM_K1 * self.data_range) ** 2
+        self.c2 = (SSIM_K2 * self.data_range) ** 2
+
+        # Число масштабов ограничено размером: на последнем окно должно помещаться в кадр
+        max_scales = 1
+        while max_scales < scales and min(self.shape) // (2 ** max_scales) >= SSIM_WINDOW:
+            max_scales += 1
+        weights = np.array(MS_SSIM_WEIGHTS[:max_scales], dtype=np.float64)
+        self.weights = weights / weights.sum()
+
+        self.scales = []
+        level = reference.astype(np.float32)
+        for index in range(max_scales):
+            if index > 0:
+                level = _downsample(level)
+            self.scales.append(_ReferenceScale(level))
+
+    def _ssim_sums(self, frame, scale):
+        """Суммы SSIM и контрастно-структурного члена по внутренней области кадра"""
+        ref = self.scales[scale]
+        height, width = ref.image.shape
+        pad = (SSIM_WINDOW - 1) // 2
+
+        ssim_sum = 0.0
+        cs_sum = 0.0
+        for row0 in range(0, height, self.tile_rows):
+            row1 = min(row0 + self.tile_rows, height)
+            # Полоса с перекрытием на радиус окна - результат совпадает с обработкой целиком
+            halo0, halo1 = max(row0 - pad, 0), min(row1 + pad, height)
+            x = frame[halo0:halo1]
+            y = ref.image[halo0:halo1]
+            mu_x = _gaussian(x)[row0 - halo0:row1 - halo0]
+            sigma_x_sq = _gaussian(x * x)[row0 - halo0:row1 - halo0] - mu_x * mu_x
+            sigma_xy = _gaussian(x * y)[row0 - halo0:row1 - halo0]
+            mu_y = ref.mu[row0:row1]
+            sigma_y_sq = ref.sigma_sq[row0:row1]
+            sigma_xy -= mu_x * mu_y
+
+            cs_map = (2 * sigma_xy + self.c2) / (sigma_x_sq + sigma_y_sq + self.c2)
+            luminance = (2 * mu_x * mu_y + self.c1) / (mu_x * mu_x + mu_y * mu_y + self.c1)
+
+            # Краевые строки и столбцы шириной pad исключаются (как в skimage)
+            inner0, inner1 = max(pad - row0, 0), min(height - pad, row1) - row0
+            if inner1 <= inner0:
+                continue
+            cs_inner = cs_map[inner0:inner1, pad:width - pad]
+            ssim_sum += float(np.sum(cs_inner * luminance[inner0:inner1, pad:width - pad], dtype=np.float64))
+            cs_sum += float(np.sum(cs_inner, dtype=np.float64))
+
+        count = max(height - 2 * pad, 1) * max(width - 2 * pad, 1)
+        return ssim_sum / count, cs_sum / count
+
+    def _psnr(self, frame):
+        """PSNR по полосам"""
+        reference = self.scales[0].image
+        squared_error = 0.0
+        for row0 in range(0, self.shape[0], self.tile_rows):
+            diff = frame[row0:row0 + self.tile_rows] - reference[row0:row0 + self.tile_rows]
+            squared_error += float(np.sum(diff * diff, dtype=np.float64))
+        mse = squared_error / (self.shape[0] * self.shape[1])
+        if mse == 0:
+            return float('inf')
+        return float(10 * np.log10(self.data_range ** 2 / mse))
+
+    def score(self, frame):
+        """PSNR, SSIM и MS-SSIM кадра относительно эталона"""
+        frame = np.asarray(frame)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if frame.shape != self.shape:
+            raise ValueError(f"Размер кадра {frame.shape} не совпадает с эталоном {self.shape}")
+
+        level = frame.astype(np.float32)
+        psnr = self._psnr(level)
+
+        cs_values = []
+        ssim_value = None
+        for scale in range(len(self.scales)):
+            if scale > 0:
+                level = _downsample(level)
+            ssim_scale, cs_scale = self._ssim_sums(level, scale)
+            if scale == 0:
+                ssim_value = ssim_scale
+            cs_values.append(cs_scale)
+
+        # MS-SSIM: контрастно-структурные члены на всех масштабах и SSIM на последнем
+        factors = np.maximum(np.array(cs_values[:-1] + [ssim_scale]), 0.0)
+        ms_ssim = float(np.prod(factors ** self.weights))
+
+        return {
+            'psnr_db': psnr,
+            'ssim': float(ssim_value),
+            'ms_ssim': ms_ssim,
+            'scales': len(self.scales)
+        }
+
+    def score_batch(self, frames):
+        """Оценка пакета кадров относительно одного закэшированного эталона"""
+        return [self.score(frame) for frame in frames]
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from results_db import file_hash
+from results_store import save_npz, load_npz
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'image_quality')
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+
+class ResultCache:
+    """Дисковый кэш результатов анализа по хэшу содержимого и конфигурации.
+
+    Ключ записи - хэш содержимого изображения и описания конфигурации
+    анализатора (версия, разрядность, точность, параметры). Для файлов хэш
+    запоминается по (размер, время изменения), поэтому неизмененный файл не
+    читается повторно. Общий размер записей ограничен max_bytes, при
+    превышении удаляются давно не использованные (LRU).
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    size_bytes INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash, config):
+        """Ключ записи: хэш содержимого и конфигурации анализатора"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(content_hash.encode('ascii'))
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def file_hash(self, path):
+        """Хэш содержимого файла; для неизмененного файла берется из индекса без чтения"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        content_hash = file_hash(path)
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, content_hash))
+        return content_hash
+
+    def get(self, key):
+        """Результаты по ключу или None.
+
+        Результаты проходят через .npz: массивы и скаляры numpy возвращаются
+        как есть, списки и кортежи - списками и кортежами (значения - типы Python).
+        """
+        filename = self._entry_path(key)
+        try:
+            # Разбор заголовка .npz в numpy не рассчитан на параллельные потоки - чтение по одному
+            with self._load_lock:
+                results = load_npz(filename)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception:
+            # Поврежденная или недочитываемая запись - промах, запись удаляется
+            with self._lock:
+                self.misses += 1
+            self._discard(key)
+            return None
+        with self._lock, self.connection:
+            self.connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return results
+
+    def put(self, key, results):
+        """Сохранение результатов и вытеснение старых записей сверх лимита размера"""
+        filename = self._entry_path(key)
+        # Запись во временный файл и переименование: читатели не видят частичный файл
+        temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        save_npz(results, temporary)
+        os.replace(temporary, filename)
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                    (key, os.path.getsize(filename), time.time()))
+        self.evict()
+
+    def _discard(self, key):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Удаление давно не использованных записей, пока размер кэша больше max_bytes"""
+        with self._lock, self.connection:
+            total = self.connection.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = []
+            for key, size in self.connection.execute(
+                    "SELECT key, size_bytes FROM entries ORDER BY last_access ASC"):
+                if total <= self.max_bytes:
+                    break
+                removed.append(key)
+                total -= size
+            self.connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in removed])
+        for key in removed:
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+        return len(removed)
+
+    def size_bytes(self):
+        with self._lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self):
+        """Удаление всех записей кэша"""
+        with self._lock, self.connection:
+            keys = [row[0] for row in self.connection.execute("SELECT key FROM entries")]
+            self.connection.execute("DELETE FROM entries")
+        for key in keys:
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+
+    def close(self):
+        self.connection.close()
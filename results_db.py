@@ -0,0 +1,202 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from results_store import flatten_results
+
+
+# Индексируемые столбцы: имя столбца -> (раздел результатов, ключ)
+METRIC_COLUMNS = {
+    'mtf_50': ('mtf', 'mtf_50'),
+    'mtf_10': ('mtf', 'mtf_10'),
+    'tenengrad': ('sharpness', 'tenengrad'),
+    'laplacian_variance': ('sharpness', 'laplacian_variance'),
+    'snr_db': ('noise', 'snr_db'),
+    'noise_std': ('noise', 'noise_std'),
+    'michelson_contrast': ('contrast', 'michelson_contrast'),
+    'rms_contrast': ('contrast', 'rms_contrast'),
+    'effective_resolution': ('resolution', 'effective_resolution'),
+    'aliasing_measure': ('discretization_artifacts', 'aliasing_measure'),
+}
+INDEXED_COLUMNS = ('mtf_50', 'tenengrad', 'snr_db', 'michelson_contrast', 'rms_contrast')
+
+HASH_CHUNK = 1 << 20
+
+
+def file_hash(path):
+    """Хэш содержимого файла (BLAKE2b, 128 бит), чтение блоками"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def array_hash(image):
+    """Хэш декодированного изображения: форма, тип и пиксели"""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}{image.dtype.str}".encode('ascii'))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class ResultsDatabase:
+    """Локальная база результатов (SQLite) с индексами по основным метрикам.
+
+    Запись идентифицируется путем к файлу: повторный анализ того же файла (в
+    том числе после изменения содержимого) заменяет запись, хэш содержимого
+    хранится для поиска. Все скалярные результаты хранятся в столбце metrics,
+    основные метрики - в отдельных индексированных столбцах.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    @staticmethod
+    def _table_sql(name):
+        metric_columns = ''.join(f", {column} REAL" for column in METRIC_COLUMNS)
+        return f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                content_hash TEXT NOT NULL,
+                analyzed_at REAL NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                bit_depth INTEGER{metric_columns},
+                metrics TEXT
+            )"""
+
+    def _migrate(self):
+        """Перевод базы старой схемы (уникальна пара путь + хэш) на уникальный путь.
+
+        Для каждого пути остается последний анализ.
+        """
+        row = self.connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'analyses'").fetchone()
+        if row is None or 'UNIQUE (path, content_hash)' not in row[0]:
+            return
+        columns = ['path', 'content_hash', 'analyzed_at', 'width', 'height', 'bit_depth'] + list(METRIC_COLUMNS) \
+            + ['metrics']
+        with self.connection:
+            self.connection.execute(self._table_sql('analyses_new'))
+            self.connection.execute(
+                f"INSERT INTO analyses_new ({', '.join(columns)}) SELECT {', '.join(columns)} FROM analyses "
+                "WHERE id IN (SELECT id FROM analyses AS a WHERE a.analyzed_at = "
+                "(SELECT MAX(analyzed_at) FROM analyses AS b WHERE b.path = a.path) GROUP BY path)")
+            self.connection.execute("DROP TABLE analyses")
+            self.connection.execute("ALTER TABLE analyses_new RENAME TO analyses")
+
+    def _create_schema(self):
+        self._migrate()
+        with self.connection:
+            self.connection.execute(self._table_sql('analyses'))
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_analyses_hash ON analyses (content_hash)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_analyses_time ON analyses (analyzed_at)")
+            for name in INDEXED_COLUMNS:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_analyses_{name} ON analyses ({name})")
+
+    @staticmethod
+    def _row(results, path, content_hash, analyzed_at=None):
+        """Значения строки таблицы из результатов анализа"""
+        def value(section, key):
+            item = results.get(section, {}).get(key)
+            return None if item is None else float(item)
+
+        resolution = results.get('resolution', {})
+        scalars, _ = flatten_results(results)
+        row = {
+            'path': str(path),
+            'content_hash': content_hash,
+            'analyzed_at': time.time() if analyzed_at is None else analyzed_at,
+            'width': resolution.get('width_pixels'),
+            'height': resolution.get('height_pixels'),
+            'bit_depth': results.get('discretization_artifacts', {}).get('bit_depth'),
+        }
+        row.update({name: value(*source) for name, source in METRIC_COLUMNS.items()})
+        row['metrics'] = json.dumps(scalars, ensure_ascii=False)
+        return row
+
+    def insert_many(self, entries):
+        """Добавление пакета (results, path, content_hash) одной транзакцией"""
+        rows = [self._row(results, path, content_hash) for results, path, content_hash in entries]
+        if not rows:
+            return 0
+        columns = list(rows[0])
+        placeholders = ', '.join(f":{name}" for name in columns)
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO analyses ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def insert(self, results, path, content_hash):
+        """Добавление или замена результатов одного изображения"""
+        return self.insert_many([(results, path, content_hash)])
+
+    def _check_column(self, column):
+        if column not in METRIC_COLUMNS and column not in ('analyzed_at', 'width', 'height', 'bit_depth'):
+            raise ValueError(f"Неизвестный столбец: {column}")
+
+    def query(self, order_by='mtf_50', ascending=True, limit=100, since=None, until=None, **ranges):
+        """Выборка записей, отсортированных по метрике.
+
+        since/until - границы времени анализа (Unix time), ranges - диапазоны
+        метрик вида mtf_50=(0.1, 0.3); граница None не ограничивает.
+        """
+        self._check_column(order_by)
+        conditions = [f"{order_by} IS NOT NULL"]
+        params = []
+        if since is not None:
+            conditions.append("analyzed_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("analyzed_at < ?")
+            params.append(until)
+        for column, (low, high) in ranges.items():
+            self._check_column(column)
+            if low is not None:
+                conditions.append(f"{column} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{column} <= ?")
+                params.append(high)
+
+        columns = ['path', 'content_hash', 'analyzed_at', 'width', 'height', 'bit_depth'] + list(METRIC_COLUMNS)
+        sql = (f"SELECT {', '.join(columns)} FROM analyses WHERE {' AND '.join(conditions)} "
+               f"ORDER BY {order_by} {'ASC' if ascending else 'DESC'} LIMIT ?")
+        cursor = self.connection.execute(sql, params + [int(limit)])
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def worst(self, metric='mtf_50', limit=100, days=None):
+        """Худшие изображения по метрике (меньше - хуже), за последние days суток"""
+        since = time.time() - days * 86400 if days is not None else None
+        return self.query(order_by=metric, ascending=True, limit=limit, since=since)
+
+    def lookup(self, content_hash):
+        """Все скалярные результаты по хэшу содержимого (последний анализ)"""
+        row = self.connection.execute(
+            "SELECT path, analyzed_at, metrics FROM analyses WHERE content_hash = ? "
+            "ORDER BY analyzed_at DESC LIMIT 1", (content_hash,)).fetchone()
+        if row is None:
+            return None
+        return {'path': row[0], 'analyzed_at': row[1], 'metrics': json.loads(row[2])}
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,407 @@
+import glob
+import hashlib
+import io
+import os
+
+import numpy as np
+import cv2
+
+
+# Попиксельные карты (уменьшаются при сохранении в ArtifactStore)
+PIXEL_MAPS = ('magnitude_spectrum', 'noise_image')
+# Не входят в результаты (архив, кэш, ответы сервиса), сохраняются только в ArtifactStore:
+# попиксельные карты, гистограмма модулей градиента и карты фокуса по плиткам
+LARGE_ARRAYS = PIXEL_MAPS + ('gradient_histogram', 'focus_map')
+
+SEPARATOR = '/'
+SCALAR_PREFIX = 's:'
+ARRAY_PREFIX = 'a:'
+
+
+def flatten_results(results, exclude=LARGE_ARRAYS, sequences=None):
+    """Разделение вложенного словаря результатов на скаляры и массивы.
+
+    Ключи - пути через '/', например 'mtf/mtf_50'. Списки и кортежи становятся
+    массивами (в словарь sequences, если задан, записывается их тип: 'list' или
+    'tuple'), None пропускается.
+    """
+    scalars = {}
+    arrays = {}
+
+    def walk(value, path):
+        for key, item in value.items():
+            name = f"{path}{SEPARATOR}{key}" if path else str(key)
+            if item is None or key in exclude:
+                continue
+            elif isinstance(item, dict):
+                walk(item, name)
+            elif isinstance(item, (np.ndarray, list, tuple)):
+                arrays[name] = np.asarray(item)
+                if sequences is not None and not isinstance(item, np.ndarray):
+                    sequences[name] = 'tuple' if isinstance(item, tuple) else 'list'
+            elif isinstance(item, (bool, np.bool_)):
+                scalars[name] = bool(item)
+            elif isinstance(item, (int, np.integer)):
+                scalars[name] = int(item)
+            elif isinstance(item, (float, np.floating)):
+                scalars[name] = float(item)
+            else:
+                scalars[name] = str(item)
+
+    walk(results, '')
+    return scalars, arrays
+
+
+def unflatten_results(scalars, arrays):
+    """Обратное преобразование: вложенный словарь из скаляров и массивов"""
+    results = {}
+    for name, value in list(scalars.items()) + list(arrays.items()):
+        *path, key = name.split(SEPARATOR)
+        node = results
+        for part in path:
+            node = node.setdefault(part, {})
+        node[key] = value
+    return results
+
+
+RESULTS_FORMATS = {'.npz': 'npz', '.json': 'json'}
+
+
+def results_format(filename, format=None):
+    """Формат файла результатов: заданный явно или по расширению ('.npz', '.json').
+
+    Неизвестный формат или расширение - ValueError (файл не записывается).
+    """
+    if format is not None:
+        if format not in RESULTS_FORMATS.values():
+            raise ValueError(f"Неизвестный формат результатов: {format}")
+        return format
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in RESULTS_FORMATS:
+        raise ValueError(f"Неизвестное расширение файла результатов: {extension or '(нет)'} "
+                         f"(ожидается {', '.join(RESULTS_FORMATS)})")
+    return RESULTS_FORMATS[extension]
+
+
+def _npz_payload(results):
+    """Элементы .npz-архива результатов.
+
+    Вещественные, целые, логические и строковые скаляры хранятся парами массивов
+    имен и значений (логические - отдельно, чтобы не превратиться в 0/1), массивы - отдельными элементами архива. Для списков и кортежей
+    записывается тип, load_npz восстанавливает их из массивов.
+    """
+    sequences = {}
+    scalars, arrays = flatten_results(results, sequences=sequences)
+    numeric = {name: value for name, value in scalars.items() if isinstance(value, float)}
+    booleans = {name: value for name, value in scalars.items() if isinstance(value, bool)}
+    integers = {name: value for name, value in scalars.items()
+                if isinstance(value, int) and not isinstance(value, bool)}
+    strings = {name: value for name, value in scalars.items() if isinstance(value, str)}
+    payload = {
+        'scalar_names': np.array(list(numeric), dtype=str),
+        'scalar_values': np.array(list(numeric.values()), dtype=np.float64),
+        'integer_names': np.array(list(integers), dtype=str),
+        'integer_values': np.array(list(integers.values()), dtype=np.int64),
+        'boolean_names': np.array(list(booleans), dtype=str),
+        'boolean_values': np.array(list(booleans.values()), dtype=bool),
+        'string_names': np.array(list(strings), dtype=str),
+        'string_values': np.array(list(strings.values()), dtype=str),
+        'sequence_names': np.array(list(sequences), dtype=str),
+        'sequence_types': np.array(list(sequences.values()), dtype=str),
+    }
+    payload.update({ARRAY_PREFIX + name: value for name, value in arrays.items()})
+    return payload
+
+
+def save_npz(results, filename, compress=False):
+    """Сохранение результатов одного изображения в .npz (без pickle)"""
+    with open(filename, 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **_npz_payload(results))
+
+
+def dumps_npz(results, compress=False):
+    """Результаты в формате .npz в виде байтов (для передачи по сети)"""
+    buffer = io.BytesIO()
+    (np.savez_compressed if compress else np.savez)(buffer, **_npz_payload(results))
+    return buffer.getvalue()
+
+
+def loads_npz(data):
+    """Результаты из байтов, полученных dumps_npz"""
+    return load_npz(io.BytesIO(data))
+
+
+def load_npz(filename):
+    """Загрузка результатов, сохраненных save_npz"""
+    with np.load(filename, allow_pickle=False) as data:
+        scalars = dict(zip(data['scalar_names'].tolist(), data['scalar_values'].tolist()))
+        if 'integer_names' in data.files:
+            scalars.update(zip(data['integer_names'].tolist(), data['integer_values'].tolist()))
+        if 'boolean_names' in data.files:
+            scalars.update(zip(data['boolean_names'].tolist(), data['boolean_values'].tolist()))
+        scalars.update(zip(data['string_names'].tolist(), data['string_values'].tolist()))
+        arrays = {name[len(ARRAY_PREFIX):]: data[name] for name in data.files if name.startswith(ARRAY_PREFIX)}
+        if 'sequence_names' in data.files:
+            for name, kind in zip(data['sequence_names'].tolist(), data['sequence_types'].tolist()):
+                if name in arrays:
+                    values = arrays[name].tolist()
+                    arrays[name] = tuple(values) if kind == 'tuple' else values
+    return unflatten_results(scalars, arrays)
+
+
+def extract_artifacts(results, names=LARGE_ARRAYS):
+    """Карты из результатов: путь 'раздел/ключ' -> массив.
+
+    Словарь массивов (карты фокуса) дает пути 'раздел/ключ/имя'.
+    """
+    artifacts = {}
+    for section, value in results.items():
+        if isinstance(value, dict):
+            for key in names:
+                item = value.get(key)
+                if isinstance(item, np.ndarray):
+                    artifacts[f"{section}{SEPARATOR}{key}"] = item
+                elif isinstance(item, dict):
+                    artifacts.update({f"{section}{SEPARATOR}{key}{SEPARATOR}{name}": array
+                                      for name, array in item.items() if isinstance(array, np.ndarray)})
+    return artifacts
+
+
+class ArtifactStore:
+    """Хранилище карт (спектр, карта шума, карты фокуса) по идентификатору изображения.
+
+    Попиксельные карты уменьшаются так, чтобы большая сторона не превышала
+    max_side, и хранятся в float16; гистограмма градиентов и карты фокуса -
+    без изменений. Один сжатый .npz на изображение, чтение ленивое:
+    загружается только запрошенная карта.
+    """
+
+    def __init__(self, directory, max_side=512, dtype=np.float16):
+        self.directory = directory
+        self.max_side = max_side
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, image_id):
+        """Файл карт изображения (имя - хэш идентификатора)"""
+        digest = hashlib.blake2b(str(image_id).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{digest}.npz")
+
+    def _reduce(self, array):
+        """Уменьшение и приведение к типу хранения"""
+        array = np.asarray(array, dtype=np.float32)
+        height, width = array.shape[:2]
+        scale = self.max_side / max(height, width) if self.max_side else 1.0
+        if scale < 1.0:
+            size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+            array = cv2.resize(array, size, interpolation=cv2.INTER_AREA)
+        if self.dtype.kind == 'f':
+            limit = np.finfo(self.dtype).max
+            array = np.clip(array, -limit, limit)
+        return array.astype(self.dtype)
+
+    def save(self, image_id, results):
+        """Сохранение карт из результатов анализа; возвращает список сохраненных путей"""
+        artifacts = extract_artifacts(results)
+        if not artifacts:
+            return []
+        payload = {'image_id': np.array(str(image_id))}
+        for name, array in artifacts.items():
+            payload[name] = self._reduce(array) if name.split(SEPARATOR)[1] in PIXEL_MAPS else array
+            payload[name + ':shape'] = np.array(array.shape, dtype=np.int64)
+        with open(self.path(image_id), 'wb') as f:
+            np.savez_compressed(f, **payload)
+        return list(artifacts)
+
+    def __contains__(self, image_id):
+        return os.path.exists(self.path(image_id))
+
+    def names(self, image_id):
+        """Сохраненные карты изображения"""
+        with np.load(self.path(image_id), allow_pickle=False) as data:
+            return [name for name in data.files if name != 'image_id' and not name.endswith(':shape')]
+
+    def load(self, image_id, name):
+        """Карта изображения, например 'noise/noise_image' (в типе хранения)"""
+        with np.load(self.path(image_id), allow_pickle=False) as data:
+            return data[name]
+
+    def original_shape(self, image_id, name):
+        """Размер карты до уменьшения"""
+        with np.load(self.path(image_id), allow_pickle=False) as data:
+            return tuple(int(v) for v in data[name + ':shape'])
+
+
+class ResultsStore:
+    """Архив результатов множества изображений в каталоге из блоков .npz.
+
+    Каждый блок хранит до chunk_size записей по столбцам: числовые скаляры - в
+    столбцах float64 (NaN для отсутствующих), строковые - в строковых столбцах,
+    массивы переменной длины - общим буфером со смещениями и формами записей.
+    Столбцы читаются без разбора текста и без загрузки массивов. При
+    save_artifacts=True попиксельные карты сохраняются в подкаталог artifacts.
+    """
+
+    ID_COLUMN = 'image_id'
+
+    def __init__(self, directory, chunk_size=1024, compress=False, save_artifacts=False):
+        self.directory = directory
+        self.chunk_size = int(chunk_size)
+        self.compress = compress
+        self._pending = []
+        os.makedirs(directory, exist_ok=True)
+        self.artifacts = ArtifactStore(os.path.join(directory, 'artifacts')) if save_artifacts else None
+
+    def _chunk_files(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'results_*.npz')))
+
+    def append(self, results, image_id=''):
+        """Добавление записи; блок записывается при накоплении chunk_size записей"""
+        scalars, arrays = flatten_results(results)
+        if self.artifacts is not None:
+            self.artifacts.save(image_id, results)
+        self._pending.append((str(image_id), scalars, arrays))
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Запись накопленных записей новым блоком"""
+        if not self._pending:
+            return None
+        records = self._pending
+        count = len(records)
+
+        payload = {self.ID_COLUMN: np.array([image_id for image_id, _, _ in records])}
+
+        scalar_names = sorted({name for _, scalars, _ in records for name in scalars})
+        for name in scalar_names:
+            values = [scalars.get(name) for _, scalars, _ in records]
+            if any(isinstance(v, str) for v in values):
+                column = np.array(['' if v is None else str(v) for v in values])
+            else:
+                column = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            payload[SCALAR_PREFIX + name] = column
+
+        array_names = sorted({name for _, _, arrays in records for name in arrays})
+        for name in array_names:
+            items = [arrays.get(name) for _, _, arrays in records]
+            present = [item for item in items if item is not None]
+            dtype = np.result_type(*[item.dtype for item in present])
+            ndim = max(item.ndim for item in present)
+            offsets = np.zeros(count + 1, dtype=np.int64)
+            shapes = np.zeros((count, max(ndim, 1)), dtype=np.int64)
+            for index, item in enumerate(items):
+                size = 0
+                if item is not None:
+                    size = item.size
+                    shapes[index, :item.ndim] = item.shape
+                offsets[index + 1] = offsets[index] + size
+            data = np.concatenate([item.ravel() for item in present]).astype(dtype, copy=False) \
+                if present else np.zeros(0, dtype=dtype)
+            prefix = ARRAY_PREFIX + name
+            payload[prefix + ':data'] = data
+            payload[prefix + ':offsets'] = offsets
+            payload[prefix + ':shapes'] = shapes
+            # Размерность записи, -1 - массив отсутствует
+            payload[prefix + ':ndim'] = np.array([item.ndim if item is not None else -1 for item in items],
+                                                 dtype=np.int8)
+
+        with self._create_chunk() as f:
+            (np.savez_compressed if self.compress else np.savez)(f, **payload)
+            filename = f.name
+        self._pending = []
+        return filename
+
+    def _create_chunk(self):
+        """Новый файл блока: номер больше всех существующих, создание без перезаписи.
+
+        Если номер занят другим писателем того же каталога, берется следующий.
+        """
+        indices = [int(name[len('results_'):-len('.npz')])
+                   for name in map(os.path.basename, self._chunk_files())
+                   if name[len('results_'):-len('.npz')].isdigit()]
+        index = max(indices, default=-1) + 1
+        while True:
+            try:
+                return open(os.path.join(self.directory, f"results_{index:06d}.npz"), 'xb')
+            except FileExistsError:
+                index += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        total = len(self._pending)
+        for filename in self._chunk_files():
+            with np.load(filename, allow_pickle=False) as data:
+                total += len(data[self.ID_COLUMN])
+        return total
+
+    def scalar_names(self):
+        """Имена скалярных столбцов во всех блоках"""
+        names = set()
+        for filename in self._chunk_files():
+            with np.load(filename, allow_pickle=False) as data:
+                names.update(name[len(SCALAR_PREFIX):] for name in data.files if name.startswith(SCALAR_PREFIX))
+        return sorted(names)
+
+    def columns(self, names=None):
+        """Скалярные столбцы всего архива (и image_id) без загрузки массивов"""
+        chunks = []
+        for filename in self._chunk_files():
+            with np.load(filename, allow_pickle=False) as data:
+                count = len(data[self.ID_COLUMN])
+                available = [name[len(SCALAR_PREFIX):] for name in data.files if name.startswith(SCALAR_PREFIX)]
+                wanted = available if names is None else names
+                chunk = {self.ID_COLUMN: data[self.ID_COLUMN]}
+                for name in wanted:
+                    key = SCALAR_PREFIX + name
+                    chunk[name] = data[key] if key in data.files else np.full(count, np.nan)
+                chunks.append(chunk)
+
+        if not chunks:
+            return {}
+        all_names = [self.ID_COLUMN] + sorted({name for chunk in chunks for name in chunk} - {self.ID_COLUMN})
+        return {name: np.concatenate([chunk.get(name, np.full(len(chunk[self.ID_COLUMN]), np.nan))
+                                      for chunk in chunks])
+                for name in all_names}
+
+    @staticmethod
+    def _read_record(data, index):
+        """Запись index блока (словарь столбцов) в виде вложенного словаря результатов"""
+        scalars = {}
+        arrays = {}
+        for name in data:
+            if name.startswith(SCALAR_PREFIX):
+                value = data[name][index]
+                if isinstance(value, np.str_):
+                    if value:
+                        scalars[name[len(SCALAR_PREFIX):]] = str(value)
+                elif not np.isnan(value):
+                    scalars[name[len(SCALAR_PREFIX):]] = float(value)
+            elif name.startswith(ARRAY_PREFIX) and name.endswith(':data'):
+                prefix = name[:-len(':data')]
+                ndim = int(data[prefix + ':ndim'][index])
+                if ndim < 0:
+                    continue
+                offsets = data[prefix + ':offsets']
+                values = data[name][offsets[index]:offsets[index + 1]]
+                shape = tuple(data[prefix + ':shapes'][index][:ndim])
+                arrays[prefix[len(ARRAY_PREFIX):]] = values.reshape(shape)
+        return unflatten_results(scalars, arrays)
+
+    def records(self):
+        """Итерация по записям архива: (image_id, результаты)"""
+        for filename in self._chunk_files():
+            with np.load(filename, allow_pickle=False) as archive:
+                # Обращение к элементу npz читает его из архива заново - читаем блок один раз
+                data = {name: archive[name] for name in archive.files}
+                ids = data[self.ID_COLUMN]
+                for index in range(len(ids)):
+                    yield str(ids[index]), self._read_record(data, index)
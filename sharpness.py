@@ -0,0 +1,177 @@
+import numpy as np
+import cv2
+
+
+# Метрики быстрой оценки фокуса (SharpnessEngine.score)
+FOCUS_METRICS = ('tenengrad', 'brenner', 'laplacian_energy', 'laplacian_variance')
+
+
+class SharpnessEngine:
+    """Семейство метрик резкости по общим градиентам и карты фокуса по плиткам.
+
+    Производные Собеля и лапласиан вычисляются один раз (float32), все метрики
+    получаются из них без промежуточных массивов полного размера: в цикле Python
+    по плиткам (tiles, по умолчанию 8 x 8) для каждой плитки вызываются
+    cv2.norm/cv2.mean - по вызову на каждую сумму (накопление в double), общие
+    значения - суммы по плиткам. Гистограмма модулей градиента строится
+    cv2.calcHist. Буферы градиентов переиспользуются между кадрами одинакового
+    размера (автофокус).
+    """
+
+    def __init__(self, tiles=(8, 8), histogram_bins=1024, edge_threshold=0.2, depth=cv2.CV_32F):
+        self.tiles = tiles
+        self.histogram_bins = histogram_bins
+        # Порог перепада: доля отклика Собеля на перепад во весь диапазон
+        self.edge_threshold = edge_threshold
+        self.depth = depth
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        dtype = np.float64 if self.depth == cv2.CV_64F else np.float32
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def gradients(self, image):
+        """Производные Собеля по x, y и лапласиан во внутренних буферах движка"""
+        shape = image.shape[:2]
+        return (cv2.Sobel(image, self.depth, 1, 0, dst=self._buffer('grad_x', shape), ksize=3),
+                cv2.Sobel(image, self.depth, 0, 1, dst=self._buffer('grad_y', shape), ksize=3),
+                cv2.Laplacian(image, self.depth, dst=self._buffer('laplacian', shape)))
+
+    def score(self, image, metric='tenengrad'):
+        """Одна метрика по всему кадру с минимумом вычислений (функция оценки автофокуса)"""
+        shape = image.shape[:2]
+        pixels = shape[0] * shape[1]
+        if metric == 'tenengrad':
+            grad_x = cv2.Sobel(image, self.depth, 1, 0, dst=self._buffer('grad_x', shape), ksize=3)
+            grad_y = cv2.Sobel(image, self.depth, 0, 1, dst=self._buffer('grad_y', shape), ksize=3)
+            return (cv2.norm(grad_x, cv2.NORM_L2SQR) + cv2.norm(grad_y, cv2.NORM_L2SQR)) / pixels
+        if metric == 'brenner':
+            return cv2.norm(image[:, 2:], image[:, :-2], cv2.NORM_L2SQR) / (shape[0] * max(shape[1] - 2, 1))
+        if metric in ('laplacian_energy', 'laplacian_variance'):
+            laplacian = cv2.Laplacian(image, self.depth, dst=self._buffer('laplacian', shape))
+            energy = cv2.norm(laplacian, cv2.NORM_L2SQR) / pixels
+            if metric == 'laplacian_energy':
+                return energy
+            return energy - cv2.mean(laplacian)[0] ** 2
+        raise ValueError(f"Неизвестная метрика резкости: {metric}")
+
+    def _tile_bounds(self, shape):
+        rows = np.linspace(0, shape[0], min(self.tiles[0], shape[0]) + 1).astype(int)
+        cols = np.linspace(0, shape[1], min(self.tiles[1], shape[1]) + 1).astype(int)
+        return rows, cols
+
+    def _histogram_metrics(self, grad_x, grad_y, mask, max_value):
+        """Метрики гистограммы модулей градиента"""
+        if grad_x.dtype == np.float32:
+            magnitude = cv2.magnitude(grad_x, grad_y, self._buffer('magnitude', grad_x.shape))
+        else:
+            # calcHist принимает только float32
+            magnitude = cv2.magnitude(grad_x, grad_y).astype(np.float32)
+        # Наибольший модуль производной Собеля 3x3 - 4 * sqrt(2) * диапазон
+        upper = 4 * np.sqrt(2) * max_value + 1
+        histogram = cv2.calcHist([magnitude], [0], mask, [self.histogram_bins], [0, upper]).ravel().astype(np.float64)
+        total = histogram.sum()
+        if total == 0:
+            return {'gradient_p50': 0.0, 'gradient_p90': 0.0, 'gradient_p99': 0.0,
+                    'gradient_entropy': 0.0, 'edge_fraction': 0.0, 'gradient_histogram': histogram}
+        bin_width = upper / self.histogram_bins
+        cumulative = np.cumsum(histogram) / total
+
+        def percentile(fraction):
+            index = int(np.searchsorted(cumulative, fraction))
+            below = cumulative[index - 1] if index > 0 else 0.0
+            inside = (fraction - below) / (cumulative[index] - below) if cumulative[index] > below else 0.0
+            return float((index + inside) * bin_width)
+
+        probabilities = histogram[histogram > 0] / total
+        edge_bin = int(np.ceil(self.edge_threshold * 4 * max_value / bin_width))
+        return {
+            'gradient_p50': percentile(0.5),
+            'gradient_p90': percentile(0.9),
+            'gradient_p99': percentile(0.99),
+            'gradient_entropy': float(-np.sum(probabilities * np.log2(probabilities))),
+            'edge_fraction': float(histogram[edge_bin:].sum() / total),
+            'gradient_histogram': histogram
+        }
+
+    def measure(self, image, gradients=None, mask=None, max_value=None):
+        """Все метрики резкости и карты фокуса по плиткам.
+
+        gradients - готовые (Sobel x, Sobel y, лапласиан) изображения, mask -
+        булева маска учитываемых пикселей, max_value - верх диапазона данных
+        (по умолчанию по типу изображения).
+        """
+        grad_x, grad_y, laplacian = gradients if gradients is not None else self.gradients(image)
+        height, width = image.shape[:2]
+        if max_value is None:
+            max_value = np.iinfo(image.dtype).max if np.issubdtype(image.dtype, np.integer) else float(np.max(image))
+        mask8 = None if mask is None else mask.view(np.uint8)
+
+        rows, cols = self._tile_bounds((height, width))
+        shape = (len(rows) - 1, len(cols) - 1)
+        sums = {name: np.zeros(shape) for name in ('pixels', 'gradient', 'laplacian', 'laplacian_sq',
+                                                   'intensity', 'intensity_sq', 'brenner_pixels', 'brenner')}
+        for i in range(shape[0]):
+            r = slice(rows[i], rows[i + 1])
+            for j in range(shape[1]):
+                c = slice(cols[j], cols[j + 1])
+                tile_mask = None if mask8 is None else mask8[r, c]
+                pixels = (r.stop - r.start) * (c.stop - c.start) if tile_mask is None else cv2.countNonZero(tile_mask)
+                sums['pixels'][i, j] = pixels
+                if pixels == 0:
+                    continue
+                sums['gradient'][i, j] = (cv2.norm(grad_x[r, c], cv2.NORM_L2SQR, mask=tile_mask)
+                                          + cv2.norm(grad_y[r, c], cv2.NORM_L2SQR, mask=tile_mask))
+                sums['laplacian'][i, j] = cv2.mean(laplacian[r, c], mask=tile_mask)[0] * pixels
+                sums['laplacian_sq'][i, j] = cv2.norm(laplacian[r, c], cv2.NORM_L2SQR, mask=tile_mask)
+                sums['intensity'][i, j] = cv2.mean(image[r, c], mask=tile_mask)[0] * pixels
+                sums['intensity_sq'][i, j] = cv2.norm(image[r, c], cv2.NORM_L2SQR, mask=tile_mask)
+
+                # Бреннер: квадраты разностей через пиксель по строке; пары внутри кадра
+                stop = min(c.stop, width - 2)
+                if stop <= c.start:
+                    continue
+                left, right = image[r, c.start:stop], image[r, c.start + 2:stop + 2]
+                pair_mask = None
+                if mask8 is not None:
+                    pair_mask = cv2.bitwise_and(mask8[r, c.start:stop], mask8[r, c.start + 2:stop + 2])
+                    sums['brenner_pixels'][i, j] = cv2.countNonZero(pair_mask)
+                else:
+                    sums['brenner_pixels'][i, j] = left.size
+                sums['brenner'][i, j] = cv2.norm(left, right, cv2.NORM_L2SQR, mask=pair_mask)
+
+        total = {name: value.sum() for name, value in sums.items()}
+        if total['pixels'] == 0:
+            raise ValueError("Нет пикселей для оценки резкости")
+        pixels = total['pixels']
+        mean_intensity = total['intensity'] / pixels
+        laplacian_energy = total['laplacian_sq'] / pixels
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tile_pixels = np.where(sums['pixels'] > 0, sums['pixels'], np.nan)
+            tenengrad_map = sums['gradient'] / tile_pixels
+            brenner_map = sums['brenner'] / np.where(sums['brenner_pixels'] > 0, sums['brenner_pixels'], np.nan)
+            laplacian_map = sums['laplacian_sq'] / tile_pixels - (sums['laplacian'] / tile_pixels) ** 2
+        focus_max = np.nanmax(tenengrad_map)
+
+        metrics = {
+            'tenengrad': float(total['gradient'] / pixels),
+            'brenner': float(total['brenner'] / total['brenner_pixels']) if total['brenner_pixels'] else 0.0,
+            'laplacian_energy': float(laplacian_energy),
+            'laplacian_variance': float(laplacian_energy - (total['laplacian'] / pixels) ** 2),
+            'normalized_variance': float((total['intensity_sq'] / pixels - mean_intensity ** 2) / mean_intensity)
+            if mean_intensity > 0 else 0.0,
+        }
+        metrics.update(self._histogram_metrics(grad_x, grad_y, mask8, max_value))
+        metrics['focus_uniformity'] = float(np.nanmin(tenengrad_map) / focus_max) if focus_max > 0 else 1.0
+        metrics['focus_map'] = {
+            'tenengrad': tenengrad_map,
+            'brenner': brenner_map,
+            'laplacian_variance': laplacian_map,
+            'tile_rows': rows,
+            'tile_cols': cols
+        }
+        return metrics
@@ -0,0 +1,201 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import fft as sp_fft
+
+
+class SpectrumService:
+    """Сервис вычисления спектров на вещественном БПФ (rfft) с кэшем планов по размеру"""
+
+    def __init__(self, workers=-1, cache_size=16):
+        # workers=-1 - использовать все ядра процессора
+        self.workers = workers
+        self.cache_size = cache_size
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, shape):
+        """План для размера изображения: дополненный размер и индексы областей спектра"""
+        shape = tuple(int(n) for n in shape)
+        with self._lock:
+            plan = self._plans.get(shape)
+            if plan is not None:
+                self._plans.move_to_end(shape)
+                return plan
+
+        height, width = shape
+        padded_h = sp_fft.next_fast_len(height, real=True)
+        padded_w = sp_fft.next_fast_len(width, real=True)
+
+        # Частоты полуспектра (циклы на отсчет): строки - полные, столбцы - 0..0.5
+        freq_y = sp_fft.fftfreq(padded_h).astype(np.float32)
+        freq_x = sp_fft.rfftfreq(padded_w).astype(np.float32)
+
+        # Угловые области сдвинутого спектра (|fy| >= 1/4, |fx| >= 1/4) в полуспектре
+        # образуют одну полосу: по симметрии |F(-fy, -fx)| = |F(fy, fx)|
+        high_rows = np.nonzero(np.abs(freq_y) >= 0.25)[0]
+        high_cols = np.nonzero(freq_x >= 0.25)[0]
+        if len(high_rows) > 0 and len(high_cols) > 0:
+            corner_rows = slice(int(high_rows[0]), int(high_rows[-1]) + 1)
+            corner_cols = slice(int(high_cols[0]), int(high_cols[-1]) + 1)
+        else:
+            corner_rows = corner_cols = None
+
+        plan = {
+            'shape': shape,
+            'padded_shape': (padded_h, padded_w),
+            'freq_y': freq_y,
+            'freq_x': freq_x,
+            'corner_rows': corner_rows,
+            'corner_cols': corner_cols,
+            'radial_cache': {}
+        }
+
+        with self._lock:
+            self._plans[shape] = plan
+            while len(self._plans) > self.cache_size:
+                self._plans.popitem(last=False)
+
+        return plan
+
+    def rfft2(self, image, dtype=np.float32):
+        """Полуспектр изображения (complex64 для float32), дополнение до быстрого размера"""
+        plan = self.plan(image.shape)
+        height, width = plan['shape']
+        padded_h, padded_w = plan['padded_shape']
+
+        if (padded_h, padded_w) == (height, width):
+            data = image.astype(dtype, copy=False)
+        else:
+            # Дополнение средним значением меньше искажает спектр, чем нулями
+            data = np.empty((padded_h, padded_w), dtype=dtype)
+            data[:height, :width] = image
+            data[:height, width:] = data[:height, :width].mean()
+            data[height:, :] = data[:height, :width].mean()
+
+        spectrum = sp_fft.rfft2(data, workers=self.workers, overwrite_x=data is not image)
+        return spectrum, plan
+
+    def rfft(self, signal_1d, dtype=np.float32):
+        """Одномерный вещественный БПФ и частоты положительной полуоси"""
+        data = np.asarray(signal_1d, dtype=dtype)
+        spectrum = sp_fft.rfft(data, workers=self.workers)
+        frequencies = sp_fft.rfftfreq(len(data))
+        return spectrum, frequencies
+
+    @staticmethod
+    def log_magnitude(spectrum):
+        """Логарифм модуля спектра log(|F| + 1)"""
+        return np.log1p(np.abs(spectrum))
+
+    @staticmethod
+    def corner_aliasing(spectrum, plan):
+        """Мера алиасинга - средний log-модуль высокочастотных углов по полуспектру"""
+        if plan['corner_rows'] is None:
+            return 0.0
+        corners = spectrum[plan['corner_rows'], plan['corner_cols']]
+        return float(np.mean(np.log1p(np.abs(corners))))
+
+    def radial_index(self, plan, num_radial_bins, num_angular_bins):
+        """Индексы радиально-угловых бинов полуспектра (кэшируются в плане размера)"""
+        key = (int(num_radial_bins), int(num_angular_bins))
+        cached = plan['radial_cache'].get(key)
+        if cached is not None:
+            return cached
+
+        freq_y = plan['freq_y'][:, None]
+        freq_x = plan['freq_x'][None, :]
+
+        # Радиус в долях частоты Найквиста (0.5 цикла на отсчет); бин num_radial_bins -
+        # диагональные углы спектра за пределами радиуса Найквиста
+        radius = np.sqrt(freq_y ** 2 + freq_x ** 2) / 0.5
+        radial_bin = np.minimum((radius * num_radial_bins).astype(np.int32), num_radial_bins)
+
+        # Ориентация частотного вектора по модулю pi (полуспектр покрывает все направления)
+        angle = np.arctan2(freq_y, freq_x) + np.pi / 2
+        angular_bin = (angle / np.pi * num_angular_bins).astype(np.int32) % num_angular_bins
+
+        index = radial_bin * num_angular_bins + angular_bin
+        # Нулевая частота - отдельный последний бин
+        total_bins = (num_radial_bins + 1) * num_angular_bins + 1
+        index[0, 0] = total_bins - 1
+        index = index.ravel()
+
+        # Столбцы полуспектра кроме нулевого (и Найквиста при четной ширине) встречаются
+        # в полном спектре дважды
+        column_weight = np.full(len(plan['freq_x']), 2.0, dtype=np.float32)
+        column_weight[0] = 1.0
+        if plan['padded_shape'][1] % 2 == 0:
+            column_weight[-1] = 1.0
+        sample_weight = np.broadcast_to(column_weight, radius.shape).ravel()
+        counts = np.bincount(index, weights=sample_weight, minlength=total_bins)
+
+        cached = {
+            'index': index,
+            'column_weight': column_weight,
+            'counts': counts,
+            'total_bins': total_bins,
+            'num_radial_bins': key[0],
+            'num_angular_bins': key[1]
+        }
+        with self._lock:
+            plan['radial_cache'][key] = cached
+        return cached
+
+    def radial_power_spectrum(self, spectrum, plan, num_radial_bins=32, num_angular_bins=8):
+        """Радиально и угол-усредненный спектр мощности через np.bincount"""
+        bins = self.radial_index(plan, num_radial_bins, num_angular_bins)
+
+        # Мощность |F|^2 / N^2 с учетом двойного вхождения столбцов полуспектра
+        pixel_count = float(plan['padded_shape'][0] * plan['padded_shape'][1])
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        power *= bins['column_weight'] / np.float32(pixel_count ** 2)
+
+        sums = np.bincount(bins['index'], weights=power.ravel(), minlength=bins['total_bins'])
+        counts = bins['counts']
+
+        grid_shape = (num_radial_bins + 1, num_angular_bins)
+        grid_sums = sums[:-1].reshape(grid_shape)
+        grid_counts = counts[:-1].reshape(grid_shape)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            angular_power = np.where(grid_counts > 0, grid_sums / grid_counts, 0.0)
+            radial_sums = grid_sums.sum(axis=1)
+            radial_counts = grid_counts.sum(axis=1)
+            radial_power = np.where(radial_counts > 0, radial_sums / radial_counts, 0.0)
+
+        return {
+            'radial_frequency': (np.arange(num_radial_bins) + 0.5) / num_radial_bins,
+            'radial_power': radial_power[:num_radial_bins],
+            'radial_power_sum': radial_sums[:num_radial_bins],
+            'angular_power': angular_power[:num_radial_bins],
+            'angles': (np.arange(num_angular_bins) + 0.5) / num_angular_bins * np.pi - np.pi / 2,
+            'corner_power': float(radial_power[num_radial_bins]),
+            'corner_power_sum': float(radial_sums[num_radial_bins]),
+            'dc_power': float(sums[-1])
+        }
+
+    @staticmethod
+    def display_spectrum(spectrum):
+        """Логарифмический полуспектр с нулевой частотой в центре по вертикали"""
+        return sp_fft.fftshift(np.log1p(np.abs(spectrum)), axes=0)
+
+
+def aperture_mtf(nu, l_ap, l_sh):
+    """MTF прямоугольной апертуры фотодиода на частоте nu в долях частоты Найквиста.
+
+    Частота Найквиста 1 / (2 * l_sh), поэтому f * l_ap = nu * l_ap / (2 * l_sh).
+    """
+    return np.abs(np.sinc(np.asarray(nu) * l_ap / (2.0 * l_sh)))
+
+
+def model_band_power(nu, l_ap, l_sh):
+    """Модельная мощность после дискретизации для сцены с равномерным спектром:
+    собственная составляющая и отраженная от частоты дискретизации (2 - nu)"""
+    nu = np.asarray(nu, dtype=float)
+    return aperture_mtf(nu, l_ap, l_sh) ** 2 + aperture_mtf(2.0 - nu, l_ap, l_sh) ** 2
+
+
+# Общий сервис: кэш планов переиспользуется всеми анализаторами процесса
+default_spectrum_service = SpectrumService()
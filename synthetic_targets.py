@@ -0,0 +1,194 @@
+import numpy as np
+
+import illumination_models
+from VKR2 import ImageQualityAnalyzer
+
+
+def _ramp_integral(t, width):
+    """Первообразная нормированного перехода clip(t / width, 0, 1)"""
+    width = np.maximum(width, 1e-9)
+    return np.where(t <= 0, 0.0, np.where(t < width, t * t / (2 * width), t - width / 2))
+
+
+def _ramp_integral2(t, width):
+    """Вторая первообразная нормированного перехода"""
+    width = np.maximum(width, 1e-9)
+    return np.where(t <= 0, 0.0,
+                    np.where(t < width, t ** 3 / (6 * width), t * t / 2 - width * t / 2 + width * width / 6))
+
+
+def edge_response(u, l_ap, blur, angle):
+    """Доля перехода E1 -> E2, усредненная по квадратной апертуре l_ap x l_ap.
+
+    u - расстояние от центра фотодиода до начала перехода вдоль нормали к краю (мкм),
+    blur - ширина линейного перехода (0 - резкий край), angle - угол нормали (рад).
+    Для наклонного края используется точное двойное интегрирование по апертуре
+    через вторую первообразную, для почти вертикального - одномерное.
+    """
+    c = np.abs(np.cos(angle)) * l_ap
+    s = np.abs(np.sin(angle)) * l_ap
+    one_dimensional = np.minimum(c, s) < 1e-3 * l_ap
+    span = np.maximum(c, s)
+
+    # Одномерный случай: апертура проецируется на нормаль отрезком длины l_ap
+    box = (_ramp_integral(u + span / 2, blur) - _ramp_integral(u - span / 2, blur)) / span
+
+    # Двумерный случай: проекция квадрата - трапеция, интеграл через вторую первообразную
+    cs = np.where(one_dimensional, 1.0, c * s)
+    trapezoid = (_ramp_integral2(u + c / 2 + s / 2, blur) - _ramp_integral2(u + c / 2 - s / 2, blur)
+                 - _ramp_integral2(u - c / 2 + s / 2, blur) + _ramp_integral2(u - c / 2 - s / 2, blur)) / cs
+
+    return np.clip(np.where(one_dimensional, box, trapezoid), 0.0, 1.0)
+
+
+class SyntheticTargetRenderer:
+    """Синтетические тестовые изображения по моделям освещенности фотодиодной матрицы.
+
+    Геометрия соответствует моделям задач 1-3: шаг дискретизации l_sh, ширина апертуры
+    фотодиода l_ap (мкм), уровни освещенности E1, E2 (%). Центр фотодиода n находится в
+    точке (n + 0.5) * l_sh. Кадры задач 1-3 (model_edge) строятся функциями моделей
+    illumination_models (их же использует GUI progs/Illumination.py); наклонные края - точным интегрированием по квадратной
+    апертуре (двумерное обобщение тех же моделей). Изображения передаются в
+    ImageQualityAnalyzer без записи на диск.
+    """
+
+    def __init__(self, l_ap=5.0, l_sh=7.0, E1=20, E2=80, bit_depth=8,
+                 full_well=None, read_noise=0.0, seed=None):
+        if l_ap > l_sh:
+            raise ValueError("l_ap должна быть ≤ l_sh")
+        self.l_ap = float(l_ap)
+        self.l_sh = float(l_sh)
+        self.E1 = float(E1)
+        self.E2 = float(E2)
+        self.bit_depth = int(bit_depth)
+        # Шум: полная емкость пикселя (e-) для дробового шума и шум считывания (e-)
+        self.full_well = full_well
+        self.read_noise = float(read_noise)
+        self.rng = np.random.default_rng(seed)
+
+    def _pixel_grid(self, shape):
+        """Координаты центров фотодиодов (мкм) относительно центра кадра"""
+        height, width = shape
+        y = (np.arange(height) + 0.5 - height / 2) * self.l_sh
+        x = (np.arange(width) + 0.5 - width / 2) * self.l_sh
+        return y[:, np.newaxis], x[np.newaxis, :]
+
+    def _illumination(self, fraction):
+        """Освещенность в % по доле перехода E1 -> E2"""
+        return self.E1 + (self.E2 - self.E1) * fraction
+
+    def digitize(self, illumination, noise=True, quantize=True):
+        """Сигнал АЦП из освещенности (%): дробовой шум, шум считывания и квантование"""
+        signal = np.asarray(illumination, dtype=np.float64) / 100.0
+        if noise and self.full_well:
+            electrons = self.rng.poisson(np.clip(signal, 0, None) * self.full_well).astype(np.float64)
+            if self.read_noise > 0:
+                electrons += self.rng.normal(0.0, self.read_noise, electrons.shape)
+            signal = electrons / self.full_well
+
+        max_code = 2 ** self.bit_depth - 1
+        if not quantize:
+            return (signal * max_code).astype(np.float32)
+        dtype = np.uint8 if self.bit_depth <= 8 else np.uint16
+        return np.clip(np.rint(signal * max_code), 0, max_code).astype(dtype)
+
+    def slanted_edges(self, shape, angles_deg=5.0, offsets=0.0, blurs=0.0, noise=True, quantize=True):
+        """Пакет наклонных краев: параметры - скаляры или массивы одной длины.
+
+        angles_deg - наклон края относительно вертикали, offsets - смещение начала перехода
+        от центра кадра (мкм), blurs - ширина размытия (мкм, как b - a в задаче 2).
+        Возвращает массив (пакет, высота, ширина) или (высота, ширина) для скаляров.
+        """
+        scalar = np.ndim(angles_deg) == 0 and np.ndim(offsets) == 0 and np.ndim(blurs) == 0
+        angles, offsets, blurs = np.broadcast_arrays(np.atleast_1d(np.radians(angles_deg)),
+                                                     np.atleast_1d(offsets), np.atleast_1d(blurs))
+        angles = angles[:, np.newaxis, np.newaxis]
+        offsets = offsets[:, np.newaxis, np.newaxis]
+        blurs = blurs[:, np.newaxis, np.newaxis]
+
+        y, x = self._pixel_grid(shape)
+        # Расстояние до начала перехода вдоль нормали к краю
+        u = x * np.cos(angles) + y * np.sin(angles) - offsets
+        fraction = edge_response(u, self.l_ap, blurs, angles)
+
+        images = self.digitize(self._illumination(fraction), noise, quantize)
+        return images[0] if scalar else images
+
+    def slanted_edge(self, shape, angle_deg=5.0, offset=0.0, blur=0.0, noise=True, quantize=True):
+        """Наклонный край (задачи 1, 2 в двумерном варианте)"""
+        return self.slanted_edges(shape, angle_deg, offset, blur, noise, quantize)
+
+    def moving_edge(self, shape, shutter_speed=100, V=1.0, angle_deg=5.0, offset=0.0,
+                    noise=True, quantize=True):
+        """Движущийся край (задача 3): смещение за выдержку V * 1000 / shutter_speed мкм"""
+        blur = self.motion_blur(shutter_speed, V)
+        return self.slanted_edges(shape, angle_deg, offset, blur, noise, quantize)
+
+    @staticmethod
+    def motion_blur(shutter_speed, V):
+        """Смазывание края за время экспонирования (мкм), V в мм/с"""
+        return abs(V) * 1000.0 / shutter_speed
+
+    def model_edge(self, num_pixels, a=None, b=None, shutter_speed=None, V=1.0, noise=True, quantize=True):
+        """Кадр num_pixels x num_pixels по моделям задач 1-3 (illumination_models).
+
+        Без b и shutter_speed - статический край (задача 1), с b - размытый край
+        от a до b (задача 2), с shutter_speed - движущийся край (задача 3).
+        a по умолчанию - середина матрицы (мкм). Край горизонтальный, как в моделях.
+        """
+        a = num_pixels * self.l_sh / 2 if a is None else a
+        if shutter_speed is not None:
+            matrix = illumination_models.moving_edge_matrix(self.l_ap, self.l_sh, a, shutter_speed, V,
+                                                            self.E1, self.E2, num_pixels)
+        elif b is not None:
+            matrix = illumination_models.blurred_edge_matrix(self.l_ap, self.l_sh, a, b, self.E1, self.E2, num_pixels)
+        else:
+            matrix = illumination_models.static_edge_matrix(self.l_ap, self.l_sh, a, self.E1, self.E2, num_pixels)
+        return self.digitize(matrix, noise, quantize)
+
+    def _supersampled(self, shape, pattern, supersample):
+        """Освещенность, усредненная по апертуре по сетке supersample x supersample точек"""
+        y, x = self._pixel_grid(shape)
+        offsets = ((np.arange(supersample) + 0.5) / supersample - 0.5) * self.l_ap
+        fraction = np.zeros(shape, dtype=np.float64)
+        for dy in offsets:
+            for dx in offsets:
+                fraction += pattern(y + dy, x + dx)
+        return fraction / (supersample * supersample)
+
+    def bar_target(self, shape, period_um, angle_deg=0.0, supersample=4, noise=True, quantize=True):
+        """Штриховая мира с периодом period_um (мкм)"""
+        angle = np.radians(angle_deg)
+
+        def pattern(y, x):
+            u = x * np.cos(angle) + y * np.sin(angle)
+            return (np.mod(u, period_um) >= period_um / 2).astype(np.float64)
+
+        fraction = self._supersampled(shape, pattern, supersample)
+        return self.digitize(self._illumination(fraction), noise, quantize)
+
+    def siemens_star(self, shape, cycles=36, supersample=4, noise=True, quantize=True):
+        """Мира Сименса с заданным числом периодов по окружности"""
+        def pattern(y, x):
+            return (np.sin(cycles * np.arctan2(y, x)) >= 0).astype(np.float64)
+
+        fraction = self._supersampled(shape, pattern, supersample)
+        return self.digitize(self._illumination(fraction), noise, quantize)
+
+    def expected_mtf(self, frequencies, blur=0.0):
+        """Аналитическая MTF: апертура фотодиода и линейное размытие края.
+
+        frequencies - в циклах на пиксель (как в ImageQualityAnalyzer), blur - в мкм.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        aperture = np.abs(np.sinc(frequencies * self.l_ap / self.l_sh))
+        smear = np.abs(np.sinc(frequencies * blur / self.l_sh))
+        return aperture * smear
+
+    def to_analyzer(self, image, analyzer=None):
+        """Передача изображения в анализатор без записи на диск"""
+        if analyzer is None:
+            analyzer = ImageQualityAnalyzer(bit_depth=self.bit_depth)
+        if not analyzer.load_array(image):
+            raise ValueError("Не удалось передать изображение в анализатор")
+        return analyzer
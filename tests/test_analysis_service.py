@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from analysis_service import AnalysisService
+
+
+def _post(body, path='/batch', length=None):
+    length = len(body) if length is None else length
+    return f"POST {path} HTTP/1.1\r\nContent-Length: {length}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+
+
+async def _request(port, raw):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+def _exchange(service, raw):
+    async def run():
+        server = await asyncio.start_server(service._handle_connection, '127.0.0.1', 0)
+        try:
+            return await _request(server.sockets[0].getsockname()[1], raw)
+        finally:
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(run())
+
+
+def test_json_body_of_wrong_type_is_client_error():
+    status, payload = _exchange(AnalysisService(workers=1), _post(b'[1, 2]'))
+    assert status == 400
+    assert 'error' in payload
+
+
+def test_unexpected_error_returns_500():
+    service = AnalysisService(workers=1)
+
+    async def failing(*args):
+        raise RuntimeError("cv2")
+    service._handle_request = failing
+
+    status, payload = _exchange(service, _post(b'{}'))
+    assert status == 500
+    assert 'cv2' in payload['error']
+    assert service.stats['errors'] == 1
+
+
+@pytest.mark.parametrize('raw', [
+    b'BAD\r\n\r\n',
+    _post(b'{}', length='abc'),
+    _post(b'{}', length=-1),
+])
+def test_malformed_http_is_client_error(raw, caplog):
+    status, payload = _exchange(AnalysisService(workers=1), raw)
+    assert status == 400
+    assert 'error' in payload
+    assert not any('Unhandled exception' in record.getMessage() for record in caplog.records)
+
+
+def test_responses_exclude_large_arrays():
+    from analysis_service import _strip_large
+    from synthetic_targets import SyntheticTargetRenderer
+    import VKR2
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(SyntheticTargetRenderer(seed=0).slanted_edge((64, 80)))
+    results = _strip_large(analyzer.perform_full_analysis())
+    assert 'gradient_p50' in results['sharpness']
+    assert 'focus_map' not in results['sharpness']
+    assert 'gradient_histogram' not in results['sharpness']
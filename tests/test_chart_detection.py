@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+import pytest
+
+from analysis_events import EventSink
+from chart_detection import ChartDetector, STANDARD_LAYOUT
+import VKR2
+
+
+PIXELS_PER_MM = 3.0
+FRAME_SIZE = (1100, 820)
+
+
+def _scene():
+    """Таблица в перспективе на сером фоне и истинная гомография таблица (мм) -> кадр"""
+    chart = STANDARD_LAYOUT.render(pixels_per_mm=PIXELS_PER_MM)
+    height, width = chart.shape
+    source = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    target = np.float32([[70, 60], [960, 95], [1010, 740], [40, 700]])
+    warp = cv2.getPerspectiveTransform(source, target)
+    frame = cv2.warpPerspective(chart, warp, FRAME_SIZE, flags=cv2.INTER_AREA, borderValue=150)
+    # Масштаб мм -> пиксели таблицы (центры пикселей render)
+    to_chart = np.array([[PIXELS_PER_MM, 0, -0.5], [0, PIXELS_PER_MM, -0.5], [0, 0, 1]])
+    return frame, warp @ to_chart
+
+
+def _project(homography, points):
+    return cv2.perspectiveTransform(np.asarray(points, dtype=np.float64)[np.newaxis], homography)[0]
+
+
+def _fiducial_error(detector, truth, shift=(0, 0)):
+    points = STANDARD_LAYOUT.fiducial_points()
+    return np.max(np.linalg.norm(_project(detector.homography, points) - _project(truth, points) - shift, axis=1))
+
+
+def test_render_warp_detect_round_trip():
+    frame, truth = _scene()
+    detector = ChartDetector()
+    assert detector.detect(frame) is not None
+    assert detector.refined is True
+    assert _fiducial_error(detector, truth) < 1.0
+    # Участки внутри спроецированных прямоугольников таблицы
+    patch = STANDARD_LAYOUT.patches['flat_light']['rect']
+    x, y, w, h = detector.patch_rois(shape=frame.shape)['flat_light']
+    corners = _project(truth, [(patch[0], patch[1]), (patch[0] + patch[2], patch[1] + patch[3])])
+    assert corners[0][0] < x and x + w < corners[1][0]
+    assert corners[0][1] < y and y + h < corners[1][1]
+
+
+def test_identical_frame_is_cache_hit():
+    frame, truth = _scene()
+    detector = ChartDetector()
+    detector.detect(frame)
+    first = detector.homography.copy()
+    detector.detect(frame)
+    assert detector.stats == {'detections': 1, 'cache_hits': 1}
+    np.testing.assert_allclose(detector.homography, first, atol=1e-6)
+
+
+def test_large_shift_falls_back_to_full_detection():
+    frame, truth = _scene()
+    detector = ChartDetector(max_shift=3.0)
+    detector.detect(frame)
+    shifted = np.roll(frame, (8, -12), axis=(0, 1))
+    assert detector.detect(shifted) is not None
+    assert detector.stats == {'detections': 2, 'cache_hits': 0}
+    assert _fiducial_error(detector, truth, shift=(-12, 8)) < 1.0
+
+
+def test_frame_without_chart_raises():
+    analyzer = VKR2.ImageQualityAnalyzer()
+    rng = np.random.default_rng(0)
+    analyzer.load_array(rng.normal(128, 10, (480, 640)).clip(0, 255).astype(np.uint8))
+    detector = ChartDetector()
+    with pytest.raises(ValueError):
+        detector.analyze(analyzer)
+    assert detector.homography is None and detector.refined is None
+
+
+class _Warnings(EventSink):
+    def __init__(self):
+        self.messages = []
+
+    def warning(self, message):
+        self.messages.append(message)
+
+
+@pytest.mark.parametrize('refine', [True, False])
+def test_unrefined_fiducials_flagged(monkeypatch, refine):
+    frame, _ = _scene()
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(frame)
+    analyzer.events = _Warnings()
+    detector = ChartDetector()
+    if not refine:
+        monkeypatch.setattr(detector, '_refine_all', lambda *args: None)
+
+    results = detector.analyze(analyzer)
+    assert results['chart']['refined'] is refine
+    assert any('не уточнены' in message for message in analyzer.events.messages) is not refine
+    assert set(results['rois']) == set(results['chart']['patch_kinds'])
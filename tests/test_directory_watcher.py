@@ -0,0 +1,55 @@
+import os
+
+import cv2
+
+from chart_detection import STANDARD_LAYOUT
+from directory_watcher import DirectoryWatcher, _STOP
+from result_cache import ResultCache
+from results_db import file_hash
+
+
+def _touch(path, data=b'frame'):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_deleted_and_renamed_files_are_pruned(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_time=0)
+    for name in ('a.png', 'b.png'):
+        _touch(tmp_path / name)
+    assert watcher.scan_once() == 2
+
+    os.remove(tmp_path / 'a.png')
+    os.rename(tmp_path / 'b.png', tmp_path / 'c.png')
+    assert watcher.scan_once() == 1
+    assert set(watcher._seen) == {str(tmp_path / 'c.png')}
+
+
+def test_interrupted_scan_keeps_seen(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_time=0, queue_size=1, poll_interval=0.01)
+    _touch(tmp_path / 'c.png')
+    assert watcher.scan_once() == 1
+    _touch(tmp_path / 'a.png')
+    # Очередь занята файлом c.png: опрос прерывается на a.png, до c.png не доходит
+    assert watcher.scan_once() == 0
+    assert str(tmp_path / 'c.png') in watcher._seen
+
+
+def test_chart_mode_bypasses_cache(tmp_path):
+    frames = tmp_path / 'frames'
+    frames.mkdir()
+    path = str(frames / 'chart.png')
+    cv2.imwrite(path, STANDARD_LAYOUT.render())
+    cache = ResultCache(str(tmp_path / 'cache'))
+    watcher = DirectoryWatcher(str(frames), cache=cache, chart=True)
+
+    watcher.tasks.put(path)
+    watcher.tasks.put(_STOP)
+    watcher._worker()
+
+    results, _, content_hash = watcher.completed.get_nowait()
+    assert watcher.stats['analyzed'] == 1
+    assert 'rois' in results
+    assert content_hash == file_hash(path)
+    assert cache.hits == cache.misses == 0
+    assert cache.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
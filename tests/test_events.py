@@ -0,0 +1,74 @@
+import logging
+from types import SimpleNamespace
+
+from analysis_events import EventSink, TkProgressSink
+from synthetic_targets import SyntheticTargetRenderer
+import VKR2
+
+
+def _analyzer(**kwargs):
+    renderer = SyntheticTargetRenderer(seed=0)
+    analyzer = VKR2.ImageQualityAnalyzer(**kwargs)
+    analyzer.load_array(renderer.slanted_edge((64, 80)))
+    return analyzer
+
+
+def _broken_canny(*args, **kwargs):
+    raise RuntimeError("canny")
+
+
+def test_metric_errors_logged_by_default(monkeypatch, caplog):
+    monkeypatch.setattr(VKR2.feature, 'canny', _broken_canny)
+    analyzer = _analyzer()
+
+    with caplog.at_level(logging.ERROR, logger='image_quality'):
+        results = analyzer.perform_full_analysis()
+
+    assert results['mtf']['mtf_50'] is None
+    assert any("MTF" in record.getMessage() for record in caplog.records)
+
+
+def test_explicit_null_sink_is_silent(monkeypatch, caplog):
+    monkeypatch.setattr(VKR2.feature, 'canny', _broken_canny)
+    analyzer = _analyzer(events=EventSink())
+
+    with caplog.at_level(logging.DEBUG, logger='image_quality'):
+        analyzer.perform_full_analysis()
+
+    assert not caplog.records
+
+
+class _FakeRoot:
+    def __init__(self):
+        self.calls = []
+
+    def after(self, delay, func, *args):
+        self.calls.append(func)
+
+    def update_idletasks(self):
+        pass
+
+
+def test_tk_sink_reset_and_close():
+    root = _FakeRoot()
+    progressbar = {}
+    sink = TkProgressSink(root, progressbar)
+    sink.error("Ошибка MTF", RuntimeError("canny"))
+    sink.warning("мало перепадов")
+    sink.reset()
+    assert sink.errors == [] and sink.warnings == []
+
+    sink.stage_started('mtf', "MTF", 0, 2)
+    assert progressbar['value'] == 0.0
+    sink.close()
+    sink.stage_finished('mtf', 0, 2, {})
+    assert progressbar['value'] == 0.0
+
+
+def test_gui_skips_after_once_closed():
+    root = _FakeRoot()
+    gui = SimpleNamespace(root=root, closed=False)
+    VKR2.ImageQualityGUI._after(gui, print, "report")
+    gui.closed = True
+    VKR2.ImageQualityGUI._after(gui, print, "report")
+    assert root.calls == [print]
@@ -0,0 +1,73 @@
+import pathlib
+
+import cv2
+import numpy as np
+import pytest
+
+from VKR2 import FrameStackAnalyzer
+
+
+def test_frames_accept_pathlike(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"flat_{index}.png"
+        cv2.imwrite(str(path), rng.normal(128, 4, (32, 48)).clip(0, 255).astype(np.uint8))
+        paths.append(path)
+
+    analyzer = FrameStackAnalyzer(bit_depth=8)
+    from_paths = analyzer.analyze(paths)
+    from_strings = FrameStackAnalyzer(bit_depth=8).analyze([str(path) for path in paths])
+
+    assert isinstance(paths[0], pathlib.Path)
+    assert from_paths['frame_count'] == 3
+    assert np.isclose(from_paths['temporal_noise'], from_strings['temporal_noise'])
+
+
+GAIN = 2.0
+READ_NOISE = 3.0
+
+
+def _stack(signal, count=8, shape=(32, 48), seed=0, dtype=np.uint16):
+    """Кадры плоского поля: дробовой шум (K e-/DN) и шум считывания"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        electrons = rng.poisson(signal * GAIN, shape)
+        frame = electrons / GAIN + 100 + rng.normal(0, READ_NOISE, shape)
+        frames.append(np.round(frame).clip(0, np.iinfo(dtype).max).astype(dtype))
+    return frames
+
+
+def test_single_stack_gives_no_photon_transfer_curve():
+    results = FrameStackAnalyzer(bit_depth=12).analyze(_stack(500))
+    assert 'ptc' not in results
+    assert results['frame_count'] == 8
+
+
+def test_photon_transfer_curve_needs_two_exposure_levels():
+    analyzer = FrameStackAnalyzer(bit_depth=12)
+    with pytest.raises(ValueError):
+        analyzer.photon_transfer_curve([_stack(500)])
+    with pytest.raises(ValueError):
+        analyzer.analyze(_stack(500), exposure_stacks=[_stack(500)])
+
+
+def test_exposure_stacks_recover_conversion_gain():
+    stacks = [_stack(level, seed=index) for index, level in enumerate((200, 600, 1200, 2000))]
+    dark = _stack(0, seed=9)
+    results = FrameStackAnalyzer().analyze(_stack(800, seed=7), dark, exposure_stacks=stacks)
+    ptc = results['ptc']
+    assert len(ptc['signal']) == 4
+    np.testing.assert_allclose(ptc['signal'], (200, 600, 1200, 2000), rtol=0.02)
+    assert ptc['conversion_gain'] == pytest.approx(GAIN, rel=0.1)
+    assert ptc['read_noise'] == pytest.approx(READ_NOISE, rel=0.25)
+
+
+def test_bit_depth_from_whole_stack():
+    # Только первый кадр выходит за 10 бит - разрядность 12, а не по последнему кадру
+    frames = _stack(300)
+    frames[0][0, 0] = 3000
+    assert FrameStackAnalyzer().analyze(frames)['bit_depth'] == 12
+    assert FrameStackAnalyzer().analyze(frames[1:])['bit_depth'] == 10
+    assert FrameStackAnalyzer(bit_depth=14).analyze(frames)['bit_depth'] == 14
@@ -0,0 +1,102 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import illumination_models
+from synthetic_targets import SyntheticTargetRenderer
+
+
+# Исходные (до векторизации) реализации задач 1-3 из progs/Illumination.py (GUI)
+def _reference_task1(l_ap, l_sh, a, E1, E2, num_pixels):
+    n_a = int((a + l_sh / 2) // l_sh)
+    matrix = np.zeros((num_pixels, num_pixels))
+    for n in range(num_pixels):
+        for m in range(num_pixels):
+            if n < n_a - 1:
+                matrix[n, m] = E1
+            elif n > n_a - 1:
+                matrix[n, m] = E2
+            else:
+                delta = l_sh * n_a - a
+                if delta >= l_ap / 2:
+                    matrix[n, m] = E2
+                elif delta <= -l_ap / 2:
+                    matrix[n, m] = E1
+                else:
+                    matrix[n, m] = ((l_ap / 2 - delta) * E1 + (l_ap / 2 + delta) * E2) / l_ap
+    return matrix
+
+
+def _reference_task2(l_ap, l_sh, a, b, E1, E2, num_pixels):
+    def E(x):
+        if x <= a:
+            return E1
+        elif x >= b:
+            return E2
+        else:
+            return E1 + (E2 - E1) * (x - a) / (b - a)
+
+    if b - a > 9:
+        matrix = np.zeros((num_pixels, num_pixels))
+        for n in range(num_pixels):
+            for m in range(num_pixels):
+                matrix[n, m] = E((n + 0.5) * l_sh + l_ap / 2)
+        return matrix
+    return _reference_task1(l_ap, l_sh, a, E1, E2, num_pixels)
+
+
+def _reference_task3(l_ap, l_sh, a, shutter_speed, V, E1, E2, num_pixels):
+    b = a + V * 1000 * (1.0 / shutter_speed)
+    return _reference_task2(l_ap, l_sh, a, b, E1, E2, num_pixels)
+
+
+GEOMETRY = [(5.0, 7.0), (7.0, 7.0), (2.5, 10.0)]
+EDGES = [0.0, 3.5, 17.9, 21.0, 22.4, 70.0, 139.0]
+LEVELS = [(20, 80), (100, 0)]
+NUM_PIXELS = 20
+
+
+@pytest.mark.parametrize('l_ap, l_sh', GEOMETRY)
+def test_static_edge_matches_reference(l_ap, l_sh):
+    for a, (E1, E2) in itertools.product(EDGES, LEVELS):
+        np.testing.assert_array_equal(illumination_models.static_edge_matrix(l_ap, l_sh, a, E1, E2, NUM_PIXELS),
+                                      _reference_task1(l_ap, l_sh, a, E1, E2, NUM_PIXELS))
+
+
+@pytest.mark.parametrize('l_ap, l_sh', GEOMETRY)
+def test_blurred_edge_matches_reference(l_ap, l_sh):
+    for a, width, (E1, E2) in itertools.product(EDGES, (0.0, 5.0, 9.0, 9.5, 40.0, 300.0), LEVELS):
+        np.testing.assert_array_equal(illumination_models.blurred_edge_matrix(l_ap, l_sh, a, a + width, E1, E2, NUM_PIXELS),
+                                      _reference_task2(l_ap, l_sh, a, a + width, E1, E2, NUM_PIXELS))
+
+
+@pytest.mark.parametrize('l_ap, l_sh', GEOMETRY)
+def test_moving_edge_matches_reference(l_ap, l_sh):
+    for a, shutter_speed, V in itertools.product(EDGES, (30, 125, 1000), (0.5, 1.0, 4.0)):
+        np.testing.assert_array_equal(
+            illumination_models.moving_edge_matrix(l_ap, l_sh, a, shutter_speed, V, 20, 80, NUM_PIXELS),
+            _reference_task3(l_ap, l_sh, a, shutter_speed, V, 20, 80, NUM_PIXELS))
+
+
+def test_model_edge_uses_illumination_models():
+    renderer = SyntheticTargetRenderer(l_ap=5.0, l_sh=7.0, E1=20, E2=80, bit_depth=12)
+    image = renderer.model_edge(NUM_PIXELS, a=70.0, shutter_speed=25, V=1.0, noise=False, quantize=False)
+    expected = illumination_models.moving_edge_matrix(5.0, 7.0, 70.0, 25, 1.0, 20, 80, NUM_PIXELS) / 100 * 4095
+    np.testing.assert_allclose(image, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize('blur', [14.0, 28.0])
+def test_expected_mtf_matches_analyzer(blur):
+    renderer = SyntheticTargetRenderer(seed=0)
+    image = renderer.slanted_edge((128, 257), angle_deg=0.0, blur=blur, noise=False, quantize=False)
+    mtf = renderer.to_analyzer(image).calculate_spatial_frequency_response()
+
+    frequencies, measured = mtf['frequencies'], mtf['mtf_values']
+    expected = renderer.expected_mtf(frequencies, blur)
+    step = frequencies[1]
+    expected_mtf_50 = frequencies[np.argmax(expected <= 0.5)]
+
+    low_band = frequencies <= 0.25
+    assert np.max(np.abs(measured[low_band] - expected[low_band])) < 0.05
+    assert abs(mtf['mtf_50'] - expected_mtf_50) <= 2 * step
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+
+from VKR2 import ImageQualityAnalyzer
+
+
+def _color_image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (40, 56, 3), dtype=np.uint8)
+
+
+def _raw_image():
+    # 12-битные данные в 16-битном контейнере
+    rng = np.random.default_rng(1)
+    return rng.integers(0, 4096, (40, 56), dtype=np.uint16)
+
+
+@pytest.mark.parametrize('name, image', [('color.png', _color_image()), ('raw.tiff', _raw_image())])
+def test_load_bytes_matches_load_image(tmp_path, name, image):
+    path = tmp_path / name
+    assert cv2.imwrite(str(path), image)
+
+    from_file = ImageQualityAnalyzer()
+    assert from_file.load_image(str(path))
+    from_bytes = ImageQualityAnalyzer()
+    data = path.read_bytes()
+    assert from_bytes.load_bytes(data)
+
+    assert from_bytes.image.dtype == from_file.image.dtype == image.dtype
+    np.testing.assert_array_equal(from_bytes.image, from_file.image)
+    np.testing.assert_array_equal(from_bytes.image_gray, from_file.image_gray)
+    np.testing.assert_array_equal(from_bytes.image, image)
+    assert from_bytes.get_bit_depth() == from_file.get_bit_depth()
+    assert from_bytes.image_path is None and from_file.image_path == str(path)
+
+    # memoryview и bytearray декодируются так же
+    for buffer in (memoryview(data), bytearray(data)):
+        analyzer = ImageQualityAnalyzer()
+        assert analyzer.load(buffer)
+        np.testing.assert_array_equal(analyzer.image, from_file.image)
+
+
+def test_load_bytes_rejects_garbage():
+    analyzer = ImageQualityAnalyzer()
+    assert not analyzer.load_bytes(b'not an image')
+    assert analyzer.image is None
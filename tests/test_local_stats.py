@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from local_stats import LocalStatistics
+
+
+def _image(dtype=np.uint8, shape=(37, 53), seed=0):
+    rng = np.random.default_rng(seed)
+    top = 255 if dtype == np.uint8 else 4095
+    return rng.integers(0, top + 1, shape).astype(dtype)
+
+
+def _blur(image, window):
+    """Среднее по окну с отражением краев (опорная реализация cv2.blur)"""
+    return cv2.blur(image.astype(np.float64), (window, window), borderType=cv2.BORDER_REFLECT)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+@pytest.mark.parametrize('window', [1, 3, 5, 9])
+def test_mean_variance_std_match_blur(dtype, window):
+    image = _image(dtype)
+    stats = LocalStatistics(image)
+    mean = _blur(image, window)
+    variance = np.maximum(_blur(image.astype(np.float64) ** 2, window) - mean ** 2, 0)
+    scale = float(image.max())
+
+    # Включая края: первые и последние window // 2 строк и столбцов
+    np.testing.assert_allclose(stats.mean(window), mean, rtol=1e-5, atol=1e-5 * scale)
+    np.testing.assert_allclose(stats.variance(window), variance, rtol=1e-4, atol=1e-4 * scale)
+    np.testing.assert_allclose(stats.std(window), np.sqrt(variance), rtol=1e-4, atol=1e-3 * np.sqrt(scale))
+
+
+def test_borders_use_reflection():
+    image = np.zeros((9, 9), dtype=np.uint8)
+    image[0, :] = 90
+    stats = LocalStatistics(image)
+    # Окно 3x3 в строке 0: отражение дает две строки 90 из трех
+    np.testing.assert_allclose(stats.mean(3)[0, 4], 60.0)
+    np.testing.assert_allclose(stats.mean(3)[1, 4], 30.0)
+
+
+def test_tables_shared_between_window_sizes():
+    image = _image()
+    stats = LocalStatistics(image)
+    small = stats.mean(3)
+    stats.mean(11)
+    np.testing.assert_allclose(stats.mean(3), small)
+
+
+@pytest.mark.parametrize('window', [3, 7])
+def test_minimum_maximum_match_rank_filters(window):
+    image = _image()
+    stats = LocalStatistics(image)
+    np.testing.assert_array_equal(stats.minimum(window), ndimage.minimum_filter(image, window, mode='nearest'))
+    np.testing.assert_array_equal(stats.maximum(window), ndimage.maximum_filter(image, window, mode='nearest'))
+
+
+def test_crop_is_slice_of_full_maps():
+    image = _image()
+    stats = LocalStatistics(image)
+    rows, cols = slice(5, 20), slice(10, 40)
+    cropped = stats.crop(rows, cols)
+    np.testing.assert_array_equal(cropped.std(5), stats.std(5)[rows, cols])
+    np.testing.assert_array_equal(cropped.maximum(3), stats.maximum(3)[rows, cols])
+
+
+def test_even_window_rejected():
+    with pytest.raises(ValueError):
+        LocalStatistics(_image()).mean(4)
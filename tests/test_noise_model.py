@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from noise_model import block_statistics, estimate_noise, select_flat_blocks
+
+
+SIGMA = 3.0
+
+
+def _textured(shape=(256, 320), sigma=SIGMA, seed=0):
+    """Левая половина - плоские ступени яркости, правая - текстура и перепады, плюс шум"""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    clean = np.empty(shape, dtype=np.float64)
+    half = width // 2
+    # Ступени по 64 строки - границы совпадают с границами блоков 8x8
+    clean[:, :half] = np.repeat(np.linspace(60, 180, height // 64), 64)[:, None]
+    y, x = np.mgrid[0:height, half:width]
+    clean[:, half:] = 128 + 60 * np.sin(x / 3.0) * np.cos(y / 5.0) + 40 * ((x // 16 + y // 16) % 2)
+    noisy = clean + rng.normal(0, sigma, shape)
+    return np.clip(np.round(noisy), 0, 255).astype(np.uint8), half
+
+
+def test_flat_blocks_are_untextured_half():
+    image, half = _textured()
+    stats = block_statistics(image, block_size=8)
+    flat, bin_index = select_flat_blocks(stats, 256)
+    split = half // 8
+    assert flat[:, :split].mean() > 0.8
+    assert flat[:, split:].mean() < 0.1
+    assert bin_index.min() >= 0 and bin_index.max() < 16
+
+
+@pytest.mark.parametrize('sigma', [2.0, 5.0])
+def test_estimate_noise_recovers_sigma(sigma):
+    image, _ = _textured(sigma=sigma)
+    estimate = estimate_noise(image, 256)
+    assert np.sqrt(estimate['noise_variance']) == pytest.approx(sigma, rel=0.1)
+    assert 0.4 < estimate['flat_fraction'] < 0.6
+    # Кривая шума - по ступеням яркости левой половины
+    curve = estimate['curve']
+    assert len(curve['intensity']) >= 3
+    np.testing.assert_allclose(curve['noise_std'], sigma, rtol=0.15)
+
+
+def test_texture_inflates_plain_standard_deviation():
+    image, half = _textured()
+    # Без выбора плоских блоков текстура выдавалась бы за шум
+    assert np.std(image[:, half:]) > 10 * SIGMA
+    assert np.sqrt(estimate_noise(image, 256)['noise_variance']) < 1.2 * SIGMA
+
+
+def test_mask_limits_blocks():
+    image, half = _textured()
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:, half:] = True
+    estimate = estimate_noise(image, 256, mask=mask)
+    assert estimate['flat_fraction'] < 0.1
+
+    with pytest.raises(ValueError):
+        estimate_noise(image, 256, mask=np.zeros(image.shape, dtype=bool))
@@ -0,0 +1,40 @@
+import pytest
+
+from VKR2 import PRECISION_TOLERANCE
+from synthetic_targets import SyntheticTargetRenderer
+
+
+FRAMES = {
+    'slanted_edge_12bit': (dict(bit_depth=12, full_well=20000, read_noise=3.0, seed=0),
+                           lambda renderer: renderer.slanted_edge((256, 320), angle_deg=5.0, blur=4.0)),
+    'bar_target_12bit': (dict(bit_depth=12, full_well=20000, seed=0),
+                         lambda renderer: renderer.bar_target((192, 256), period_um=40.0)),
+    'siemens_star_8bit': (dict(bit_depth=8, full_well=5000, seed=1),
+                          lambda renderer: renderer.siemens_star((256, 256))),
+}
+
+
+@pytest.mark.parametrize('name', list(FRAMES))
+def test_float32_metrics_within_tolerance(name):
+    params, render = FRAMES[name]
+    renderer = SyntheticTargetRenderer(**params)
+    analyzer = renderer.to_analyzer(render(renderer))
+    report = analyzer.validate_precision()
+
+    failed = {metric: item for metric, item in report['metrics'].items() if not item['passed']}
+    assert report['tolerance'] == PRECISION_TOLERANCE
+    assert report['metrics'], "нет сравниваемых метрик"
+    assert not failed, f"{name}: метрики вне допуска {failed}"
+    assert report['passed']
+
+
+def test_validate_precision_restores_state():
+    renderer = SyntheticTargetRenderer(seed=2)
+    analyzer = renderer.to_analyzer(renderer.slanted_edge((128, 160)))
+    analyzer.perform_full_analysis()
+    results = analyzer.results
+
+    analyzer.validate_precision()
+
+    assert analyzer.precision == 'float32'
+    assert analyzer.results is results
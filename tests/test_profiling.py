@@ -0,0 +1,40 @@
+import tracemalloc
+
+import numpy as np
+
+from synthetic_targets import SyntheticTargetRenderer
+
+
+def _analyzer():
+    renderer = SyntheticTargetRenderer(seed=0)
+    return renderer.to_analyzer(renderer.slanted_edge((128, 160)))
+
+
+def test_stage_peaks_recorded_when_analysis_owns_tracer():
+    analyzer = _analyzer()
+    results = analyzer.perform_full_analysis(profile_memory=True)
+
+    assert not tracemalloc.is_tracing()
+    stages = {name: timing for name, timing in results['timings'].items() if name != 'total'}
+    assert all(timing['peak_bytes'] >= 0 and 'peak_exact' not in timing for timing in stages.values())
+
+
+def test_outer_tracer_peak_preserved():
+    analyzer = _analyzer()
+    tracemalloc.start()
+    try:
+        # Пик внешнего профилировщика больше любого этапа анализа
+        block = np.ones(16 * 2 ** 20, dtype=np.uint8)
+        del block
+        _, outer_peak = tracemalloc.get_traced_memory()
+
+        results = analyzer.perform_full_analysis(profile_memory=True)
+
+        _, peak = tracemalloc.get_traced_memory()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    assert peak >= outer_peak
+    timing = results['timings']['sharpness']
+    assert 'peak_exact' in timing and timing['peak_bytes'] >= 0
@@ -0,0 +1,50 @@
+import numpy as np
+
+from VKR2 import ImageQualityAnalyzer, PYRAMID_MIN_SIDE
+from synthetic_targets import SyntheticTargetRenderer
+
+
+def _analyzer(shape=(300, 517)):
+    analyzer = ImageQualityAnalyzer()
+    gray = SyntheticTargetRenderer(seed=0).slanted_edge(shape)
+    analyzer.load_array(np.dstack([gray] * 3))
+    return analyzer
+
+
+def test_pyramid_level_shapes():
+    analyzer = _analyzer()
+    # cv2.pyrDown: (n + 1) // 2 по каждой стороне, пока меньшая сторона не меньше 2 * PYRAMID_MIN_SIDE
+    expected = [(300, 517), (150, 259), (75, 130), (38, 65)]
+    assert [level.shape for level in analyzer.get_pyramid(gray=True)] == expected
+    assert [level.shape for level in analyzer.get_pyramid()] == [shape + (3,) for shape in expected]
+    assert min(expected[-1]) < 2 * PYRAMID_MIN_SIDE <= min(expected[-2])
+
+
+def test_pyramid_built_once_and_reset_on_load():
+    analyzer = _analyzer()
+    levels = analyzer.get_pyramid(gray=True)
+    assert analyzer.get_pyramid(gray=True) is levels
+    assert levels[0] is analyzer.image_gray
+
+    analyzer.load_array(np.zeros((60, 80), dtype=np.uint8))
+    assert [level.shape for level in analyzer.get_pyramid(gray=True)] == [(60, 80)]
+
+
+def test_quick_look_level_choice():
+    analyzer = _analyzer()
+    # Первый уровень с большей стороной не больше max_side
+    assert analyzer.quick_look(max_side=600)['level'] == 0
+    look = analyzer.quick_look(max_side=200)
+    assert (look['level'], look['scale'], look['level_shape']) == (2, 4, [75, 130])
+    # Меньше наименьшего уровня - наименьший уровень
+    look = analyzer.quick_look(max_side=32)
+    assert (look['level'], look['level_shape']) == (3, [38, 65])
+
+
+def test_quick_look_close_to_full_resolution_metrics():
+    analyzer = _analyzer()
+    look = analyzer.quick_look(max_side=600)
+    noise = analyzer.calculate_noise_parameters()
+    contrast = analyzer.calculate_contrast_parameters()
+    assert look['michelson_contrast'] == contrast['michelson_contrast']
+    assert abs(look['noise_std'] - noise['noise_std']) < 0.25 * noise['noise_std'] + 0.1
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import VKR2
+from VKR2 import ImageQualityAnalyzer
+
+
+def _analyzer(image, **kwargs):
+    analyzer = ImageQualityAnalyzer(**kwargs)
+    analyzer.load_array(image)
+    return analyzer
+
+
+@pytest.mark.parametrize('depth', [10, 12, 14])
+def test_bit_depth_of_data_in_16bit_container(depth):
+    rng = np.random.default_rng(depth)
+    image = rng.integers(0, 2 ** depth, (32, 40)).astype(np.uint16)
+    image[0, 0] = 2 ** depth - 1
+    analyzer = _analyzer(image)
+    assert analyzer.get_bit_depth() == depth
+
+    artifacts = analyzer.analyze_discretization_artifacts()
+    assert artifacts['bit_depth'] == depth
+    assert artifacts['levels'] == 2 ** depth
+    assert set(artifacts['by_bit_depth']) == {str(d) for d in VKR2.SUPPORTED_BIT_DEPTHS if d <= depth}
+
+
+def test_bit_depth_explicit_and_8bit():
+    image = np.full((16, 16), 200, dtype=np.uint16)
+    assert _analyzer(image, bit_depth=12).get_bit_depth() == 12
+    assert _analyzer(image.astype(np.uint8)).get_bit_depth() == 8
+    # Максимум 200 укладывается в 8 разрядов и в 16-битном контейнере
+    assert _analyzer(image).get_bit_depth() == 8
+
+
+def test_missing_codes_on_histogram_with_gaps():
+    hist = np.zeros(16, dtype=np.int64)
+    hist[[2, 3, 5, 6, 9, 10]] = 7
+    stats = ImageQualityAnalyzer._quantization_statistics(hist)
+    # Занятый диапазон 2..10: пустые коды 4, 7, 8; изолирован только 4
+    assert stats['missing_codes'] == 3
+    assert stats['isolated_missing_codes'] == 1
+    assert stats['missing_code_ratio'] == pytest.approx(3 / 9)
+    assert stats['empty_levels'] == 10
+    assert stats['entropy'] == pytest.approx(np.log2(6))
+
+
+def test_missing_codes_in_image():
+    image = (np.arange(64 * 64).reshape(64, 64) % 128 * 2).astype(np.uint8)
+    artifacts = _analyzer(image).analyze_discretization_artifacts()
+    # Заняты только четные коды 0..254
+    assert artifacts['missing_codes'] == 127
+    assert artifacts['isolated_missing_codes'] == 127
+    assert artifacts['stuck_bits_low'] == [0]
+
+
+def test_stuck_bits():
+    rng = np.random.default_rng(1)
+    codes = rng.integers(0, 4096, 5000)
+    stuck_low_codes = codes & ~(1 << 3)
+    hist = np.bincount(stuck_low_codes, minlength=4096)
+    assert ImageQualityAnalyzer._stuck_bits(hist, 12) == ([3], [])
+
+    stuck_high_codes = codes | (1 << 5)
+    hist = np.bincount(stuck_high_codes, minlength=4096)
+    assert ImageQualityAnalyzer._stuck_bits(hist, 12) == ([], [5])
+
+    healthy = np.bincount(codes, minlength=4096)
+    assert ImageQualityAnalyzer._stuck_bits(healthy, 12) == ([], [])
+    # Старшие разряды выше максимального кода не считаются залипшими
+    dark = np.bincount(codes % 256, minlength=4096)
+    assert ImageQualityAnalyzer._stuck_bits(dark, 12) == ([], [])
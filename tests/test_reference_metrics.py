@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+from VKR2 import ImageQualityAnalyzer
+from synthetic_targets import SyntheticTargetRenderer
+
+
+def _image():
+    return SyntheticTargetRenderer(seed=0).siemens_star((128, 128), noise=False)
+
+
+def test_reference_buffer_modified_in_place():
+    image = _image()
+    analyzer = ImageQualityAnalyzer(bit_depth=8)
+    analyzer.load_array(image)
+
+    buffer = image.copy()
+    assert analyzer.compare_with_reference(buffer)['ssim'] > 0.999
+
+    buffer[:] = 255 - image
+    cached = analyzer.compare_with_reference(buffer)
+
+    fresh = ImageQualityAnalyzer(bit_depth=8)
+    fresh.load_array(image)
+    expected = fresh.compare_with_reference(buffer.copy())
+    assert cached['psnr_db'] < 20
+    assert np.isclose(cached['psnr_db'], expected['psnr_db'])
+    assert np.isclose(cached['ssim'], expected['ssim'])
+
+
+def test_reference_comparator_follows_data_range():
+    image = _image()
+    analyzer = ImageQualityAnalyzer(bit_depth=8)
+    analyzer.load_array(image)
+    first = analyzer.get_reference_comparator(image)
+
+    analyzer.bit_depth = 10
+    second = analyzer.get_reference_comparator(image)
+
+    assert first is not second
+    assert second.data_range == 1023
+    # Тот же эталон и диапазон - сравниватель переиспользуется
+    assert analyzer.get_reference_comparator(image.copy()) is second
+
+
+def test_reference_file_reloaded_after_change(tmp_path):
+    image = _image()
+    path = tmp_path / "reference.png"
+    cv2.imwrite(str(path), image)
+    analyzer = ImageQualityAnalyzer(bit_depth=8)
+    analyzer.load_array(image)
+    assert analyzer.compare_with_reference(path)['ssim'] > 0.999
+
+    cv2.imwrite(str(path), 255 - image)
+    assert analyzer.compare_with_reference(str(path))['ssim'] < 0
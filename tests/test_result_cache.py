@@ -0,0 +1,82 @@
+import threading
+
+import numpy as np
+
+from result_cache import ResultCache
+from synthetic_targets import SyntheticTargetRenderer
+import VKR2
+
+
+def _sequences(results, path=''):
+    """Пути и типы списков и кортежей в результатах"""
+    found = {}
+    for key, value in results.items():
+        name = f"{path}/{key}"
+        if isinstance(value, dict):
+            found.update(_sequences(value, name))
+        elif isinstance(value, (list, tuple)):
+            found[name] = (type(value), list(value))
+    return found
+
+
+def test_round_trip_keeps_sequence_types(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(SyntheticTargetRenderer(seed=0).slanted_edge((64, 80)))
+
+    first = analyzer.perform_cached_analysis(cache)
+    second = analyzer.perform_cached_analysis(cache)
+
+    assert cache.hits == 1
+    expected = _sequences(first)
+    assert '/contrast/intensity_range' in expected
+    assert '/resolution/nyquist_frequency' in expected
+    assert '/discretization_artifacts/stuck_bits_low' in expected
+    assert _sequences(second) == expected
+    assert isinstance(second['mtf']['frequencies'], np.ndarray)
+
+
+def test_counters_are_thread_safe(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('present', {'mtf': {'mtf_50': 0.25}})
+
+    def worker():
+        for _ in range(200):
+            cache.get('present')
+            cache.get('absent')
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits == 800
+    assert cache.misses == 800
+
+
+def test_entries_of_older_version_are_not_served(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(SyntheticTargetRenderer(seed=0).slanted_edge((64, 80)))
+
+    monkeypatch.setattr(VKR2, 'ANALYZER_VERSION', '2.1')
+    analyzer.perform_cached_analysis(cache)
+    monkeypatch.undo()
+
+    results = analyzer.perform_cached_analysis(cache)
+    assert cache.hits == 0
+    assert 'gradient_p50' in results['sharpness']
+
+
+def test_unreadable_entry_is_miss_and_removed(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    cache.put('entry', {'mtf': {'mtf_50': 0.25}})
+
+    def broken(filename):
+        raise SystemError("npz header")
+    monkeypatch.setattr('result_cache.load_npz', broken)
+
+    assert cache.get('entry') is None
+    assert cache.misses == 1
+    assert len(cache) == 0
+    assert not (tmp_path / 'entry.npz').exists()
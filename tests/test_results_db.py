@@ -0,0 +1,44 @@
+import sqlite3
+
+from results_db import ResultsDatabase
+
+
+def _results(mtf_50):
+    return {'mtf': {'mtf_50': mtf_50}, 'noise': {'snr_db': 30.0}}
+
+
+def test_changed_file_replaces_record(tmp_path):
+    with ResultsDatabase(str(tmp_path / 'results.db')) as db:
+        db.insert(_results(0.1), 'a.png', 'hash-old')
+        db.insert(_results(0.3), 'a.png', 'hash-new')
+        db.insert(_results(0.2), 'b.png', 'hash-b')
+
+        assert len(db) == 2
+        worst = db.worst('mtf_50')
+        assert [(row['path'], row['mtf_50']) for row in worst] == [('b.png', 0.2), ('a.png', 0.3)]
+        assert db.lookup('hash-old') is None
+        assert db.lookup('hash-new')['path'] == 'a.png'
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE analyses (
+            id INTEGER PRIMARY KEY, path TEXT NOT NULL, content_hash TEXT NOT NULL,
+            analyzed_at REAL NOT NULL, width INTEGER, height INTEGER, bit_depth INTEGER,
+            mtf_50 REAL, mtf_10 REAL, tenengrad REAL, laplacian_variance REAL, snr_db REAL,
+            noise_std REAL, michelson_contrast REAL, rms_contrast REAL,
+            effective_resolution REAL, aliasing_measure REAL, metrics TEXT,
+            UNIQUE (path, content_hash))""")
+    connection.executemany(
+        "INSERT INTO analyses (path, content_hash, analyzed_at, mtf_50, metrics) VALUES (?, ?, ?, ?, '{}')",
+        [('a.png', 'h1', 1.0, 0.1), ('a.png', 'h2', 2.0, 0.3), ('b.png', 'h3', 1.5, 0.2)])
+    connection.commit()
+    connection.close()
+
+    with ResultsDatabase(path) as db:
+        assert len(db) == 2
+        assert {row['path']: row['content_hash'] for row in db.query()} == {'a.png': 'h2', 'b.png': 'h3'}
+        db.insert(_results(0.5), 'a.png', 'h4')
+        assert len(db) == 2
@@ -0,0 +1,113 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from results_store import ArtifactStore, ResultsStore, dumps_npz, loads_npz, results_format
+
+
+def _record(value):
+    return {'mtf': {'mtf_50': value}, 'noise': {'snr_db': 2 * value}}
+
+
+def test_flush_after_deleted_chunk_keeps_records(tmp_path):
+    store = ResultsStore(str(tmp_path), chunk_size=1)
+    for index in range(3):
+        store.append(_record(index), image_id=f"img{index}")
+    os.remove(os.path.join(tmp_path, 'results_000000.npz'))
+
+    store.append(_record(3), image_id='img3')
+    ids = sorted(image_id for image_id, _ in store.records())
+    assert ids == ['img1', 'img2', 'img3']
+
+
+def test_two_writers_do_not_overwrite(tmp_path):
+    first = ResultsStore(str(tmp_path), chunk_size=10)
+    second = ResultsStore(str(tmp_path), chunk_size=10)
+    first.append(_record(1), image_id='a')
+    second.append(_record(2), image_id='b')
+    second.flush()
+    first.flush()
+
+    columns = ResultsStore(str(tmp_path)).columns(['mtf/mtf_50'])
+    assert sorted(columns['image_id']) == ['a', 'b']
+    assert sorted(columns['mtf/mtf_50']) == [1.0, 2.0]
+
+
+def test_results_format_rejects_unknown():
+    assert results_format('out.NPZ') == 'npz'
+    assert results_format('out.json') == 'json'
+    assert results_format('out.txt', 'json') == 'json'
+    with pytest.raises(ValueError):
+        results_format('out.txt')
+    with pytest.raises(ValueError):
+        results_format('out')
+    with pytest.raises(ValueError):
+        results_format('out.npz', 'csv')
+
+
+def test_save_results_unknown_extension_writes_nothing(tmp_path):
+    from VKR2 import ImageQualityAnalyzer
+    analyzer = ImageQualityAnalyzer()
+    analyzer.results = {'mtf': {'mtf_50': 0.25, 'frequencies': np.linspace(0, 0.5, 5)}}
+    target = tmp_path / 'results.csv'
+    with pytest.raises(ValueError):
+        analyzer.save_results(str(target))
+    assert not target.exists()
+    analyzer.save_results(str(tmp_path / 'results.npz'))
+    assert (tmp_path / 'results.npz').exists()
+
+
+def test_npz_round_trip_keeps_scalar_types():
+    results = {
+        'roi': {'masked': True, 'pixels': 120, 'x': np.int64(4)},
+        'mtf': {'mtf_50': 0.25, 'valid': np.bool_(False)},
+        'meta': {'name': 'кадр', 'range': (0, 255), 'curve': np.arange(3.0)}
+    }
+    loaded = loads_npz(dumps_npz(results))
+    assert loaded['roi']['masked'] is True
+    assert loaded['mtf']['valid'] is False
+    assert type(loaded['roi']['pixels']) is int and loaded['roi']['x'] == 4
+    assert loaded['mtf']['mtf_50'] == 0.25
+    assert loaded['meta']['name'] == 'кадр'
+    assert loaded['meta']['range'] == (0, 255)
+    np.testing.assert_array_equal(loaded['meta']['curve'], np.arange(3.0))
+
+
+def test_artifact_store_float16_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    spectrum = rng.uniform(0, 100, (600, 1024))
+    spectrum[0, 0] = 1e6  # больше максимума float16
+    noise = rng.normal(0, 4, (40, 64))
+    focus = {'tenengrad': rng.uniform(0, 1e6, (3, 4))}
+    histogram = np.arange(256, dtype=np.int64)
+    results = {
+        'power_spectrum': {'magnitude_spectrum': spectrum, 'mean': 1.0},
+        'noise': {'noise_image': noise},
+        'sharpness': {'focus_map': focus, 'gradient_histogram': histogram}
+    }
+    store = ArtifactStore(tmp_path, max_side=512)
+    saved = store.save('кадр 1', results)
+
+    assert 'кадр 1' in store and 'кадр 2' not in store
+    assert sorted(saved) == sorted(store.names('кадр 1')) == sorted([
+        'power_spectrum/magnitude_spectrum', 'noise/noise_image',
+        'sharpness/focus_map/tenengrad', 'sharpness/gradient_histogram'])
+
+    reduced = store.load('кадр 1', 'power_spectrum/magnitude_spectrum')
+    assert reduced.dtype == np.float16 and reduced.shape == (300, 512)
+    assert store.original_shape('кадр 1', 'power_spectrum/magnitude_spectrum') == (600, 1024)
+    # Выброс насыщается на максимуме float16, а не превращается в inf
+    assert np.all(np.isfinite(reduced)) and reduced[0, 0] == np.finfo(np.float16).max
+    reference = cv2.resize(spectrum.astype(np.float32), (512, 300), interpolation=cv2.INTER_AREA)
+    np.testing.assert_allclose(reduced.astype(np.float32)[1:, 1:], reference[1:, 1:], rtol=1e-3)
+
+    # Небольшие карты не уменьшаются, только приводятся к float16
+    small = store.load('кадр 1', 'noise/noise_image')
+    assert small.dtype == np.float16
+    np.testing.assert_allclose(small, noise, rtol=1e-3, atol=1e-3)
+
+    # Карты фокуса и гистограмма хранятся без изменений
+    np.testing.assert_array_equal(store.load('кадр 1', 'sharpness/focus_map/tenengrad'), focus['tenengrad'])
+    np.testing.assert_array_equal(store.load('кадр 1', 'sharpness/gradient_histogram'), histogram)
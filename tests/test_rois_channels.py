@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import pytest
+
+from analysis_events import EventSink
+
+from synthetic_targets import SyntheticTargetRenderer
+import VKR2
+
+
+FULL_FRAME_SECTIONS = ('mtf', 'sharpness', 'noise', 'contrast', 'timings')
+
+
+def _analyzer():
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(SyntheticTargetRenderer(seed=0).slanted_edge((64, 80)))
+    analyzer.perform_full_analysis()
+    return analyzer
+
+
+def test_rois_drop_previous_full_frame_sections():
+    analyzer = _analyzer()
+    results = analyzer.perform_full_analysis(rois={'center': (16, 48, 20, 60)})
+    assert 'center' in results['rois']
+    assert not any(section in results for section in FULL_FRAME_SECTIONS)
+
+
+def test_channels_drop_previous_full_frame_sections():
+    analyzer = _analyzer()
+    analyzer.load_array(np.dstack([analyzer.image] * 3))
+    results = analyzer.perform_full_analysis(channels='rgb')
+    assert set(results['channels']) == {'R', 'G', 'B'}
+    assert not any(section in results for section in FULL_FRAME_SECTIONS)
+
+
+def test_full_frame_kept_on_request():
+    analyzer = _analyzer()
+    results = analyzer.perform_full_analysis(rois={'center': (16, 48, 20, 60)}, full_frame=True)
+    assert 'center' in results['rois']
+    assert results['mtf']['mtf_50'] is not None
+
+
+class _RecordingSink(EventSink):
+    def __init__(self):
+        self.events = []
+
+    def analysis_started(self, total_stages):
+        self.events.append(('started', total_stages))
+
+    def analysis_finished(self, results):
+        self.events.append(('finished',))
+
+    def stage_started(self, stage, description, index, total):
+        self.events.append(('stage', stage, index, total))
+
+
+def test_plain_run_drops_previous_mode_sections():
+    analyzer = _analyzer()
+    analyzer.perform_full_analysis(rois={'center': (16, 48, 20, 60)})
+    analyzer.results['chart'] = {'detections': 1}
+    results = analyzer.perform_full_analysis()
+    assert not any(section in results for section in VKR2.MODE_SECTIONS)
+    assert results['mtf']['mtf_50'] is not None
+
+
+def test_full_frame_with_rois_emits_one_started_finished_pair():
+    analyzer = _analyzer()
+    sink = _RecordingSink()
+    analyzer.events = sink
+    analyzer.perform_full_analysis(rois={'a': (16, 48, 20, 60), 'b': (0, 0, 40, 32)}, full_frame=True)
+
+    assert analyzer.events is sink
+    started = [event for event in sink.events if event[0] == 'started']
+    finished = [event for event in sink.events if event[0] == 'finished']
+    stages = [event for event in sink.events if event[0] == 'stage']
+    total = started[0][1]
+    assert len(started) == 1 and len(finished) == 1
+    assert sink.events[0][0] == 'started' and sink.events[-1][0] == 'finished'
+    assert [index for _, _, index, _ in stages] == list(range(total))
+    assert all(stage_total == total for _, _, _, stage_total in stages)
+    assert stages[-1][1] == 'roi:b'
+
+
+def test_noise_and_contrast_fallback_use_only_masked_pixels():
+    analyzer = VKR2.ImageQualityAnalyzer()
+    image = np.full((64, 80), 20, dtype=np.uint8)
+    image[:, 40:] = 200
+    image[::2, 40:] = 230
+    analyzer.load_array(image)
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:, :40] = True
+    analyzer.roi_mask = mask
+
+    noise = analyzer.calculate_noise_parameters()
+    assert noise['noise_mean'] == np.mean(noise['noise_image'][mask])
+    assert noise['noise_mean'] == 0.0
+
+    def broken():
+        raise RuntimeError("сбой")
+    analyzer.get_local_stats = broken
+    contrast = analyzer.calculate_contrast_parameters()
+    assert contrast['intensity_range'] == (20, 20)
+    assert contrast['mean_intensity'] == 20.0
+    assert contrast['rms_contrast'] == 0.0
+
+
+@pytest.mark.parametrize('pattern', ['RGGB', 'BGGR', 'GRBG', 'GBRG'])
+def test_bayer_plane_offsets(pattern):
+    # Код пикселя - его положение в ячейке 2x2: 10 * строка + столбец
+    rows, cols = np.mgrid[0:16, 0:24]
+    mosaic = (10 * (rows % 2) + cols % 2).astype(np.uint8)
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(mosaic)
+
+    # Положения по строке мозаики: Gr - зеленый в строке красного, Gb - в строке синего
+    cells = {pattern[0:2]: 0, pattern[2:4]: 1}
+    red_row = next(row for pair, row in cells.items() if 'R' in pair)
+    blue_row = 1 - red_row
+    expected = {
+        'R': (red_row, pattern[2 * red_row:2 * red_row + 2].index('R')),
+        'Gr': (red_row, pattern[2 * red_row:2 * red_row + 2].index('G')),
+        'B': (blue_row, pattern[2 * blue_row:2 * blue_row + 2].index('B')),
+        'Gb': (blue_row, pattern[2 * blue_row:2 * blue_row + 2].index('G')),
+    }
+
+    planes = analyzer.channel_planes('bayer', pattern)
+    assert list(planes) == ['R', 'Gr', 'Gb', 'B']
+    for name, plane in planes.items():
+        row, col = expected[name]
+        assert plane.shape == (8, 12)
+        assert np.all(plane == 10 * row + col), name
+        assert np.shares_memory(plane, mosaic)
+
+
+def _texture(shape=(256, 320), seed=0):
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.uniform(0, 255, shape), (0, 0), 1.0)
+
+
+def test_chromatic_aberration_recovers_roll_shift():
+    texture = _texture()
+    analyzer = VKR2.ImageQualityAnalyzer()
+    bgr = np.dstack([np.roll(texture, (2, -1), axis=(0, 1)), texture,
+                     np.roll(texture, (-1, 3), axis=(0, 1))]).astype(np.uint8)
+    analyzer.load_array(bgr)
+
+    aberration = analyzer._chromatic_aberration(analyzer.channel_planes('rgb'), 'G')
+    assert aberration['reference'] == 'G'
+    assert (aberration['R']['shift_x'], aberration['R']['shift_y']) == pytest.approx((3, -1), abs=0.15)
+    assert (aberration['B']['shift_x'], aberration['B']['shift_y']) == pytest.approx((-1, 2), abs=0.15)
+    # Чистый сдвиг без увеличения
+    for name in ('R', 'B'):
+        assert abs(aberration[name]['lateral_ca_px']) < 0.2
+        assert aberration[name]['tiles'] == 16
+
+
+def test_chromatic_aberration_bayer_phases_subtracted():
+    # Одинаковые плоскости мозаики: весь сдвиг - взаимное положение в ячейке 2x2
+    plane = _texture(shape=(256, 320))
+    mosaic = np.empty((512, 640), dtype=np.uint8)
+    for row in (0, 1):
+        for col in (0, 1):
+            mosaic[row::2, col::2] = plane
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(mosaic)
+    phases = VKR2.BAYER_PATTERNS['RGGB']
+    aberration = analyzer._chromatic_aberration(analyzer.channel_planes('bayer', 'RGGB'), 'Gr',
+                                                scale=2.0, phases=phases)
+    # Gr в (0, 1): R в (0, 0) левее на пиксель, B в (1, 1) ниже на пиксель
+    assert (aberration['R']['shift_x'], aberration['R']['shift_y']) == pytest.approx((-1, 0), abs=0.05)
+    assert (aberration['B']['shift_x'], aberration['B']['shift_y']) == pytest.approx((0, 1), abs=0.05)
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+from results_store import ArtifactStore, flatten_results, load_npz
+from sharpness import SharpnessEngine
+from synthetic_targets import SyntheticTargetRenderer
+import VKR2
+
+
+def _textured(shape=(96, 128), seed=0):
+    rng = np.random.default_rng(seed)
+    image = cv2.resize(rng.integers(0, 256, (shape[0] // 4, shape[1] // 4)).astype(np.uint8),
+                       (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC)
+    return image
+
+
+def test_sharp_frame_scores_higher_than_blurred():
+    engine = SharpnessEngine()
+    sharp = _textured()
+    blurred = cv2.GaussianBlur(sharp, (0, 0), 2.0)
+    sharp_metrics = engine.measure(sharp)
+    blurred_metrics = engine.measure(blurred)
+    for name in ('tenengrad', 'brenner', 'laplacian_energy', 'laplacian_variance', 'gradient_p90'):
+        assert sharp_metrics[name] > blurred_metrics[name], name
+    for name in ('tenengrad', 'brenner', 'laplacian_energy', 'laplacian_variance'):
+        assert engine.score(sharp, name) > engine.score(blurred, name), name
+
+
+def test_focus_map_matches_direct_computation():
+    image = _textured()
+    engine = SharpnessEngine(tiles=(3, 4))
+    metrics = engine.measure(image)
+    focus = metrics['focus_map']
+
+    grad_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
+    laplacian = cv2.Laplacian(image, cv2.CV_64F)
+    pixels = image.astype(np.float64)
+    rows, cols = focus['tile_rows'], focus['tile_cols']
+    assert focus['tenengrad'].shape == (3, 4)
+    for i in range(3):
+        for j in range(4):
+            r, c = slice(rows[i], rows[i + 1]), slice(cols[j], cols[j + 1])
+            tenengrad = np.mean(grad_x[r, c] ** 2 + grad_y[r, c] ** 2)
+            assert focus['tenengrad'][i, j] == pytest.approx(tenengrad, rel=1e-5)
+            assert focus['laplacian_variance'][i, j] == pytest.approx(np.var(laplacian[r, c]), rel=1e-5)
+            stop = min(c.stop, image.shape[1] - 2)
+            brenner = np.mean((pixels[r, c.start + 2:stop + 2] - pixels[r, c.start:stop]) ** 2)
+            assert focus['brenner'][i, j] == pytest.approx(brenner, rel=1e-5)
+
+    assert metrics['tenengrad'] == pytest.approx(np.mean(grad_x ** 2 + grad_y ** 2), rel=1e-5)
+    assert metrics['laplacian_variance'] == pytest.approx(np.var(laplacian), rel=1e-5)
+    assert metrics['brenner'] == pytest.approx(np.mean((pixels[:, 2:] - pixels[:, :-2]) ** 2), rel=1e-5)
+    assert metrics['focus_uniformity'] == pytest.approx(focus['tenengrad'].min() / focus['tenengrad'].max())
+
+
+def test_masked_metrics_use_only_mask_pixels():
+    image = _textured()
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[10:60, 20:90] = True
+    metrics = SharpnessEngine().measure(image, mask=mask)
+    grad_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
+    assert metrics['tenengrad'] == pytest.approx(np.mean((grad_x ** 2 + grad_y ** 2)[mask]), rel=1e-5)
+
+
+def test_histogram_and_focus_maps_only_in_artifacts(tmp_path):
+    analyzer = VKR2.ImageQualityAnalyzer()
+    analyzer.load_array(SyntheticTargetRenderer(seed=0).slanted_edge((64, 80)))
+    results = analyzer.perform_full_analysis()
+    assert 'focus_map' in results['sharpness']
+
+    scalars, arrays = flatten_results(results)
+    assert not any('focus_map' in name or 'gradient_histogram' in name for name in list(scalars) + list(arrays))
+
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+    analyzer.save_results(str(tmp_path / 'frame.npz'), artifact_store=store, image_id='frame')
+    analyzer.save_results(str(tmp_path / 'frame.json'))
+    saved = load_npz(str(tmp_path / 'frame.npz'))
+    assert 'focus_map' not in saved['sharpness'] and 'gradient_histogram' not in saved['sharpness']
+    assert 'focus_map' not in (tmp_path / 'frame.json').read_text(encoding='utf-8')
+
+    np.testing.assert_array_equal(store.load('frame', 'sharpness/gradient_histogram'),
+                                  results['sharpness']['gradient_histogram'])
+    np.testing.assert_array_equal(store.load('frame', 'sharpness/focus_map/tenengrad'),
+                                  results['sharpness']['focus_map']['tenengrad'])
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from spectrum import SpectrumService
+
+# Размеры, не являющиеся быстрыми для БПФ: путь с дополнением
+SHAPES = [(97, 131), (101, 90), (64, 80)]
+
+
+def _image(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    image = 120 + 60 * np.sin(0.9 * x + 0.3 * y) + 20 * rng.standard_normal(shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _padded(image, padded_shape):
+    """Дополнение средним, как в SpectrumService.rfft2"""
+    data = np.full(padded_shape, image.mean(), dtype=np.float64)
+    data[:image.shape[0], :image.shape[1]] = image
+    return data
+
+
+def _full_spectrum(image, plan):
+    spectrum = np.fft.fft2(_padded(image, plan['padded_shape']))
+    freq_y = np.fft.fftfreq(spectrum.shape[0])[:, None]
+    freq_x = np.fft.fftfreq(spectrum.shape[1])[None, :]
+    return spectrum, freq_y, freq_x
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_rfft2_matches_fft2(shape):
+    service = SpectrumService()
+    image = _image(shape)
+    spectrum, plan = service.rfft2(image)
+    full, _, _ = _full_spectrum(image, plan)
+    assert plan['padded_shape'][0] >= shape[0] and plan['padded_shape'][1] >= shape[1]
+    np.testing.assert_allclose(spectrum, full[:, :spectrum.shape[1]], rtol=1e-4, atol=1e-5 * np.abs(full).max())
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_corner_aliasing_matches_full_spectrum(shape):
+    service = SpectrumService()
+    image = _image(shape)
+    spectrum, plan = service.rfft2(image)
+    full, freq_y, freq_x = _full_spectrum(image, plan)
+
+    corners = (np.abs(freq_y) >= 0.25) & (np.abs(freq_x) >= 0.25)
+    expected = np.mean(np.log1p(np.abs(full))[corners])
+    assert service.corner_aliasing(spectrum, plan) == pytest.approx(expected, rel=1e-3)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_radial_power_spectrum_matches_full_spectrum(shape):
+    num_radial_bins = 16
+    service = SpectrumService()
+    image = _image(shape)
+    spectrum, plan = service.rfft2(image)
+    full, freq_y, freq_x = _full_spectrum(image, plan)
+
+    power = np.abs(full) ** 2 / full.size ** 2
+    radius = np.sqrt(freq_y ** 2 + freq_x ** 2) / 0.5
+    radial_bin = np.minimum((radius * num_radial_bins).astype(int), num_radial_bins)
+    radial_bin[0, 0] = -1
+    sums = np.array([power[radial_bin == b].sum() for b in range(num_radial_bins + 1)])
+    means = np.array([power[radial_bin == b].mean() for b in range(num_radial_bins + 1)])
+
+    result = service.radial_power_spectrum(spectrum, plan, num_radial_bins=num_radial_bins)
+    np.testing.assert_allclose(result['radial_power_sum'], sums[:-1], rtol=1e-3)
+    np.testing.assert_allclose(result['radial_power'], means[:-1], rtol=1e-3)
+    assert result['corner_power_sum'] == pytest.approx(sums[-1], rel=1e-3)
+    assert result['dc_power'] == pytest.approx(power[0, 0], rel=1e-4)
+    # Теорема Парсеваля: сумма по всем бинам - средний квадрат сигнала
+    total = result['radial_power_sum'].sum() + result['corner_power_sum'] + result['dc_power']
+    assert total == pytest.approx(np.mean(_padded(image, plan['padded_shape']) ** 2), rel=1e-3)
+
+
+def test_plan_is_cached_per_shape():
+    service = SpectrumService(cache_size=2)
+    first = service.plan((97, 131))
+    assert service.plan((97, 131)) is first
+    service.plan((10, 12))
+    service.plan((11, 13))
+    assert service.plan((97, 131)) is not first